@@ -1,50 +1,281 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+import ijson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.response_cache import PendingEntry, ResponseCache, content_hash
+from api.token_manager import get_token_manager
+from common.metrics import API_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Постоянный токен (например, 'Bearer ...'); если не задан, токен выдаёт общий TokenManager
+DEFAULT_TOKEN = os.getenv('MOYGRAFIK_TOKEN')
+# Адрес API (переопределяется, например, для локального benchmarks.fake_moygrafik)
+API_URL = os.getenv('MOYGRAFIK_API_URL', 'https://api.moygrafik.ru').rstrip('/')
+BASE_URL = f'{API_URL}/api/external/v1'
+BASE_URL_V1_1 = f'{API_URL}/api/external/v1.1'
+
+# Таймауты запросов: (подключение, чтение) в секундах
+DEFAULT_TIMEOUT = (float(os.getenv('MOYGRAFIK_CONNECT_TIMEOUT', 5)), float(os.getenv('MOYGRAFIK_READ_TIMEOUT', 120)))
+# Повторы с экспоненциальной задержкой (0.5, 1, 2, 4, ... с) при 429 и 5xx
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Размер пула keep-alive соединений
+POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+_response_cache = None
+
+
+def create_session(pool_size=POOL_SIZE, max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """Создаёт requests.Session с пулом соединений и повторами при 429/5xx."""
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Возвращает общую для всех клиентов сессию (создаётся при первом обращении)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get_response_cache():
+    """Общий кэш ответов на диске для медленно меняющихся справочников (создаётся при первом обращении)."""
+    global _response_cache
+    if _response_cache is None:
+        with _session_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
+
+
+class ApiMetrics:
+    """Потокобезопасная статистика задержек запросов к API по эндпоинтам."""
 
-class MoyGrafikAPI:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, endpoint, seconds, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if error:
+                stats['errors'] += 1
+        API_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, result='error' if error else 'ok')
+
+    def snapshot(self):
+        """Копия статистики: {эндпоинт: {count, errors, total, max, avg}}."""
+        with self._lock:
+            return {
+                endpoint: dict(stats, avg=stats['total'] / stats['count'] if stats['count'] else 0.0)
+                for endpoint, stats in self._stats.items()
+            }
+
+    def log_summary(self, log=logger.info):
+        """Выводит сводку по эндпоинтам (по умолчанию в лог, можно передать print)."""
+        for endpoint, stats in sorted(self.snapshot().items()):
+            log(f"API {endpoint}: запросов {stats['count']}, ошибок {stats['errors']}, "
+                        f"среднее {stats['avg']:.3f} с, максимум {stats['max']:.3f} с, всего {stats['total']:.2f} с")
+
+
+# Общая статистика для всех клиентов процесса
+api_metrics = ApiMetrics()
 
-        self.token = 'Bearer NmY3OTIxMTE3N2M2ZDE2NTVjN2I5NmQwMTBmNjlkZDcxNTE3MjQwODdlYzI5NmJjMWNkZWUzMjVhY2FmODc0Yw'
-        self.base_url = 'https://api.moygrafik.ru/api/external/v1'
-        self.base_url_v1_1 = 'https://api.moygrafik.ru/api/external/v1.1'
-        self.headers = {'Authorization': self.token}
+
+def endpoint_name(url):
+    """Имя эндпоинта для статистики: путь URL с числовыми идентификаторами, заменёнными на {id}."""
+    return re.sub(r'/\d+(?=/|$)', '/{id}', urlparse(url).path)
+
+
+def iter_json_items(fileobj, pattern):
+    """
+    Потоково разбирает JSON и выдаёт значения, путь к которым (в нотации ijson, например
+    'placements.123.presences.item') целиком соответствует регулярному выражению pattern.
+    В памяти одновременно находится только одно такое значение.
+    """
+    pattern = re.compile(pattern)
+    builder = None
+    depth = 0
+    for prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == 0:
+                    yield builder.value
+                    builder = None
+        elif event in ('start_map', 'start_array') and pattern.fullmatch(prefix):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+        elif event in ('null', 'boolean', 'integer', 'double', 'number', 'string') and pattern.fullmatch(prefix):
+            yield value
+
+
+class MoyGrafikAPI:
+    def __init__(self, token=None, timeout=DEFAULT_TIMEOUT, session=None, token_manager=None, response_cache=None,
+                 api_url=None):
+        self.token = token or DEFAULT_TOKEN
+        self.token_manager = None if self.token else (token_manager or get_token_manager())
+        self.base_url = f'{api_url.rstrip("/")}/api/external/v1' if api_url else BASE_URL
+        self.base_url_v1_1 = f'{api_url.rstrip("/")}/api/external/v1.1' if api_url else BASE_URL_V1_1
+        self.timeout = timeout
+        self.session = session or get_session()
+        self.metrics = api_metrics
+        self._response_cache = response_cache
+
+    @property
+    def headers(self):
+        if self.token_manager is None:
+            return {'Authorization': self.token}
+        return {'Authorization': self.token_manager.authorization()}
+
+    @property
+    def response_cache(self):
+        if self._response_cache is None:
+            self._response_cache = get_response_cache()
+        return self._response_cache
+
+    def request(self, url, params=None, stream=False, extra_headers=None):
+        """
+        GET-запрос через общую сессию с таймаутом; повторы при 429/5xx выполняет адаптер.
+        При 401 токен от TokenManager обновляется и запрос повторяется один раз.
+        """
+        endpoint = endpoint_name(url)
+        started_at = time.monotonic()
+        try:
+            headers = dict(self.headers, **(extra_headers or {}))
+            response = self.session.get(url, headers=headers, params=params, timeout=self.timeout, stream=stream)
+            if response.status_code == 401 and self.token_manager is not None:
+                logger.warning(f"Токен отклонён ({endpoint}), обновляем и повторяем запрос")
+                self.token_manager.invalidate(headers['Authorization'].split(' ', 1)[-1])
+                response.close()
+                response = self.session.get(url, headers=dict(self.headers, **(extra_headers or {})), params=params,
+                                            timeout=self.timeout, stream=stream)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.metrics.observe(endpoint, time.monotonic() - started_at, error=True)
+            logger.error(f"Ошибка запроса к {endpoint}: {e}")
+            raise
+        self.metrics.observe(endpoint, time.monotonic() - started_at)
+        return response
+
+    def fetch(self, url, params=None, cached=False, if_changed=False, pending=False):
+        """
+        JSON-ответ API. При cached=True ответ сохраняется в кэше на диске, а повторный запрос
+        отправляется с If-None-Match / If-Modified-Since: на 304 тело берётся из кэша.
+        Если сервер не поддерживает условные запросы, неизменность определяется по хэшу тела.
+        При if_changed=True для неизменившегося ответа возвращается None (разбор и загрузку можно пропустить).
+        При pending=True новый ответ в кэш не записывается: возвращается пара (данные, PendingEntry или None),
+        и вызывающий фиксирует запись через commit() только после того, как сохранил данные.
+        """
+        if not cached:
+            return self.request(url, params=params).json()
+
+        cache = self.response_cache
+        entry = cache.get(url, params)
+        response = self.request(url, params=params, extra_headers=cache.conditional_headers(entry))
+        endpoint = endpoint_name(url)
+        if response.status_code == 304 and entry is None:
+            # Тела для 304 нет в кэше (запись удалена или повреждена): запрашиваем ответ целиком
+            logger.warning("%s: 304 без записи в кэше, повторяем запрос без условных заголовков", endpoint)
+            response = self.request(url, params=params, extra_headers={'Cache-Control': 'no-cache'})
+            if response.status_code == 304:
+                raise requests.HTTPError(f"{endpoint}: 304 на безусловный запрос", response=response)
+        pending_entry = None
+        if response.status_code == 304:
+            logger.info("%s: не изменился (304), используем кэш", endpoint)
+            unchanged, body = True, entry['body']
+        else:
+            body = response.content
+            unchanged = entry is not None and content_hash(body) == entry['hash']
+            pending_entry = PendingEntry(cache, url, params, body, response.headers.get('ETag'),
+                                         response.headers.get('Last-Modified'))
+            if unchanged:
+                # Тело уже сохранено вызывающим в прошлый раз: обновляются только валидаторы сервера
+                logger.info("%s: ответ совпадает с кэшем по хэшу", endpoint)
+                pending_entry.commit()
+                pending_entry = None
+        data = None if unchanged and if_changed else json.loads(body)
+        if pending:
+            return data, pending_entry
+        if pending_entry is not None:
+            pending_entry.commit()
+        return data
+
+    def stream_items(self, url, pattern, params=None):
+        """
+        Потоковый разбор ответа: элементы по пути pattern (см. iter_json_items) выдаются по мере
+        чтения тела, весь ответ в память не загружается. Время в статистике — до получения заголовков.
+        """
+        response = self.request(url, params=params, stream=True)
+        with response:
+            response.raw.decode_content = True  # Распаковка gzip/deflate на лету
+            yield from iter_json_items(response.raw, pattern)
 
     def get_employees(self, company_id):
         # Получить список сотрудников
         url = f"{self.base_url}/companies/{company_id}/employees"
-        response = requests.get(url, headers=self.headers)
-        # Проверить на успешность запроса
-        response.raise_for_status()
-        return response.json()
+        return self.fetch(url)
 
-    def get_placements(self, company_id):
-        # Получить информацию о размещениях
+    def get_placements(self, company_id, if_changed=False, pending=False):
+        # Получить информацию о размещениях (справочник меняется редко, ответ кэшируется)
         url = f"{self.base_url}/companies/{company_id}/placements"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self.fetch(url, cached=True, if_changed=if_changed, pending=pending)
 
-    def get_subdivisions(self, company_id):
-        # Получить информацию о подразделениях
+    def get_subdivisions(self, company_id, if_changed=False, pending=False):
+        # Получить информацию о подразделениях (справочник меняется редко, ответ кэшируется)
         url = f"{self.base_url}/companies/{company_id}/subdivisions"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self.fetch(url, cached=True, if_changed=if_changed, pending=pending)
 
-    def get_positions(self, company_id):
-        # Получить информацию о позициях
+    def get_positions(self, company_id, if_changed=False, pending=False):
+        # Получить информацию о позициях (справочник меняется редко, ответ кэшируется)
         url = f"{self.base_url}/companies/{company_id}/positions"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self.fetch(url, cached=True, if_changed=if_changed, pending=pending)
 
     def test_identification(self, company_id, mac_address):
         # Тест идентификации по MAC-адресу
-        url = f"{self.base_url_v1_1}/identification/companies/{company_id}/test?mac={mac_address}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        url = f"{self.base_url_v1_1}/identification/companies/{company_id}/test"
+        return self.fetch(url, params={'mac': mac_address})
 
-    def get_presence_report(self, company_id, start_date, end_date, positions):
+    def get_presence_report(self, company_id, start_date, end_date, positions=None):
         # Получить отчет о присутствии
         url = f"{self.base_url}/reports/presence/{company_id}"
         params = {
@@ -52,11 +283,23 @@ class MoyGrafikAPI:
             'end_date': end_date,
             'positions': positions
         }
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self.fetch(url, params=params)
+
+    def iter_presences(self, company_id, start_date, end_date, positions=None):
+        """
+        Отчёт о присутствии без загрузки всего ответа в память: по одной записи
+        {'employee': ..., 'time_data': [...]} из placements -> presences.
+        """
+        url = f"{self.base_url}/reports/presence/{company_id}"
+        params = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'positions': positions
+        }
+        return self.stream_items(url, r'placements\.[^.]+\.presences\.item', params=params)
 
 # Пример использования
-api = MoyGrafikAPI()
-employees = api.get_employees(company_id=1525)
-#print(employees)
\ No newline at end of file
+if __name__ == '__main__':
+    api = MoyGrafikAPI()
+    employees = api.get_employees(company_id=1525)
+    #print(employees)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import os
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# Каталог кэша ответов API (переопределяется переменной MOYGRAFIK_CACHE_DIR)
+RESPONSE_CACHE_DIR = os.getenv(
+    'MOYGRAFIK_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'response_cache')
+)
+
+
+def cache_key(url, params=None):
+    """Ключ кэша: SHA-256 от URL и отсортированных параметров (None-параметры не отправляются и не учитываются)."""
+    query = urlencode(sorted((key, value) for key, value in (params or {}).items() if value is not None))
+    return hashlib.sha256(f"{url}?{query}".encode('utf-8')).hexdigest()
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class ResponseCache:
+    """
+    Кэш ответов API на диске: для каждого эндпоинта с параметрами хранятся тело ответа,
+    его хэш и валидаторы сервера (ETag, Last-Modified) для условных запросов.
+    """
+
+    def __init__(self, cache_dir=RESPONSE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, url, params):
+        key = cache_key(url, params)
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.body")
+
+    def get(self, url, params=None):
+        """Запись кэша {'etag', 'last_modified', 'hash', 'body'} или None."""
+        meta_path, body_path = self._paths(url, params)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        if content_hash(entry['body']) != entry.get('hash'):
+            logger.warning(f"Повреждена запись кэша для {url}, игнорируем")
+            return None
+        return entry
+
+    def conditional_headers(self, entry):
+        """Заголовки If-None-Match / If-Modified-Since для записи кэша."""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, params, body, etag=None, last_modified=None):
+        """Сохраняет ответ; тело записывается раньше метаданных, чтобы запись не ссылалась на чужое тело."""
+        meta_path, body_path = self._paths(url, params)
+        for path, mode, data in (
+            (body_path, 'wb', body),
+            (meta_path, 'w', json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified,
+                                         'hash': content_hash(body)})),
+        ):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+
+
+class PendingEntry:
+    """Полученный, но ещё не записанный в кэш ответ: commit() вызывается, когда его данные сохранены."""
+
+    def __init__(self, cache, url, params, body, etag=None, last_modified=None):
+        self.cache = cache
+        self.url = url
+        self.params = params
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def commit(self):
+        self.cache.put(self.url, self.params, self.body, self.etag, self.last_modified)
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = os.getenv('MOYGRAFIK_API_URL', 'https://api.moygrafik.ru').rstrip('/') + '/oauth/v2/token'
+
+# Кэш токена между запусками: access_token, refresh_token и момент истечения (unix time)
+TOKEN_CACHE_FILE = os.getenv(
+    'MOYGRAFIK_TOKEN_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'token_cache.json')
+)
+# Токен обновляется заранее: за REFRESH_MARGIN секунд до истечения, но не позже 90% срока жизни
+REFRESH_MARGIN = 300
+REFRESH_FRACTION = 0.9
+TOKEN_TIMEOUT = (5, 30)
+
+
+class TokenError(Exception):
+    """Не удалось получить токен доступа."""
+
+
+class TokenManager:
+    """
+    Токен доступа OAuth с учётом срока жизни (expires_in).
+    Токен обновляется заранее, через refresh_token, если он есть, иначе по паролю.
+    Одновременные обновления из разных потоков сводятся к одному запросу.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, username=None, password=None,
+                 token_url=TOKEN_URL, cache_file=TOKEN_CACHE_FILE, session=None):
+        # Учётные данные OAuth берутся только из аргументов или переменных окружения (.env)
+        load_dotenv()
+        self.client_id = client_id or os.getenv('MOYGRAFIK_CLIENT_ID')
+        self.client_secret = client_secret or os.getenv('MOYGRAFIK_CLIENT_SECRET')
+        self.username = username or os.getenv('MOYGRAFIK_USERNAME')
+        self.password = password or os.getenv('MOYGRAFIK_PASSWORD')
+        missing = [name for name, value in (('MOYGRAFIK_CLIENT_ID', self.client_id),
+                                            ('MOYGRAFIK_CLIENT_SECRET', self.client_secret),
+                                            ('MOYGRAFIK_USERNAME', self.username),
+                                            ('MOYGRAFIK_PASSWORD', self.password)) if not value]
+        if missing:
+            raise TokenError(f"Не заданы учётные данные API МойГрафик: {', '.join(missing)}. "
+                             f"Укажите их в переменных окружения или в .env (либо задайте MOYGRAFIK_TOKEN)")
+        self.token_url = token_url
+        self.cache_file = cache_file
+        self.session = session or requests
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._refresh_token = None
+        self._refresh_at = 0.0
+        self._expires_at = 0.0
+        self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._access_token = cached['access_token']
+            self._refresh_token = cached.get('refresh_token')
+            self._refresh_at = cached['refresh_at']
+            self._expires_at = cached['expires_at']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Не удалось прочитать кэш токена {self.cache_file}: {e}")
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'access_token': self._access_token,
+                    'refresh_token': self._refresh_token,
+                    'refresh_at': self._refresh_at,
+                    'expires_at': self._expires_at,
+                }, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш токена {self.cache_file}: {e}")
+
+    def _is_fresh(self):
+        return self._access_token is not None and time.time() < self._refresh_at
+
+    def _request_token(self, data):
+        data = dict(data, client_id=self.client_id, client_secret=self.client_secret)
+        response = self.session.post(self.token_url, data=data, timeout=TOKEN_TIMEOUT)
+        if response.status_code != 200:
+            raise TokenError(f"Не удалось получить токен ({data['grant_type']}): "
+                             f"{response.status_code}, {response.text}")
+        return response.json()
+
+    def _refresh(self):
+        tokens = None
+        if self._refresh_token:
+            try:
+                tokens = self._request_token({'grant_type': 'refresh_token', 'refresh_token': self._refresh_token})
+            except (requests.RequestException, TokenError) as e:
+                logger.warning(f"Обновление по refresh_token не удалось, запрашиваем токен по паролю: {e}")
+        if tokens is None:
+            tokens = self._request_token({'grant_type': 'password', 'username': self.username,
+                                          'password': self.password})
+
+        now = time.time()
+        expires_in = float(tokens.get('expires_in') or 3600)
+        self._access_token = tokens['access_token']
+        # Сервер может не выдать новый refresh_token — тогда остаётся прежний
+        self._refresh_token = tokens.get('refresh_token') or self._refresh_token
+        self._expires_at = now + expires_in
+        self._refresh_at = now + max(min(expires_in - REFRESH_MARGIN, expires_in * REFRESH_FRACTION), 0)
+        self._save_cache()
+        logger.info(f"Получен новый токен доступа, действует {expires_in:.0f} с")
+
+    def get_access_token(self):
+        """Действующий токен доступа (без префикса Bearer); при необходимости обновляется."""
+        if self._is_fresh():
+            return self._access_token
+        with self._lock:
+            # Пока ждали блокировку, токен мог обновить другой поток
+            if not self._is_fresh():
+                self._refresh()
+            return self._access_token
+
+    def authorization(self):
+        """Значение заголовка Authorization."""
+        return f"Bearer {self.get_access_token()}"
+
+    def invalidate(self, access_token=None):
+        """
+        Помечает токен устаревшим (например, после ответа 401).
+        Если передан access_token, а токен уже обновлён другим потоком, ничего не делает.
+        """
+        with self._lock:
+            if access_token is None or access_token == self._access_token:
+                self._refresh_at = 0.0
+
+
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+
+def get_token_manager():
+    """Общий для всех клиентов API менеджер токена (создаётся при первом обращении)."""
+    global _token_manager
+    if _token_manager is None:
+        with _token_manager_lock:
+            if _token_manager is None:
+                _token_manager = TokenManager()
+    return _token_manager
@@ -0,0 +1,206 @@
+"""
+Нагрузочный тест обработчиков бота: задержка ответа (p50/p99) при одновременной работе многих пользователей.
+
+Приложение собирается через bot.main.build_application, но вместо Telegram используется
+FakeTelegramRequest: он отвечает на вызовы Bot API (getMe, sendMessage, answerCallbackQuery...)
+с заданной задержкой и записывает отправленные тексты. Каждый синтетический пользователь
+(employees/user_settings в базе DB_URL, как в benchmarks.scheduler_scale) проходит сценарий
+SCRIPT, в том числе диалог ConversationHandler установки отпуска. Обновления кладутся прямо
+в app.update_queue — так же, как их кладёт webhook-сервер или polling.
+
+Задержка обновления — от постановки в очередь до конца его обработки. Замер повторяется для
+каждого значения --concurrency (1 — последовательная обработка). Дополнительно проверяется,
+что обновления каждого пользователя обработаны по порядку и диалог завершился для всех.
+
+Запуск:
+    python -m benchmarks.bot_load --users 200 --concurrency 1,16,64
+    python -m benchmarks.bot_load --users 1000 --concurrency 16 --api-latency 0.05 --think 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.scheduler_scale import FIRST_TELEGRAM_ID, synthetic_rows, seed, cleanup, percentile
+from bot.logging_setup import setup_logging
+from bot.main import build_application
+from database.async_db import dispose_async_engine
+from database.db import create_schema, get_engine, employees, user_settings, presence_report, notifications
+
+BOT_ID = 123456
+FAKE_TOKEN = f"{BOT_ID}:BENCHMARK"
+# Сценарий пользователя: (тип обновления, текст или callback_data)
+SCRIPT = [
+    ('command', '/menu'),
+    ('callback', 'attendance_today'),
+    ('callback', 'set_vacation'),
+    ('text', '01-07-2030'),
+    ('text', '14-07-2030'),
+    ('callback', 'attendance_10_days'),
+]
+VACATION_CONFIRMATION = "🏖️ Период отпуска"  # Начало ответа на последний шаг диалога
+
+
+class FakeTelegramRequest(BaseRequest):
+    """HTTP-клиент Bot API без сети: успешные ответы с задержкой latency, тексты — в sent."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = {}  # chat_id -> [тексты]
+        self.calls = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        elif endpoint in ('sendMessage', 'editMessageText'):
+            chat_id = int(parameters['chat_id'])
+            self.sent.setdefault(chat_id, []).append(parameters.get('text', ''))
+            self._message_id += 1
+            result = {'message_id': self._message_id, 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': parameters.get('text', '')}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def make_update(update_id, telegram_id, kind, value):
+    """Словарь обновления Bot API от пользователя telegram_id."""
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': f'Пользователь{telegram_id}'}
+    chat = {'id': telegram_id, 'type': 'private'}
+    now = int(time.time())
+    if kind == 'callback':
+        message = {'message_id': 1, 'date': now, 'chat': chat, 'text': 'Меню',
+                   'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Benchmark'}}
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(telegram_id), 'data': value, 'message': message}}
+    message = {'message_id': update_id, 'date': now, 'chat': chat, 'from': user, 'text': value}
+    if kind == 'command':
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(value.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def run_level(concurrency, users, think, api_latency, timeout):
+    """Прогоняет SCRIPT для всех пользователей при заданном числе параллельных обновлений."""
+    request = FakeTelegramRequest(api_latency)
+    app = build_application(token=FAKE_TOKEN, concurrent_updates=concurrency, request=request)
+    # Задачи планировщика в замер не входят (их меряет benchmarks.scheduler_scale)
+    app.job_queue.scheduler.remove_all_jobs()
+
+    total = users * len(SCRIPT)
+    queued_at = {}
+    latencies = []
+    processed = {}  # telegram_id -> update_id в порядке обработки
+    finished = asyncio.Event()
+
+    async def mark_done(update, context):
+        latencies.append(time.perf_counter() - queued_at[update.update_id])
+        processed.setdefault(update.effective_user.id, []).append(update.update_id)
+        if len(latencies) == total:
+            finished.set()
+
+    # Отдельная группа: выполняется после основного обработчика обновления
+    app.add_handler(TypeHandler(Update, mark_done), group=100)
+
+    async def user_session(index):
+        telegram_id = FIRST_TELEGRAM_ID + index
+        for step, (kind, value) in enumerate(SCRIPT):
+            update_id = index * len(SCRIPT) + step + 1
+            update = Update.de_json(make_update(update_id, telegram_id, kind, value), app.bot)
+            queued_at[update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+            if think:
+                await asyncio.sleep(think)
+
+    await app.initialize()
+    await app.start()
+    started_at = time.perf_counter()
+    try:
+        await asyncio.gather(*(user_session(index) for index in range(users)))
+        await asyncio.wait_for(finished.wait(), timeout)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        await app.stop()
+        await app.shutdown()
+
+    out_of_order = sum(1 for update_ids in processed.values() if update_ids != sorted(update_ids))
+    unfinished = sum(1 for index in range(users)
+                     if not any(text.startswith(VACATION_CONFIRMATION)
+                                for text in request.sent.get(FIRST_TELEGRAM_ID + index, [])))
+    return {'latency': latencies, 'elapsed': elapsed, 'calls': request.calls,
+            'out_of_order': out_of_order, 'unfinished': unfinished}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков бота")
+    parser.add_argument('--users', type=int, default=200, help="Число одновременных пользователей")
+    parser.add_argument('--concurrency', default='1,16,64',
+                        help="Значения concurrent_updates через запятую (1 — последовательно)")
+    parser.add_argument('--think', type=float, default=0.0, help="Пауза пользователя между шагами сценария, с")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Задержка ответа Bot API, с")
+    parser.add_argument('--timeout', type=float, default=600, help="Предельное время одного прогона, с")
+    parser.add_argument('--db-url', help="База для замера (по умолчанию DB_URL)")
+    parser.add_argument('--log-level', default='WARNING', help="Уровень логов бота во время замера")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.db_url:
+        os.environ['DB_URL'] = args.db_url
+    setup_logging(log_file=None, level=args.log_level)
+    tables = (employees, user_settings, presence_report, notifications)
+    today = datetime.now().date()
+
+    create_schema()
+    rows = synthetic_rows(args.users, today, 8 * 60, 120, 0.5, args.seed)
+    with get_engine().begin() as connection:
+        cleanup(connection, tables)
+        seed(connection, tables[:3], rows)
+    print(f"Пользователей: {args.users}, шагов сценария: {len(SCRIPT)}, задержка Bot API: "
+          f"{args.api_latency * 1000:.0f} мс, пауза пользователя: {args.think * 1000:.0f} мс")
+
+    try:
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            # Сбрасываем настройки отпуска, чтобы каждый прогон начинался с одинаковых данных
+            with get_engine().begin() as connection:
+                connection.execute(user_settings.update().where(
+                    user_settings.c.telegram_id >= FIRST_TELEGRAM_ID).values(vacation_start=None, vacation_end=None))
+            stats = await run_level(concurrency, args.users, args.think, args.api_latency, args.timeout)
+            latency = stats['latency']
+            print(f"concurrent_updates={concurrency:4}  p50={statistics.median(latency) * 1000:8.1f} мс  "
+                  f"p99={percentile(latency, 0.99) * 1000:8.1f} мс  max={max(latency) * 1000:8.1f} мс  "
+                  f"{len(latency) / stats['elapsed']:7.1f} обновлений/с  вызовов API: {stats['calls']}  "
+                  f"нарушений порядка: {stats['out_of_order']}  незавершённых диалогов: {stats['unfinished']}")
+    finally:
+        with get_engine().begin() as connection:
+            cleanup(connection, tables)
+        await dispose_async_engine()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Бенчмарк пропускной способности обработки параллельных обновлений Telegram.
+
+Каждое «обновление» делает то же, что показ меню: один SELECT настроек пользователя.
+Сравниваются синхронный движок (database.db.engine, блокирует цикл событий, как раньше)
+и асинхронный (database.async_db, как сейчас). Параллельно измеряется задержка цикла
+событий: насколько опаздывает корутина, которая просыпается каждые 10 мс (так же
+опаздывали бы job_queue и остальные обработчики).
+
+Запуск (нужна БД из DB_URL):
+    python -m benchmarks.db_concurrency --updates 500 --concurrency 50 --latency 0.005
+--latency добавляет pg_sleep к запросу, имитируя сетевую задержку до БД.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from sqlalchemy import text
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db import get_engine
+from database.async_db import get_async_engine, dispose_async_engine
+
+QUERY = text("""
+    SELECT subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times,
+           pg_sleep(:latency)
+    FROM user_settings
+    WHERE telegram_id = :telegram_id
+""")
+
+
+async def sync_update(telegram_id, latency):
+    # Как было: синхронный запрос внутри async-обработчика
+    with get_engine().connect() as conn:
+        conn.execute(QUERY, {"telegram_id": telegram_id, "latency": latency}).mappings().fetchone()
+
+
+async def async_update(telegram_id, latency):
+    async with get_async_engine().connect() as conn:
+        (await conn.execute(QUERY, {"telegram_id": telegram_id, "latency": latency})).mappings().fetchone()
+
+
+async def measure_loop_lag(stop, lags, interval=0.01):
+    """Фиксирует, насколько позже запланированного просыпается корутина."""
+    while not stop.is_set():
+        started_at = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(time.monotonic() - started_at - interval)
+
+
+async def run(handler, telegram_ids, updates, concurrency, latency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await handler(telegram_ids[i % len(telegram_ids)], latency)
+
+    stop = asyncio.Event()
+    lags = []
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+    started_at = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    elapsed = time.monotonic() - started_at
+    stop.set()
+    await lag_task
+    lags.sort()
+    max_lag = lags[-1] if lags else elapsed
+    p99_lag = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else elapsed
+    return elapsed, p99_lag, max_lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк синхронного и асинхронного доступа к БД из бота")
+    parser.add_argument('--updates', type=int, default=500, help="Число обновлений")
+    parser.add_argument('--concurrency', type=int, default=50, help="Одновременно обрабатываемых обновлений")
+    parser.add_argument('--latency', type=float, default=0.005, help="Имитация задержки БД, секунды")
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        telegram_ids = [row[0] for row in conn.execute(text("SELECT telegram_id FROM user_settings LIMIT 1000"))]
+    if not telegram_ids:
+        print("Таблица user_settings пуста, нечего измерять.")
+        return
+
+    # Прогрев пулов соединений
+    await async_update(telegram_ids[0], 0)
+    await sync_update(telegram_ids[0], 0)
+
+    print(f"Обновлений: {args.updates}, параллельно: {args.concurrency}, задержка БД: {args.latency * 1000:.1f} мс")
+    for name, handler in (("sync engine (до)", sync_update), ("async engine (после)", async_update)):
+        elapsed, p99_lag, max_lag = await run(handler, telegram_ids, args.updates, args.concurrency, args.latency)
+        print(f"{name:22} {elapsed:7.2f} с  {args.updates / elapsed:8.1f} обновл./с  "
+              f"задержка цикла событий p99={p99_lag * 1000:.1f} мс, max={max_lag * 1000:.1f} мс")
+
+    await dispose_async_engine()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Бенчмарк пропускной способности ETL на локальной замене API (benchmarks.fake_moygrafik).
+
+Без --load измеряется только сторона API: получение и нормализация справочников и сотрудников
+и потоковый разбор отчёта о присутствии (строк/с и пик памяти Python через tracemalloc).
+С --load дополнительно выполняется полный конвейер database.load_from_api в базу DB_URL.
+
+Запуск:
+    python -m benchmarks.etl_throughput --employees 10000 --days 30
+    python -m benchmarks.etl_throughput --employees 100000 --days 90 --latency 0.05 --error-rate 0.05
+    python -m benchmarks.etl_throughput --employees 10000 --days 11 --load
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from api.moygrafik_api import MoyGrafikAPI, api_metrics, create_session
+from benchmarks.fake_moygrafik import FakeCompany, FakeServer
+from database.load_from_api import dimension_rows, employee_rows, iter_presence_report, run
+
+
+def measure(name, func):
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    rows = func()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:22} {rows:9} строк  {elapsed:7.2f} с  {rows / elapsed if elapsed else 0:10.0f} строк/с  "
+          f"пик памяти {peak / 2 ** 20:7.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность ETL на синтетической компании")
+    parser.add_argument('--employees', type=int, default=10000, help="Число сотрудников компании")
+    parser.add_argument('--days', type=int, default=30, help="Период отчёта о присутствии, дней")
+    parser.add_argument('--latency', type=float, default=0.0, help="Задержка каждого ответа сервера, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов 429/5xx (0..1)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load', action='store_true', help="Выполнить полный конвейер с загрузкой в БД (DB_URL)")
+    args = parser.parse_args()
+
+    company = FakeCompany(employees=args.employees, seed=args.seed)
+    with FakeServer(company, latency=args.latency, error_rate=args.error_rate, seed=args.seed) as server:
+        # Отдельная сессия: повторы при 429/5xx те же, что и в боевом клиенте
+        api = MoyGrafikAPI(token='Bearer fake', api_url=server.url, session=create_session())
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=args.days)
+        print(f"Сотрудников: {args.employees}, период: {args.days} дн., задержка: {args.latency * 1000:.0f} мс, "
+              f"ошибок: {args.error_rate:.0%}")
+
+        for name in ('placements', 'positions', 'subdivisions'):
+            measure(name, lambda: sum(1 for _ in dimension_rows(api.fetch(
+                f"{api.base_url}/companies/{company.company_id}/{name}"), name)))
+        measure('employees', lambda: sum(1 for _ in employee_rows(api.get_employees(company.company_id))))
+        measure('presence_report', lambda: sum(1 for _ in iter_presence_report(
+            api, company.company_id, start_date, end_date)))
+
+        if args.load:
+            logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+            started_at = time.perf_counter()
+            run(company_id=company.company_id, days=args.days, force=True, api=api)
+            print(f"Полный конвейер с загрузкой в БД: {time.perf_counter() - started_at:.2f} с")
+
+        print(f"Запросов к серверу: {server.requests}, внедрено ошибок: {server.faults}")
+        api_metrics.log_summary(log=print)
+
+
+if __name__ == '__main__':
+    main()
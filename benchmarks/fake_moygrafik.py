@@ -0,0 +1,321 @@
+"""
+Локальная замена API МойГрафик для нагрузочных замеров без доступа к api.moygrafik.ru.
+
+HTTP-сервер отдаёт ответы той же формы, что и настоящий API:
+    /api/external/v1/companies/{id}/employees|placements|positions|subdivisions
+    /api/external/v1/reports/presence/{id}?start_date=ДД-ММ-ГГГГ&end_date=ДД-ММ-ГГГГ
+    /oauth/v2/token
+Данные синтетические и воспроизводимые (зависят только от --seed): компания любого размера,
+отчёт о присутствии за любой период генерируется на лету и отдаётся потоком (chunked),
+поэтому сервер не держит в памяти месяцы данных. Можно добавить задержку ответа и долю
+ошибок 429/5xx, чтобы проверить повторы клиента. Справочники отдаются с ETag (отключается --no-etag).
+
+Запуск отдельно (ETL направляется на него переменными окружения):
+    python -m benchmarks.fake_moygrafik --employees 10000 --port 8089 --latency 0.05 --error-rate 0.02
+    MOYGRAFIK_API_URL=http://127.0.0.1:8089 MOYGRAFIK_TOKEN='Bearer fake' python -m database.load_from_api
+
+Из кода:
+    with FakeServer(FakeCompany(employees=10000)) as server:
+        api = MoyGrafikAPI(token='Bearer fake', api_url=server.url)
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIRST_NAMES = ['Анна', 'Мария', 'Ольга', 'Иван', 'Пётр', 'Сергей', 'Наталья', 'Алексей', 'Елена', 'Дмитрий']
+LAST_NAMES = ['Иванова', 'Петрова', 'Смирнова', 'Кузнецов', 'Попов', 'Соколов', 'Лебедева', 'Новикова', 'Морозов']
+TIMEZONE_ID = 516
+FAULT_STATUSES = (429, 500, 502, 503)
+CHUNK_SIZE = 64 * 1024  # Размер куска потокового ответа
+
+
+class FakeCompany:
+    """Синтетическая компания: справочники и сотрудники создаются сразу, присутствие — по запросу."""
+
+    def __init__(self, employees=1000, company_id=1525, seed=0, other_timezone_share=0.1):
+        self.company_id = company_id
+        self.seed = seed
+        rng = random.Random(seed)
+
+        self.placements = {}
+        for i in range(max(1, employees // 50)):
+            placement_id = 100000 + i
+            self.placements[placement_id] = {
+                'id': placement_id, 'company_id': company_id, 'timezone_id': TIMEZONE_ID,
+                'name': f'Точка-{i + 1}', 'clid': None, 'color': '#2898FF', 'color_id': 271, 'status': 1,
+                'terminal_monitoring_enabled': False, 'location_control': 1, 'liveness_enabled': False,
+                'ips': [f'10.{i // 256 % 256}.{i % 256}.1'],
+                'mac_addresses': [':'.join(f'{rng.randrange(256):02X}' for _ in range(6))], 'managers': [],
+            }
+        self.subdivisions = {}
+        for i in range(max(1, employees // 100)):
+            subdivision_id = 200000 + i
+            self.subdivisions[subdivision_id] = {
+                'id': subdivision_id, 'company_id': company_id, 'name': f'Подразделение {i + 1}', 'clid': None,
+                'color': '#D1F3FF', 'color_id': 1, 'status': 1, 'managers': [],
+                'placements': rng.sample(list(self.placements), min(3, len(self.placements))),
+            }
+        self.positions = {}
+        for i in range(max(1, employees // 20)):
+            position_id = 300000 + i
+            self.positions[position_id] = {
+                'id': position_id, 'company_id': company_id, 'name': f'Должность {i + 1}', 'clid': None,
+                'color': '#D1F3FF', 'color_id': 1, 'status': 1, 'managers': [],
+                'subdivisions': [rng.choice(list(self.subdivisions))],
+            }
+
+        self.employees = {}
+        for i in range(employees):
+            employee_id = 1000000 + i
+            self.employees[employee_id] = {
+                'id': employee_id, 'user_id': 2000000 + i, 'company_id': company_id,
+                'timezone_id': TIMEZONE_ID if rng.random() >= other_timezone_share else 525,
+                'first_name': rng.choice(FIRST_NAMES), 'last_name': rng.choice(LAST_NAMES), 'snils': None,
+                'clid': str(1000000000 + i), 'telegram_id': 5000000000 + i if rng.random() < 0.5 else None,
+                'presence_close_rule': 2, 'email': f'user{i}@example.com', 'phone': None,
+                'avatar': None, 'avatar_big': None,
+                'placements': [rng.choice(list(self.placements))], 'sites': [],
+                'subdivisions': [rng.choice(list(self.subdivisions))],
+                'positions': [rng.choice(list(self.positions))],
+                'identification_photos': [], 'identification_photos_count': 0, 'preferred_photo': None,
+            }
+        # Сотрудники по основному размещению (так они сгруппированы в отчёте о присутствии)
+        self.placement_employees = {}
+        for employee in self.employees.values():
+            self.placement_employees.setdefault(employee['placements'][0], []).append(employee)
+
+    def dimension(self, name):
+        return {name: getattr(self, name)}
+
+    def time_entry(self, employee_id, day, today):
+        """Смена сотрудника за день или None (выходной); зависит только от seed, сотрудника и даты."""
+        bits = zlib.crc32(f'{self.seed}:{employee_id}:{day:%Y-%m-%d}'.encode())
+        if bits % 10 >= 8:
+            return None
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, seconds=(bits >> 4) % 7200)
+        end = start + timedelta(hours=8, seconds=(bits >> 12) % 7200)
+        is_open = day == today  # Сегодняшняя смена ещё не закрыта
+        real_estimate = 0 if is_open else int((end - start).total_seconds())
+        return {
+            'date': f'{day:%Y-%m-%d}',
+            'start_time': f'{start:%Y-%m-%d %H:%M:%S}',
+            'end_time': None if is_open else f'{end:%Y-%m-%d %H:%M:%S}',
+            'is_night_shift': False,
+            'original_estimate': 0,
+            'real_estimate': real_estimate,
+            'is_red': bits % 50 == 0,
+        }
+
+    def iter_presence_json(self, start_date, end_date):
+        """Тело отчёта о присутствии кусками (по сотруднику), без сборки всего ответа в памяти."""
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        today = datetime.now().date()
+        yield b'{"placements":{'
+        for placement_index, (placement_id, employees) in enumerate(self.placement_employees.items()):
+            prefix = b',' if placement_index else b''
+            yield prefix + f'"{placement_id}":{{"presences":['.encode()
+            for employee_index, employee in enumerate(employees):
+                time_data = [entry for entry in (self.time_entry(employee['id'], day, today) for day in days) if entry]
+                presence = {
+                    'employee': {key: employee[key] for key in ('id', 'first_name', 'last_name', 'email',
+                                                                'timezone_id')},
+                    'time_data': time_data,
+                }
+                yield (b',' if employee_index else b'') + json.dumps(presence, ensure_ascii=False).encode()
+            yield b']}'
+        yield b'}}'
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeMoyGrafik/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, chunk):
+        self.wfile.write(f'{len(chunk):X}\r\n'.encode() + chunk + b'\r\n')
+
+    def inject_faults(self):
+        """Задержка и случайная ошибка; True, если ответ уже отправлен."""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            fail = server.rng.random() < server.error_rate
+            status = server.rng.choice(FAULT_STATUSES) if fail else None
+            if fail:
+                server.faults += 1
+        if status:
+            headers = {'Retry-After': '0'} if status == 429 else {}
+            self.send_json(status, b'{"error":"fault injected"}', headers)
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if urlparse(self.path).path != '/oauth/v2/token':
+            self.send_json(404, b'{}')
+            return
+        token = hashlib.sha256(f'{time.time()}'.encode()).hexdigest()
+        self.send_json(200, json.dumps({'access_token': token, 'expires_in': 3600, 'token_type': 'bearer',
+                                        'refresh_token': f'refresh-{token}'}).encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not self.headers.get('Authorization'):
+            self.send_json(401, b'{"error":"unauthorized"}')
+            return
+        if self.inject_faults():
+            return
+        company = self.server.company
+
+        match = re.fullmatch(r'/api/external/v1/companies/(\d+)/(employees|placements|positions|subdivisions)',
+                             url.path)
+        if match:
+            body = self.server.dimension_body(match.group(2))
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            if self.server.etag and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_json(200, body, {'ETag': etag} if self.server.etag else None)
+            return
+
+        if re.fullmatch(r'/api/external/v1/reports/presence/(\d+)', url.path):
+            query = parse_qs(url.query)
+            try:
+                start_date = datetime.strptime(query['start_date'][0], '%d-%m-%Y').date()
+                end_date = datetime.strptime(query['end_date'][0], '%d-%m-%Y').date()
+            except (KeyError, ValueError):
+                self.send_json(400, b'{"error":"bad dates"}')
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            buffer = []
+            size = 0
+            for piece in company.iter_presence_json(start_date, end_date):
+                buffer.append(piece)
+                size += len(piece)
+                if size >= CHUNK_SIZE:
+                    self.write_chunk(b''.join(buffer))
+                    buffer, size = [], 0
+            if buffer:
+                self.write_chunk(b''.join(buffer))
+            self.wfile.write(b'0\r\n\r\n')
+            return
+
+        if re.fullmatch(r'/api/external/v1\.1/identification/companies/(\d+)/test', url.path):
+            self.send_json(200, b'{"success":true}')
+            return
+        self.send_json(404, b'{"error":"not found"}')
+
+
+class FakeServer:
+    """Сервер FakeHandler в фоновом потоке; используется как контекстный менеджер."""
+
+    def __init__(self, company, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, etag=True, seed=0):
+        self.httpd = ThreadingHTTPServer((host, port), FakeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.company = company
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.etag = etag
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.faults = 0
+        bodies = {}
+
+        def dimension_body(name):
+            # Тела справочников сериализуются один раз
+            with self.httpd.lock:
+                if name not in bodies:
+                    bodies[name] = json.dumps(company.dimension(name), ensure_ascii=False).encode()
+                return bodies[name]
+
+        self.httpd.dimension_body = dimension_body
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def faults(self):
+        return self.httpd.faults
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена API МойГрафик с синтетическими данными")
+    parser.add_argument('--employees', type=int, default=1000, help="Число сотрудников компании")
+    parser.add_argument('--company-id', type=int, default=1525)
+    parser.add_argument('--seed', type=int, default=0, help="Зерно генератора данных и ошибок")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help="Задержка каждого ответа, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов 429/5xx (0..1)")
+    parser.add_argument('--no-etag', action='store_true', help="Не отдавать ETag (клиент сравнивает хэш тела)")
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    company = FakeCompany(employees=args.employees, company_id=args.company_id, seed=args.seed)
+    print(f"Компания {args.company_id}: сотрудников {len(company.employees)}, размещений {len(company.placements)}, "
+          f"должностей {len(company.positions)}, подразделений {len(company.subdivisions)} "
+          f"(сгенерировано за {time.perf_counter() - started_at:.2f} с)")
+    server = FakeServer(company, args.host, args.port, args.latency, args.error_rate, not args.no_etag, args.seed)
+    print(f"Сервер: {server.url} (Ctrl+C — остановить)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Запросов: {server.requests}, ошибок внедрено: {server.faults}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Бенчмарк задач планировщика (send_notification и check_absences) на 1k/10k/100k пользователей.
+
+В базу DB_URL (или --db-url) добавляются синтетические employees, user_settings и presence_report
+в отдельном диапазоне идентификаторов; после замера они удаляются. Используйте локальную
+тестовую базу: check_absences выбирает всех подписанных пользователей, включая настоящих.
+
+Часы бота подменяются (bot.utils.set_clock): замер начинается за 5 минут до первого времени
+оповещений и идёт шагами по 30 секунд, как job_queue. Вместо Telegram — FakeBot, который только
+записывает сообщения. Лимиты частоты Telegram по умолчанию отключены, чтобы мерить работу бота,
+а не ожидание токенов (--telegram-limits включает их обратно).
+
+Для каждой задачи выводятся задержка тика (p50/p95/max), число SQL-запросов и отправок
+за тик и пик памяти (RSS процесса, а с --trace-memory — пик аллокаций Python за тик).
+
+Запуск:
+    python -m benchmarks.scheduler_scale --users 10000 --ticks 240
+    python -m benchmarks.scheduler_scale --users 100000 --ticks 60 --trace-memory
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import delete, event, insert
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot.notification_index import notification_index
+from bot.logging_setup import setup_logging
+from bot.notifications import check_absences
+from bot.scheduler import send_notification
+from bot.sender import message_sender, RateLimiter
+from bot.sent_store import sent_store
+from bot.utils import set_clock
+from database.async_db import get_async_engine, dispose_async_engine
+from database.db import create_schema, get_engine, employees, user_settings, presence_report, notifications
+
+FIRST_EMPLOYEE_ID = 9_000_000_000  # Диапазон идентификаторов синтетических данных
+FIRST_TELEGRAM_ID = 9_100_000_000
+SEED_BATCH_SIZE = 5000
+TICK_SECONDS = 30  # Интервал job_queue в bot/scheduler.py
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+class FakeBot:
+    """Заменяет context.bot: записывает отправленные сообщения, при необходимости с задержкой."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text))
+
+
+def synthetic_rows(users, today, first_minute, span_minutes, arrived_share, seed):
+    """Строки employees, user_settings и presence_report для users пользователей."""
+    rng = random.Random(seed)
+    employee_rows, settings_rows, presence_rows = [], [], []
+    for i in range(users):
+        employee_id = FIRST_EMPLOYEE_ID + i
+        arrival_minute = first_minute + rng.randrange(span_minutes)
+        arrival = f"{arrival_minute // 60:02d}:{arrival_minute % 60:02d}"
+        departure_minute = (arrival_minute + 9 * 60) % (24 * 60)
+        departure = f"{departure_minute // 60:02d}:{departure_minute % 60:02d}"
+        on_vacation = rng.random() < 0.05
+        employee_rows.append({'id': employee_id, 'company_id': 1525, 'timezone_id': 516,
+                              'first_name': f'Имя{i}', 'last_name': f'Фамилия{i}',
+                              'telegram_id': FIRST_TELEGRAM_ID + i})
+        settings_rows.append({
+            'telegram_id': FIRST_TELEGRAM_ID + i, 'employee_id': employee_id,
+            'subscribed': rng.random() < 0.9,
+            'vacation_start': today - timedelta(days=2) if on_vacation else None,
+            'vacation_end': today + timedelta(days=5) if on_vacation else None,
+            'arrival_notification_times': [arrival],
+            'departure_notification_times': [departure],
+        })
+        if rng.random() < arrived_share:
+            start_time = datetime.combine(today, datetime.min.time()) + timedelta(minutes=arrival_minute - 10)
+            presence_rows.append({'employee_id': employee_id, 'date': today, 'start_time': start_time,
+                                  'end_time': None, 'is_night_shift': False, 'original_estimate': 0,
+                                  'real_estimate': 0, 'is_red': False})
+    return employee_rows, settings_rows, presence_rows
+
+
+def seed(connection, tables, rows):
+    for table, table_rows in zip(tables, rows):
+        for i in range(0, len(table_rows), SEED_BATCH_SIZE):
+            connection.execute(insert(table), table_rows[i:i + SEED_BATCH_SIZE])
+
+
+def cleanup(connection, tables):
+    employees, user_settings, presence_report, notifications = tables
+    last_employee_id = FIRST_EMPLOYEE_ID + 10 ** 8
+    last_telegram_id = FIRST_TELEGRAM_ID + 10 ** 8
+    connection.execute(delete(notifications).where(
+        notifications.c.telegram_id.between(FIRST_TELEGRAM_ID, last_telegram_id)))
+    connection.execute(delete(user_settings).where(
+        user_settings.c.telegram_id.between(FIRST_TELEGRAM_ID, last_telegram_id)))
+    connection.execute(delete(presence_report).where(
+        presence_report.c.employee_id.between(FIRST_EMPLOYEE_ID, last_employee_id)))
+    connection.execute(delete(employees).where(employees.c.id.between(FIRST_EMPLOYEE_ID, last_employee_id)))
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run_ticks(jobs, clock, ticks, bot, trace_memory):
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    sync_engine = get_async_engine().sync_engine
+    event.listen(sync_engine, 'before_cursor_execute', count_query)
+    stats = {name: {'latency': [], 'queries': [], 'sends': [], 'peak': []} for name, _ in jobs}
+    context = SimpleNamespace(bot=bot)
+    try:
+        for _ in range(ticks):
+            for name, job in jobs:
+                queries[0] = 0
+                sent_before = len(bot.sent)
+                if trace_memory:
+                    tracemalloc.reset_peak()
+                started_at = time.perf_counter()
+                await job(context)
+                stats[name]['latency'].append(time.perf_counter() - started_at)
+                stats[name]['queries'].append(queries[0])
+                stats[name]['sends'].append(len(bot.sent) - sent_before)
+                if trace_memory:
+                    stats[name]['peak'].append(tracemalloc.get_traced_memory()[1])
+            clock.advance(TICK_SECONDS)
+    finally:
+        event.remove(sync_engine, 'before_cursor_execute', count_query)
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Масштабный бенчмарк задач планировщика")
+    parser.add_argument('--users', type=int, default=1000, help="Число синтетических пользователей")
+    parser.add_argument('--ticks', type=int, default=240, help="Число тиков по 30 с (240 = 2 часа)")
+    parser.add_argument('--span', type=int, default=120, help="Разброс времён оповещений о приходе, минут")
+    parser.add_argument('--arrived-share', type=float, default=0.5, help="Доля пользователей, уже отметивших приход")
+    parser.add_argument('--send-latency', type=float, default=0.0, help="Задержка FakeBot.send_message, с")
+    parser.add_argument('--telegram-limits', action='store_true', help="Не отключать лимиты частоты Telegram")
+    parser.add_argument('--trace-memory', action='store_true', help="Пик аллокаций Python за тик (tracemalloc)")
+    parser.add_argument('--db-url', help="База для замера (по умолчанию DB_URL)")
+    parser.add_argument('--log-level', default='WARNING', help="Уровень логов бота во время замера")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.db_url:
+        # Движки создаются при первом обращении, поэтому подмена до него действует на оба
+        os.environ['DB_URL'] = args.db_url
+    setup_logging(log_file=None, level=args.log_level)
+    tables = (employees, user_settings, presence_report, notifications)
+    today = datetime.now().date()
+    first_minute = 8 * 60
+    clock = FakeClock(datetime.combine(today, datetime.min.time()) + timedelta(minutes=first_minute - 5))
+
+    create_schema()
+    started_at = time.perf_counter()
+    rows = synthetic_rows(args.users, today, first_minute, args.span, args.arrived_share, args.seed)
+    with get_engine().begin() as connection:
+        cleanup(connection, tables)
+        seed(connection, tables[:3], rows)
+    print(f"Пользователей: {args.users}, записей присутствия: {len(rows[2])}, "
+          f"подготовка данных {time.perf_counter() - started_at:.2f} с")
+
+    # Отдельный журнал отправок и свежий индекс, чтобы не задеть журнал и состояние настоящего бота
+    sent_dir = tempfile.mkdtemp(prefix='scheduler_scale_')
+    sent_store.directory = sent_dir
+    sent_store.current_date = None
+    notification_index['built_at'] = None
+    if not args.telegram_limits:
+        message_sender.limiter = RateLimiter(10 ** 9)
+        message_sender.per_chat_interval = 0
+    set_clock(clock)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    bot = FakeBot(args.send_latency)
+    jobs = [('send_notification', send_notification), ('check_absences', check_absences)]
+    try:
+        stats = await run_ticks(jobs, clock, args.ticks, bot, args.trace_memory)
+    finally:
+        set_clock()
+        if args.trace_memory:
+            tracemalloc.stop()
+        with get_engine().begin() as connection:
+            cleanup(connection, tables)
+        shutil.rmtree(sent_dir, ignore_errors=True)
+        await dispose_async_engine()
+
+    print(f"Тиков: {args.ticks} по {TICK_SECONDS} с, отправлено сообщений: {len(bot.sent)}")
+    for name, job_stats in stats.items():
+        latency = job_stats['latency']
+        line = (f"{name:18} тик p50={statistics.median(latency) * 1000:8.1f} мс  "
+                f"p95={percentile(latency, 0.95) * 1000:8.1f} мс  max={max(latency) * 1000:8.1f} мс  "
+                f"запросов/тик avg={statistics.mean(job_stats['queries']):5.1f} max={max(job_stats['queries']):3}  "
+                f"отправок/тик avg={statistics.mean(job_stats['sends']):7.1f} max={max(job_stats['sends']):6}")
+        if job_stats['peak']:
+            line += f"  пик памяти {max(job_stats['peak']) / 2 ** 20:7.1f} МБ"
+        print(line)
+    # ru_maxrss в Linux — в килобайтах
+    print(f"Пик RSS процесса: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Бенчмарк холодного старта бота: импорт bot.main и сборка приложения (build_application)
+в отдельном процессе, без обращения к Telegram и базе данных.
+
+Каждый замер — новый интерпретатор. DB_URL подменяется на недоступный адрес, а прокси
+на несуществующий: если какой-то модуль при импорте полезет в сеть или БД, старт упадёт
+или заметно затормозит. Дополнительно выводятся самые тяжёлые по времени импорта модули
+(python -X importtime).
+
+Запуск:
+    python -m benchmarks.startup --runs 10 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+STARTUP_SCRIPT = """
+import time
+started_at = time.perf_counter()
+import bot.main
+imported_at = time.perf_counter()
+bot.main.build_application('123456:STARTUP-BENCHMARK')
+built_at = time.perf_counter()
+print(f"{imported_at - started_at:.6f} {built_at - imported_at:.6f}")
+"""
+
+
+def isolated_env():
+    env = dict(os.environ)
+    env['DB_URL'] = 'postgresql://startup-benchmark@127.0.0.1:1/none'
+    env['HTTP_PROXY'] = env['HTTPS_PROXY'] = 'http://127.0.0.1:1'
+    env['PYTHONPATH'] = PROJECT_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def run_once(importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', STARTUP_SCRIPT]
+    result = subprocess.run(command, cwd=PROJECT_ROOT, env=isolated_env(), capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(f"Холодный старт завершился с ошибкой:\n{result.stderr[-2000:]}")
+    import_seconds, build_seconds = map(float, result.stdout.strip().splitlines()[-1].split())
+    return import_seconds, build_seconds, result.stderr
+
+
+def top_imports(stderr, top):
+    """Самые долгие импорты по накопленному времени из вывода -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # Формат строки: "import time:  <self, мкс> | <cumulative, мкс> | <модуль>"
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта bot/main.py")
+    parser.add_argument('--runs', type=int, default=10, help="Число замеров")
+    parser.add_argument('--top', type=int, default=15, help="Сколько самых тяжёлых импортов показать")
+    args = parser.parse_args()
+
+    imports, builds = [], []
+    for _ in range(args.runs):
+        import_seconds, build_seconds, _ = run_once()
+        imports.append(import_seconds)
+        builds.append(build_seconds)
+    totals = [i + b for i, b in zip(imports, builds)]
+    print(f"Замеров: {args.runs}")
+    print(f"Импорт bot.main:      медиана {statistics.median(imports) * 1000:.1f} мс, max {max(imports) * 1000:.1f} мс")
+    print(f"build_application():  медиана {statistics.median(builds) * 1000:.1f} мс, max {max(builds) * 1000:.1f} мс")
+    print(f"Итого до run_polling: медиана {statistics.median(totals) * 1000:.1f} мс")
+
+    _, _, stderr = run_once(importtime=True)
+    print("\nСамые долгие импорты (накопленно, мс):")
+    for cumulative_us, self_us, name in top_imports(stderr, args.top):
+        print(f"{cumulative_us / 1000:9.1f}  (собственное {self_us / 1000:7.1f})  {name}")
+
+
+if __name__ == '__main__':
+    main()
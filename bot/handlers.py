@@ -15,18 +15,15 @@ from bot.settings import get_user_settings, update_user_settings
 from bot.status_checker import get_attendance, get_attendance_last_10_days
 from bot.utils import INPUT_VACATION_START, INPUT_VACATION_END, INPUT_ARRIVAL_NOTIFICATION_TIME, \
     INPUT_DEPARTURE_NOTIFICATION_TIME
-from database.db import engine
-
-# Настройка логирования только в файл
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,
-    handlers=[
-        logging.FileHandler('handlers.log', encoding='utf-8')
-    ]
-)
+from database.async_db import get_async_engine
+from common.metrics import observe_handler
+from common.profiling import profiled, profiler
+
 logger = logging.getLogger(__name__)
 
+# Telegram ID администраторов, которым доступна команда /profile
+ADMIN_IDS = {int(value) for value in os.getenv("ADMIN_IDS", "").split(",") if value.strip()}
+
 # Состояния для ConversationHandler
 SET_VACATION_START, SET_VACATION_END, ADD_ARRIVAL_NOTIFICATION, ADD_DEPARTURE_NOTIFICATION = range(INPUT_VACATION_START,
                                                                                                    INPUT_DEPARTURE_NOTIFICATION_TIME + 1)
@@ -66,6 +63,7 @@ def create_main_menu(subscribed, vacation_start, vacation_end, arrival_notificat
     return message, reply_markup
 
 
+@observe_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     logger.debug(f"Получена команда /start от пользователя {user_id}")
@@ -93,9 +91,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Проверяем пользователя в базе данных
     try:
-        with engine.connect() as connection:
+        async with get_async_engine().connect() as connection:
             query = text("SELECT employee_id FROM user_settings WHERE telegram_id = :telegram_id")
-            result = connection.execute(query, {"telegram_id": user_id}).mappings().fetchone()
+            result = (await connection.execute(query, {"telegram_id": user_id})).mappings().fetchone()
 
             if not result:
                 message = (
@@ -108,8 +106,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             employee_id = result['employee_id']
 
-            query = text("SELECT first_name, last_name FROM employees réactions: WHERE id = :employee_id")
-            employee = connection.execute(query, {"employee_id": employee_id}).mappings().fetchone()
+            query = text("SELECT first_name, last_name FROM employees WHERE id = :employee_id")
+            employee = (await connection.execute(query, {"employee_id": employee_id})).mappings().fetchone()
 
             if not employee:
                 message = (
@@ -123,7 +121,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             first_name = employee['first_name']
             last_name = employee['last_name']
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
 
         message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times,
@@ -142,6 +140,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@observe_handler
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     logger.debug(f"Получена команда /menu от пользователя {user_id}")
@@ -151,7 +150,7 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['conversation_state'] = None
 
     try:
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
 
         message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times,
@@ -166,12 +165,13 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@observe_handler
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     logger.debug(f"Получена команда /status от пользователя {user_id}")
 
     try:
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
 
         subscription_status = "подписан ✅" if subscribed else "не подписан 🚫"
@@ -198,6 +198,32 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@observe_handler
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [цель [N] | off] — профилирование следующих N вызовов цели (только для ADMIN_IDS)."""
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Команда /profile от пользователя {user_id}, не входящего в ADMIN_IDS")
+        return
+
+    args = context.args or []
+    if args and args[0] == 'off':
+        profiler.disarm(args[1] if len(args) > 1 else None)
+    elif args:
+        try:
+            count = int(args[1]) if len(args) > 1 else 1
+        except ValueError:
+            await update.message.reply_text("Использование: /profile <цель> [N] или /profile off [цель]")
+            return
+        profiler.arm(args[0], count)
+
+    armed = ', '.join(f"{pattern}: {count}" for pattern, count in profiler.armed.items()) or "нет"
+    await update.message.reply_text(
+        f"🔬 Профилирование ({profiler.mode}), осталось вызовов: {armed}\nКаталог профилей: {profiler.directory}")
+
+
+@observe_handler
+@profiled(lambda update, context: f"callback_handler.{update.callback_query.data}")
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -206,7 +232,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug(f"Получен callback-запрос от пользователя {user_id}: callback_data={callback_data}")
 
     try:
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         logger.debug(
             f"Текущие настройки пользователя {user_id}: subscribed={subscribed}, vacation_start={vacation_start}, vacation_end={vacation_end}, arrival_notification_times={arrival_notification_times}, departure_notification_times={departure_notification_times}")
@@ -215,7 +241,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.info(
                 f"Пользователь {user_id} нажал кнопку 'Подписка на рассылку'. Действие: переключение статуса подписки.")
             new_subscribed = not subscribed
-            success = update_user_settings(user_id, subscribed=new_subscribed)
+            success = await update_user_settings(user_id, subscribed=new_subscribed)
             if not success:
                 logger.error(f"Не удалось обновить статус подписки для пользователя {user_id}")
                 await query.message.reply_text("❌ Ошибка при обновлении подписки. Попробуй снова.")
@@ -226,7 +252,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text(f"📩 Подписка на рассылку: {status}")
 
             # Обновляем меню после изменения статуса подписки
-            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
                 user_id)
             message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end,
                                                      arrival_notification_times, departure_notification_times)
@@ -246,7 +272,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 logger.warning(f"У пользователя {user_id} нет установленного периода отпуска.")
                 await query.message.reply_text("🏖️ У тебя нет установленного периода отпуска! 😕")
                 return ConversationHandler.END
-            success = update_user_settings(user_id, vacation_start=None, vacation_end=None)
+            success = await update_user_settings(user_id, vacation_start=None, vacation_end=None)
             if not success:
                 logger.error(f"Не удалось удалить период отпуска для пользователя {user_id}")
                 await query.message.reply_text("❌ Ошибка при удалении периода отпуска. Попробуй снова.")
@@ -255,7 +281,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text("🏖️ Период отпуска удалён! ✅")
 
             # Обновляем меню после удаления периода отпуска
-            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
                 user_id)
             message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end,
                                                      arrival_notification_times, departure_notification_times)
@@ -293,7 +319,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_to_remove = callback_data[len('remove_arrival_time_'):]
             if time_to_remove in arrival_notification_times:
                 arrival_notification_times.remove(time_to_remove)
-                success = update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
+                success = await update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
                 if not success:
                     logger.error(
                         f"Не удалось удалить время оповещения о приходе {time_to_remove} для пользователя {user_id}")
@@ -303,7 +329,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.message.reply_text(f"⏰ Время оповещения о приходе {time_to_remove} удалено! ✅")
 
                 # Обновляем меню после удаления времени
-                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
                     user_id)
                 message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end,
                                                          arrival_notification_times, departure_notification_times)
@@ -341,7 +367,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_to_remove = callback_data[len('remove_departure_time_'):]
             if time_to_remove in departure_notification_times:
                 departure_notification_times.remove(time_to_remove)
-                success = update_user_settings(user_id, departure_notification_times=departure_notification_times)
+                success = await update_user_settings(user_id, departure_notification_times=departure_notification_times)
                 if not success:
                     logger.error(
                         f"Не удалось удалить время оповещения об уходе {time_to_remove} для пользователя {user_id}")
@@ -351,7 +377,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.message.reply_text(f"🚪 Время оповещения об уходе {time_to_remove} удалено! ✅")
 
                 # Обновляем меню после удаления времени
-                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
                     user_id)
                 message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end,
                                                          arrival_notification_times, departure_notification_times)
@@ -361,7 +387,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.info(
                 f"Пользователь {user_id} нажал кнопку 'Посещения за сегодня'. Действие: получение данных о посещениях.")
             today = datetime.now().strftime('%Y-%m-%d')
-            status = get_attendance(user_id, today)
+            status = await get_attendance(user_id, today)
 
             # Парсим статус
             start = status.split("Начало: ")[1].split(",")[0].strip()
@@ -386,7 +412,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.info(
                 f"Пользователь {user_id} нажал кнопку 'Посещения за 10 дней'. Действие: получение данных о посещениях за 10 дней.")
             today = datetime.now().strftime('%Y-%m-%d')
-            records = get_attendance_last_10_days(user_id, today)
+            records = await get_attendance_last_10_days(user_id, today)
             if not records:
                 logger.warning(f"У пользователя {user_id} нет данных о посещениях за последние 10 дней.")
                 await query.message.reply_text("📊 Нет данных за последние 10 дней! 😕")
@@ -417,6 +443,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@observe_handler
 async def set_vacation_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -450,6 +477,7 @@ async def set_vacation_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
 
 
+@observe_handler
 async def set_vacation_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -475,7 +503,7 @@ async def set_vacation_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "❌ Дата окончания отпуска должна быть позже даты начала. Попробуй ещё раз (ДД-ММ-ГГГГ):")
             return SET_VACATION_END
 
-        success = update_user_settings(user_id, vacation_start=vacation_start, vacation_end=vacation_end)
+        success = await update_user_settings(user_id, vacation_start=vacation_start, vacation_end=vacation_end)
         if not success:
             logger.error(f"Не удалось установить период отпуска для пользователя {user_id}")
             await update.message.reply_text("❌ Ошибка при установке периода отпуска. Попробуй снова.")
@@ -483,7 +511,7 @@ async def set_vacation_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         logger.info(f"Период отпуска для пользователя {user_id} успешно установлен: {vacation_start} - {vacation_end}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times,
                                                  departure_notification_times)
@@ -505,6 +533,7 @@ async def set_vacation_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@observe_handler
 async def add_arrival_notification_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text.strip()
@@ -528,14 +557,14 @@ async def add_arrival_notification_time(update: Update, context: ContextTypes.DE
         time_str = f"{hours:02d}:{minutes:02d}"
         logger.info(f"Время оповещения о приходе успешно нормализовано: {time_str}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         if time_str in arrival_notification_times:
             await update.message.reply_text(f"⏰ Время оповещения о приходе {time_str} уже добавлено! 😕")
             return ConversationHandler.END
 
         arrival_notification_times.append(time_str)
-        success = update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
+        success = await update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
         if not success:
             logger.error(f"Не удалось обновить время оповещения о приходе для пользователя {user_id}")
             await update.message.reply_text("❌ Ошибка при добавлении времени оповещения. Попробуй снова.")
@@ -543,7 +572,7 @@ async def add_arrival_notification_time(update: Update, context: ContextTypes.DE
 
         logger.info(f"Время оповещения о приходе {time_str} успешно добавлено для пользователя {user_id}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times,
                                                  departure_notification_times)
@@ -566,6 +595,7 @@ async def add_arrival_notification_time(update: Update, context: ContextTypes.DE
         return ConversationHandler.END
 
 
+@observe_handler
 async def add_departure_notification_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text.strip()
@@ -589,14 +619,14 @@ async def add_departure_notification_time(update: Update, context: ContextTypes.
         time_str = f"{hours:02d}:{minutes:02d}"
         logger.info(f"Время оповещения об уходе успешно нормализовано: {time_str}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         if time_str in departure_notification_times:
             await update.message.reply_text(f"🚪 Время оповещения об уходе {time_str} уже добавлено! 😕")
             return ConversationHandler.END
 
         departure_notification_times.append(time_str)
-        success = update_user_settings(user_id, departure_notification_times=departure_notification_times)
+        success = await update_user_settings(user_id, departure_notification_times=departure_notification_times)
         if not success:
             logger.error(f"Не удалось обновить время оповещения об уходе для пользователя {user_id}")
             await update.message.reply_text("❌ Ошибка при добавлении времени оповещения. Попробуй снова.")
@@ -604,7 +634,7 @@ async def add_departure_notification_time(update: Update, context: ContextTypes.
 
         logger.info(f"Время оповещения об уходе {time_str} успешно добавлено для пользователя {user_id}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(
             user_id)
         message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times,
                                                  departure_notification_times)
@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Общая настройка логирования бота; переопределяется переменными окружения
+LOG_FILE = os.getenv("LOG_FILE", os.path.join(os.path.dirname(__file__), "bot.log"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Уровни отдельных модулей: "bot.scheduler=DEBUG,httpx=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text или json (одна JSON-запись на строку)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 2 ** 20))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Из повторяющихся записей с extra=SAMPLED ниже WARNING пишется каждая LOG_SAMPLE_EVERY-я
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+# httpx пишет INFO на каждый запрос к Bot API, APScheduler — на каждый запуск задачи
+DEFAULT_LEVELS = {"httpx": "WARNING", "apscheduler": "WARNING"}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Отметка для записей, повторяющихся для каждого пользователя: logger.info(..., extra=SAMPLED).
+# WARNING и ERROR с этой отметкой не прореживаются: при инциденте нужна каждая такая запись
+SAMPLED = {"sampled": True}
+
+_listener = None
+
+
+class RepeatSampler(logging.Filter):
+    """
+    Пропускает только каждую every-ю запись с extra=SAMPLED уровня ниже WARNING для одного шаблона
+    сообщения (логгер + строка формата), остальные отбрасывает до форматирования. К пропущенной записи
+    добавляется число записей, отброшенных с предыдущей записанной.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.skipped = {}  # шаблон -> отброшено записей с последней записанной
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        key = (record.name, record.msg)
+        skipped = self.skipped.get(key)
+        if skipped is not None and skipped < self.every - 1:
+            self.skipped[key] = skipped + 1
+            return False
+        self.skipped[key] = 0
+        if skipped:
+            record.msg = f"{record.msg} [пропущено похожих записей: {skipped}]"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON с временем, уровнем, логгером и сообщением."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_levels(value):
+    """Разбирает "модуль=УРОВЕНЬ,..." в словарь."""
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL, levels=LOG_LEVELS, log_format=LOG_FORMAT):
+    """
+    Настраивает корневой логгер: записи кладутся в очередь (QueueHandler), а в файл с ротацией
+    и в консоль их пишет отдельный поток QueueListener, не блокируя цикл событий бота.
+    Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                            encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatSampler(LOG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in {**DEFAULT_LEVELS, **parse_levels(levels)}.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает записи из очереди и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
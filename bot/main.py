@@ -1,32 +1,90 @@
+import os
+from dotenv import load_dotenv
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
-from bot.handlers import start, menu, status, callback_handler, set_vacation_start, set_vacation_end, add_arrival_notification_time, add_departure_notification_time
+from bot.handlers import start, menu, status, profile_command, callback_handler, set_vacation_start, set_vacation_end, add_arrival_notification_time, add_departure_notification_time
 from bot.registration import register
 from bot.scheduler import setup_scheduler
+from bot.logging_setup import setup_logging
+from bot.update_processor import PerUserUpdateProcessor
 from bot.utils import INPUT_VACATION_START, INPUT_VACATION_END, INPUT_ARRIVAL_NOTIFICATION_TIME, INPUT_DEPARTURE_NOTIFICATION_TIME
+from database.async_db import dispose_async_engine
+from common.metrics import start_http_server
 
-app = ApplicationBuilder().token("7437055328:AAHgZeBAUu-fLz90H9prMWFg-1mz2z0qzrg").build()
-
-# Настройка планировщика уведомлений
-setup_scheduler(app)
-
-# Обработчики команд
-app.add_handler(CommandHandler("start", start))
-app.add_handler(CommandHandler("menu", menu))
-app.add_handler(CommandHandler("status", status))
-app.add_handler(CommandHandler("register", register))
-
-# Обработчик кнопок и состояний
-conv_handler = ConversationHandler(
-    entry_points=[CallbackQueryHandler(callback_handler)],
-    states={
-        INPUT_VACATION_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_vacation_start)],
-        INPUT_VACATION_END: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_vacation_end)],
-        INPUT_ARRIVAL_NOTIFICATION_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_arrival_notification_time)],
-        INPUT_DEPARTURE_NOTIFICATION_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_departure_notification_time)],
-    },
-    fallbacks=[],
-)
-app.add_handler(conv_handler)
-
-# Запуск бота
-app.run_polling()
\ No newline at end of file
+# Число одновременно обрабатываемых обновлений (разных пользователей); 1 — последовательно
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+
+# Режим запуска: polling (по умолчанию) или webhook за обратным прокси
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес прокси, например https://bot.example.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+
+
+async def post_shutdown(application):
+    # Закрываем пул асинхронных подключений к БД
+    await dispose_async_engine()
+
+
+def build_application(token, concurrent_updates=CONCURRENT_UPDATES, request=None):
+    """
+    Собирает приложение бота с обработчиками и планировщиком (без подключения к Telegram и БД).
+    request подменяет HTTP-клиент Telegram (используется в нагрузочном тесте).
+    """
+    builder = ApplicationBuilder().token(token).post_shutdown(post_shutdown)
+    if concurrent_updates > 1:
+        # Разные пользователи обрабатываются параллельно, обновления одного — по порядку
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+
+    # Настройка планировщика уведомлений
+    setup_scheduler(app)
+
+    # Обработчики команд
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("menu", menu))
+    app.add_handler(CommandHandler("status", status))
+    app.add_handler(CommandHandler("register", register))
+    app.add_handler(CommandHandler("profile", profile_command))
+
+    # Обработчик кнопок и состояний
+    conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(callback_handler)],
+        states={
+            INPUT_VACATION_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_vacation_start)],
+            INPUT_VACATION_END: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_vacation_end)],
+            INPUT_ARRIVAL_NOTIFICATION_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_arrival_notification_time)],
+            INPUT_DEPARTURE_NOTIFICATION_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_departure_notification_time)],
+        },
+        fallbacks=[],
+    )
+    app.add_handler(conv_handler)
+    return app
+
+
+def main():
+    # Токен бота берётся только из переменной окружения или .env
+    load_dotenv()
+    bot_token = os.getenv("TG_BOT_TOKEN")
+    if not bot_token:
+        raise SystemExit("Не задан TG_BOT_TOKEN: укажите токен бота в переменных окружения или в .env")
+    # Запуск бота
+    setup_logging()
+    # Метрики Prometheus на METRICS_LISTEN:METRICS_PORT (если порт задан)
+    start_http_server()
+    app = build_application(bot_token)
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise SystemExit("Для BOT_MODE=webhook нужен WEBHOOK_URL")
+        # Локальный HTTP-сервер за прокси; Telegram шлёт обновления на WEBHOOK_URL
+        app.run_webhook(listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url_path=WEBHOOK_PATH,
+                        webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    else:
+        app.run_polling()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import json
+import logging
+import sys
+import os
+from datetime import datetime
+from sqlalchemy import text
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from database.async_db import get_async_engine
+from bot.logging_setup import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+# Интервал полной перестройки индекса в секундах. Нужен, потому что user_settings
+# меняется не только через бота (например, ETL добавляет новых сотрудников).
+INDEX_REFRESH_INTERVAL = 600
+
+MINUTES_IN_DAY = 24 * 60
+
+# Индекс времён оповещений: минута суток -> множество telegram_id
+notification_index = {
+    "built_at": None,  # Время последней полной перестройки индекса
+    "arrival": {},  # {минута: set(telegram_id)}
+    "departure": {},  # {минута: set(telegram_id)}
+    "users": {}  # {telegram_id: {"arrival": {минута: "ЧЧ:ММ"}, "departure": {минута: "ЧЧ:ММ"}}}
+}
+
+# Журналы идущих перестроек: изменения, сделанные во время чтения user_settings,
+# повторно применяются к новому индексу, иначе он затёр бы их устаревшим снимком таблицы
+_rebuild_journals = []
+
+
+def time_to_minute(time_str):
+    """Переводит время в формате ЧЧ:ММ в номер минуты суток."""
+    parsed = datetime.strptime(time_str, '%H:%M')
+    return parsed.hour * 60 + parsed.minute
+
+
+def parse_notification_times(raw_value, telegram_id, field_name):
+    """Разбирает список времён оповещений из user_settings (JSONB приходит списком или JSON-текстом)."""
+    if isinstance(raw_value, list):
+        return raw_value
+    try:
+        times = json.loads(raw_value or '[]')
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.error("Ошибка при разборе %s для пользователя %s: %s", field_name, telegram_id, e, extra=SAMPLED)
+        return []
+    if not isinstance(times, list):
+        logger.warning("Некорректный формат %s для пользователя %s: %s", field_name, telegram_id, times,
+                       extra=SAMPLED)
+        return []
+    return times
+
+
+def _remove_from_buckets(telegram_id, kind):
+    """Удаляет пользователя из минутных корзин указанного типа."""
+    user_entry = notification_index["users"].get(telegram_id)
+    if not user_entry:
+        return
+    buckets = notification_index[kind]
+    for minute in user_entry[kind]:
+        bucket = buckets.get(minute)
+        if bucket is None:
+            continue
+        bucket.discard(telegram_id)
+        if not bucket:
+            del buckets[minute]
+    user_entry[kind] = {}
+
+
+def _add_to_buckets(telegram_id, kind, times):
+    """Раскладывает времена оповещений пользователя по минутным корзинам."""
+    user_entry = notification_index["users"].setdefault(telegram_id, {"arrival": {}, "departure": {}})
+    buckets = notification_index[kind]
+    for time_str in times:
+        try:
+            minute = time_to_minute(time_str)
+        except (ValueError, TypeError) as e:
+            logger.error("Ошибка парсинга времени %s для пользователя %s: %s", time_str, telegram_id, e,
+                         extra=SAMPLED)
+            continue
+        user_entry[kind][minute] = time_str
+        buckets.setdefault(minute, set()).add(telegram_id)
+
+
+def update_user_index(telegram_id, arrival_notification_times=None, departure_notification_times=None):
+    """Инкрементально обновляет индекс для одного пользователя (None — тип не менялся)."""
+    for journal in _rebuild_journals:
+        journal.append((telegram_id, arrival_notification_times, departure_notification_times))
+    _apply_user_update(telegram_id, arrival_notification_times, departure_notification_times)
+
+
+def _apply_user_update(telegram_id, arrival_notification_times, departure_notification_times):
+    if arrival_notification_times is not None:
+        _remove_from_buckets(telegram_id, "arrival")
+        _add_to_buckets(telegram_id, "arrival", arrival_notification_times)
+    if departure_notification_times is not None:
+        _remove_from_buckets(telegram_id, "departure")
+        _add_to_buckets(telegram_id, "departure", departure_notification_times)
+
+    user_entry = notification_index["users"].get(telegram_id)
+    if user_entry is not None and not user_entry["arrival"] and not user_entry["departure"]:
+        del notification_index["users"][telegram_id]
+
+
+async def build_index(now=None):
+    """
+    Полностью перестраивает индекс по таблице user_settings. Изменения, внесённые через
+    update_user_index, пока запрос ждёт ответа базы, применяются поверх нового индекса.
+    """
+    now = now or datetime.now()
+    journal = []
+    _rebuild_journals.append(journal)
+    try:
+        async with get_async_engine().connect() as connection:
+            query = text("""
+                SELECT telegram_id, arrival_notification_times, departure_notification_times
+                FROM user_settings
+            """)
+            rows = (await connection.execute(query)).mappings().fetchall()
+    finally:
+        _rebuild_journals.remove(journal)
+
+    # Дальше до конца функции нет await: индекс заменяется целиком, без промежуточных состояний
+    notification_index["arrival"] = {}
+    notification_index["departure"] = {}
+    notification_index["users"] = {}
+    for row in rows:
+        telegram_id = row['telegram_id']
+        _apply_user_update(
+            telegram_id,
+            parse_notification_times(row['arrival_notification_times'], telegram_id, 'arrival_notification_times'),
+            parse_notification_times(row['departure_notification_times'], telegram_id, 'departure_notification_times'),
+        )
+    for change in journal:
+        _apply_user_update(*change)
+    notification_index["built_at"] = now
+    logger.info("Индекс оповещений перестроен: пользователей %d, с оповещениями %d, изменений во время чтения %d",
+                len(rows), len(notification_index['users']), len(journal))
+
+
+async def ensure_index(now):
+    """Перестраивает индекс, если он ещё не построен или устарел."""
+    built_at = notification_index["built_at"]
+    if (built_at is None or built_at.date() != now.date()
+            or (now - built_at).total_seconds() >= INDEX_REFRESH_INTERVAL):
+        await build_index(now)
+
+
+def get_due_notifications(current_minute, minutes_range=2):
+    """
+    Возвращает оповещения, попадающие в окно ±minutes_range от текущей минуты.
+    Результат: {telegram_id: {"arrival": [ЧЧ:ММ, ...], "departure": [ЧЧ:ММ, ...]}}.
+    """
+    due = {}
+    first_minute = max(0, current_minute - minutes_range)
+    last_minute = min(MINUTES_IN_DAY - 1, current_minute + minutes_range)
+    users = notification_index["users"]
+    for kind in ("arrival", "departure"):
+        buckets = notification_index[kind]
+        for minute in range(first_minute, last_minute + 1):
+            for telegram_id in buckets.get(minute, ()):
+                entry = due.setdefault(telegram_id, {"arrival": [], "departure": []})
+                entry[kind].append(users[telegram_id][kind][minute])
+    return due
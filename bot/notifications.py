@@ -1,7 +1,5 @@
-import json
 import sys
 import os
-from datetime import datetime
 from telegram.ext import ContextTypes
 from sqlalchemy import text
 import logging
@@ -9,109 +7,120 @@ import logging
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from database.db import engine, user_settings, presence_report, notifications
-
-# Настройка логирования (исправим кодировку позже)
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,
-    handlers=[
-        logging.FileHandler('notifications.log'),
-        logging.StreamHandler()
-    ]
-)
+from database.async_db import get_async_engine
+from bot.status_checker import get_attendance_bulk
+from bot.notification_index import parse_notification_times
+from bot.utils import to_date, local_now
+from bot.sender import message_sender
+from bot.sent_store import sent_store
+from bot.logging_setup import SAMPLED
+from common.metrics import SCHEDULER_TICK_SECONDS, SCHEDULER_USERS_EVALUATED
+from common.profiling import profiled
+
 logger = logging.getLogger(__name__)
 
 
+@SCHEDULER_TICK_SECONDS.timed(job='check_absences')
+@profiled('check_absences')
 async def check_absences(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Проверяет неотмеченный приход, отпуска и отправляет оповещения."""
     # Используем локальное время устройства
-    now = datetime.now()
+    now = local_now()
     current_time = now.strftime('%H:%M')
     current_date = now.strftime('%Y-%m-%d')
 
-    logger.debug(f"Запуск проверки отсутствия отметок и отпусков на {current_date} {current_time}")
+    logger.debug("Запуск проверки отсутствия отметок и отпусков на %s %s", current_date, current_time)
 
-    with engine.connect() as connection:
+    async with get_async_engine().connect() as connection:
         # Получаем всех подписанных пользователей
         query = text("""
             SELECT us.telegram_id, us.employee_id, us.arrival_notification_times, us.vacation_start, us.vacation_end
             FROM user_settings us
             WHERE us.subscribed = TRUE
         """)
-        users = connection.execute(query).mappings().fetchall()
-        logger.debug(f"Найдено подписанных пользователей: {len(users)}")
+        users = (await connection.execute(query)).mappings().fetchall()
+    logger.debug("Найдено подписанных пользователей: %s", len(users))
+    SCHEDULER_USERS_EVALUATED.inc(len(users), job='check_absences')
+
+    # Оставляем пользователей, у которых оповещение о приходе приходится на текущую минуту и нет отпуска
+    due_users = []
+    for user in users:
+        telegram_id = user['telegram_id']
+
+        # Проверяем arrival_notification_times
+        arrival_notification_times = parse_notification_times(
+            user['arrival_notification_times'], telegram_id, 'arrival_notification_times')
+        if current_time not in arrival_notification_times:
+            continue
 
-        for user in users:
-            telegram_id = user['telegram_id']
-            employee_id = user['employee_id']
+        vacation_start = user['vacation_start']
+        vacation_end = user['vacation_end']
 
-            # Проверяем arrival_notification_times
+        # Проверяем, находится ли пользователь в отпуске
+        if vacation_start and vacation_end:
             try:
-                arrival_notification_times = json.loads(user['arrival_notification_times'] or '[]')
-                if not isinstance(arrival_notification_times, list):
-                    logger.warning(
-                        f"Некорректный формат arrival_notification_times для пользователя {telegram_id}: {arrival_notification_times}")
+                start = to_date(vacation_start)
+                end = to_date(vacation_end)
+                current_date_obj = now.date()
+                if start <= current_date_obj <= end:
+                    logger.info("Пользователь %s в отпуске с %s по %s, пропускаем.",
+                                telegram_id, vacation_start, vacation_end, extra=SAMPLED)
                     continue
-            except (json.JSONDecodeError, TypeError) as e:
-                logger.error(f"Ошибка при разборе arrival_notification_times для пользователя {telegram_id}: {e}")
+                else:
+                    logger.debug("Пользователь %s не в отпуске: отпуск с %s по %s",
+                                 telegram_id, vacation_start, vacation_end, extra=SAMPLED)
+            except (ValueError, TypeError) as ve:
+                logger.warning("Неверный формат дат отпуска для пользователя %s: start=%s, end=%s, ошибка: %s",
+                               telegram_id, vacation_start, vacation_end, ve, extra=SAMPLED)
                 continue
+        due_users.append(user)
+    if not due_users:
+        return
 
-            vacation_start = user['vacation_start']
-            vacation_end = user['vacation_end']
-
-            logger.debug(
-                f"Пользователь {telegram_id}: arrival_notification_times={arrival_notification_times}, vacation_start={vacation_start}, vacation_end={vacation_end}")
-
-            # Проверяем, находится ли пользователь в отпуске
-            if vacation_start and vacation_end:
-                try:
-                    start = datetime.strptime(vacation_start, '%Y-%m-%d').date()
-                    end = datetime.strptime(vacation_end, '%Y-%m-%d').date()
-                    current_date_obj = now.date()
-                    if start <= current_date_obj <= end:
-                        logger.info(
-                            f"Пользователь {telegram_id} в отпуске с {vacation_start} по {vacation_end}, пропускаем.")
-                        continue
-                    else:
-                        logger.info(
-                            f"Пользователь {telegram_id} не в отпуске: отпуск с {vacation_start} по {vacation_end}")
-                except ValueError as ve:
-                    logger.warning(
-                        f"Неверный формат дат отпуска для пользователя {telegram_id}: start={vacation_start}, end={vacation_end}, ошибка: {str(ve)}")
-                    continue
+    # Записи о присутствии на сегодня одним запросом только для пользователей с оповещением в эту минуту
+    # (соединение с настройками уже возвращено в пул)
+    attendance = await get_attendance_bulk({user['employee_id'] for user in due_users}, now.date())
 
-            # Проверяем, есть ли запись о присутствии на сегодня
-            query = text("""
-                SELECT start_time, end_time
-                FROM presence_report
-                WHERE employee_id = :employee_id AND date = :date
-            """)
-            result = connection.execute(query, {"employee_id": employee_id, "date": current_date}).mappings().fetchone()
-            logger.debug(f"Запись о присутствии для пользователя {telegram_id} на {current_date}: {result}")
-
-            # Проверяем оповещения о приходе
-            if current_time in arrival_notification_times:
-                if not result or not result['start_time']:
-                    message = f"Оповещение: у тебя нет отметки о приходе на {current_date} в {current_time}."
-                    logger.info(f"Отправка оповещения пользователю {telegram_id}: {message}")
-                    await context.bot.send_message(chat_id=telegram_id, text=message)
-
-                    # Логируем оповещение
-                    query = text("""
-                        INSERT INTO notifications (telegram_id, message, sent_at, status)
-                        VALUES (:telegram_id, :message, :sent_at, :status)
-                    """)
-                    connection.execute(query, {
-                        "telegram_id": telegram_id,
-                        "message": message,
-                        "sent_at": now.strftime('%Y-%m-%d %H:%M:%S'),
-                        "status": "sent"
-                    })
-                    connection.commit()
-                else:
-                    logger.debug(
-                        f"Пользователь {telegram_id} уже отметил приход на {current_date}: {result['start_time']}")
-            else:
-                logger.debug(
-                    f"Время {current_time} не совпадает с arrival_notification_times для пользователя {telegram_id}")
\ No newline at end of file
+    # Оповещения к отправке (аргументы send_message)
+    pending = []
+    for user in due_users:
+        telegram_id = user['telegram_id']
+        result = attendance.get(user['employee_id'])
+        if not result or not result['start_time']:
+            message = f"Оповещение: у тебя нет отметки о приходе на {current_date} в {current_time}."
+            logger.info("Постановка в очередь оповещения пользователю %s: %s", telegram_id, message, extra=SAMPLED)
+            pending.append({"chat_id": telegram_id, "text": message})
+        else:
+            logger.debug("Пользователь %s уже отметил приход на %s: %s",
+                         telegram_id, current_date, result['start_time'], extra=SAMPLED)
+
+    # Отбрасываем оповещения, уже отправленные в эту минуту (например, до перезапуска бота)
+    unsent = set(sent_store.filter_unsent(current_date, [("absence", message['chat_id'], current_time)
+                                                         for message in pending]))
+    pending = [message for message in pending if ("absence", message['chat_id'], current_time) in unsent]
+    if not pending:
+        return
+
+    # Отправляем все оповещения пачкой с ограничением частоты
+    results = await message_sender.send_batch(context.bot, pending, batch_name="check_absences")
+    sent_store.mark_sent(current_date, [("absence", message['chat_id'], current_time)
+                                        for message, (ok, _) in zip(pending, results) if ok])
+
+    # Логируем оповещения одним запросом
+    sent_at = now.replace(microsecond=0)
+    rows = []
+    for message, (ok, error) in zip(pending, results):
+        if not ok:
+            logger.error("Ошибка отправки оповещения пользователю %s: %s", message['chat_id'], error, extra=SAMPLED)
+        rows.append({
+            "telegram_id": message['chat_id'],
+            "message": message['text'],
+            "sent_at": sent_at,
+            "status": "sent" if ok else "failed"
+        })
+    async with get_async_engine().begin() as connection:
+        query = text("""
+            INSERT INTO notifications (telegram_id, message, sent_at, status)
+            VALUES (:telegram_id, :message, :sent_at, :status)
+        """)
+        await connection.execute(query, rows)
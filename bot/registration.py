@@ -8,18 +8,12 @@ from sqlalchemy import text
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from database.db import engine
+from database.async_db import get_async_engine
+from common.metrics import observe_handler
 
-# Настройка логирования только в файл
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,
-    handlers=[
-        logging.FileHandler('register.log', encoding='utf-8')
-    ]
-)
 logger = logging.getLogger(__name__)
 
+@observe_handler
 async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /register для регистрации пользователя."""
     user_id = update.effective_user.id
@@ -28,10 +22,10 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug(f"Получена команда /register от пользователя {user_id}")
 
     try:
-        with engine.connect() as connection:
+        async with get_async_engine().connect() as connection:
             # Проверяем, есть ли пользователь уже в базе
             query = text("SELECT employee_id FROM user_settings WHERE telegram_id = :telegram_id")
-            result = connection.execute(query, {"telegram_id": user_id}).fetchone()
+            result = (await connection.execute(query, {"telegram_id": user_id})).fetchone()
 
             if result:
                 logger.info(f"Пользователь {user_id} уже зарегистрирован")
@@ -46,8 +40,8 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 VALUES (:telegram_id, :employee_id, FALSE, '[]', '[]')
                 ON CONFLICT (telegram_id) DO NOTHING
             """)
-            connection.execute(query, {"telegram_id": user_id, "employee_id": user_id})
-            connection.commit()
+            await connection.execute(query, {"telegram_id": user_id, "employee_id": user_id})
+            await connection.commit()
 
             # Добавляем данные сотрудника в таблицу employees (если нужно)
             query = text("""
@@ -55,8 +49,8 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 VALUES (:id, :first_name, :last_name)
                 ON CONFLICT (id) DO NOTHING
             """)
-            connection.execute(query, {"id": user_id, "first_name": first_name, "last_name": last_name})
-            connection.commit()
+            await connection.execute(query, {"id": user_id, "first_name": first_name, "last_name": last_name})
+            await connection.commit()
 
             logger.info(f"Пользователь {user_id} успешно зарегистрирован")
             await update.message.reply_text(
@@ -2,220 +2,162 @@ import logging
 import sys
 import os
 from datetime import datetime, date
-from sqlalchemy import text
-import json
+from sqlalchemy import text, bindparam
 
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from database.db import engine
-from bot.status_checker import get_attendance
-
-# Настройка логирования в файл и консоль
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,
-    handlers=[
-        logging.FileHandler('scheduler.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# Глобальное хранилище для отслеживания отправленных уведомлений
-sent_notifications = {
-    "last_date": None,  # Последняя дата, для которой отправлялись уведомления
-    "arrival": {},  # Уведомления о приходе: {telegram_id: {arrival_time: bool}}
-    "departure": {}  # Уведомления об уходе: {telegram_id: {departure_time: bool}}
-}
+from database.async_db import get_async_engine
+from bot.status_checker import get_attendance_bulk
+from bot.notification_index import ensure_index, get_due_notifications
+from bot.sender import message_sender
+from bot.sent_store import sent_store
+from bot.utils import local_now as get_local_now
+from bot.logging_setup import SAMPLED
+from common.metrics import SCHEDULER_TICK_SECONDS, SCHEDULER_USERS_EVALUATED
+from common.profiling import profiled
 
-def time_within_range(current_time_str, target_time_str, minutes_range=2):
-    """Проверяет, находится ли текущее время в заданном диапазоне (±minutes_range) от целевого."""
-    try:
-        current = datetime.strptime(current_time_str, '%H:%M')
-        target = datetime.strptime(target_time_str, '%H:%M')
-        delta = abs((current - target).total_seconds())
-        logger.debug(
-            f"time_within_range: current={current_time_str}, target={target_time_str}, delta={delta}, result={delta <= minutes_range * 60}")
-        return delta <= minutes_range * 60  # Сравниваем в секундах
-    except ValueError as e:
-        logger.error(f"Ошибка парсинга времени: current={current_time_str}, target={target_time_str}, ошибка: {e}")
-        return False
+logger = logging.getLogger(__name__)
 
+@SCHEDULER_TICK_SECONDS.timed(job='send_notification')
+@profiled('send_notification')
 async def send_notification(context):
     """Отправляет уведомления пользователям на основе их настроек, используя локальное время устройства."""
     logger.debug("Проверка: функция send_notification запущена")
-    logger.debug(f"Контекст: {context}")
 
     # Получаем текущее локальное время устройства
-    local_now = datetime.now()  # Локальное время устройства
-    logger.debug(f"Текущее локальное время устройства: {local_now.strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.debug(f"Часовой пояс устройства: {local_now.astimezone().tzinfo}")
+    local_now = get_local_now()  # Локальное время устройства
+    logger.debug("Текущее локальное время устройства: %s", local_now)
 
     # Используем локальное время устройства
     current_time = local_now.strftime('%H:%M')  # Текущее время в формате ЧЧ:ММ
     current_date = local_now.date()  # Текущая дата как объект date
     current_date_str = local_now.strftime('%Y-%m-%d')  # Текущая дата как строка
 
-    # Проверяем, сменился ли день; если да, сбрасываем хранилище уведомлений
-    global sent_notifications
-    if sent_notifications["last_date"] != current_date_str:
-        logger.debug(
-            f"Смена даты: {sent_notifications['last_date']} -> {current_date_str}, сбрасываем хранилище уведомлений")
-        sent_notifications = {
-            "last_date": current_date_str,
-            "arrival": {},
-            "departure": {}
-        }
-
     try:
-        with engine.connect() as connection:
-            # Получаем настройки пользователей (без таймзоны)
+        # Берём из индекса только пользователей, у которых оповещение попадает в окно ±2 минуты
+        await ensure_index(local_now)
+        due_notifications = get_due_notifications(local_now.hour * 60 + local_now.minute)
+        if not due_notifications:
+            logger.debug("Нет оповещений в окне вокруг %s", current_time)
+            return
+
+        # Уведомления к отправке: (тип, telegram_id, время оповещения, аргументы send_message)
+        pending = []
+        async with get_async_engine().connect() as connection:
+            # Получаем настройки только для пользователей из окна (без таймзоны)
             query = text("""
-                SELECT us.telegram_id, us.employee_id, us.subscribed, us.arrival_notification_times, 
-                       us.departure_notification_times, us.vacation_start, us.vacation_end
+                SELECT us.telegram_id, us.employee_id, us.subscribed, us.vacation_start, us.vacation_end
                 FROM user_settings us
                 JOIN employees e ON us.employee_id = e.id
-            """)
-            users = connection.execute(query).mappings().fetchall()
-            logger.debug(f"Найдено пользователей: {len(users)}")
-            for user in users:
-                logger.debug(f"Пользователь: {user}")
-                telegram_id = user['telegram_id']
-                employee_id = user['employee_id']
-                subscribed = user['subscribed']
-                vacation_start = user['vacation_start']
-                vacation_end = user['vacation_end']
-
-                logger.debug(f"Обработка пользователя {telegram_id}")
-
-                # Парсим списки уведомлений
-                try:
-                    arrival_notification_times = json.loads(user['arrival_notification_times'] or '[]')
-                    if not isinstance(arrival_notification_times, list):
-                        logger.warning(
-                            f"Некорректный формат arrival_notification_times для пользователя {telegram_id}: {arrival_notification_times}")
-                        arrival_notification_times = []
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.error(f"Ошибка при разборе arrival_notification_times для пользователя {telegram_id}: {e}")
-                    arrival_notification_times = []
-
+                WHERE us.telegram_id IN :telegram_ids
+            """).bindparams(bindparam("telegram_ids", expanding=True))
+            users = (await connection.execute(query, {"telegram_ids": list(due_notifications)})).mappings().fetchall()
+            logger.debug("Найдено пользователей в окне оповещений: %s", len(users))
+            SCHEDULER_USERS_EVALUATED.inc(len(users), job='send_notification')
+
+        # Получаем записи о посещении за сегодня одним запросом для всех пользователей из окна
+        # (после возврата первого соединения в пул: тик не держит два соединения одновременно)
+        try:
+            attendance = await get_attendance_bulk({user['employee_id'] for user in users}, current_date)
+        except Exception as e:
+            logger.error("Ошибка в get_attendance_bulk на дату %s: %s", current_date_str, e)
+            attendance = {}
+
+        for user in users:
+            telegram_id = user['telegram_id']
+            employee_id = user['employee_id']
+            subscribed = user['subscribed']
+            vacation_start = user['vacation_start']
+            vacation_end = user['vacation_end']
+
+            arrival_notification_times = due_notifications[telegram_id]["arrival"]
+            departure_notification_times = due_notifications[telegram_id]["departure"]
+
+            # Проверяем подписку
+            if not subscribed:
+                logger.debug("Пользователь %s не подписан на уведомления.", telegram_id, extra=SAMPLED)
+                continue
+
+            # Проверяем, находится ли пользователь в отпуске
+            if vacation_start:  # Проверяем, задан ли vacation_start
                 try:
-                    departure_notification_times = json.loads(user['departure_notification_times'] or '[]')
-                    if not isinstance(departure_notification_times, list):
-                        logger.warning(
-                            f"Некорректный формат departure_notification_times для пользователя {telegram_id}: {departure_notification_times}")
-                        departure_notification_times = []
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.error(f"Ошибка при разборе departure_notification_times для пользователя {telegram_id}: {e}")
-                    departure_notification_times = []
-
-                logger.debug(f"Пользователь {telegram_id}, локальное время: {current_time}, дата: {current_date_str}")
-
-                # Проверяем подписку
-                if not subscribed:
-                    logger.debug(f"Пользователь {telegram_id} не подписан на уведомления.")
-                    continue
-
-                # Проверяем, находится ли пользователь в отпуске
-                in_vacation = False
-                if vacation_start:  # Проверяем, задан ли vacation_start
-                    try:
-                        # Проверяем тип vacation_start
-                        if isinstance(vacation_start, date):
-                            start_date = vacation_start
-                        else:
-                            start_date = datetime.strptime(vacation_start, '%Y-%m-%d').date()
-
-                        # Проверяем тип vacation_end
-                        if vacation_end:
-                            if isinstance(vacation_end, date):
-                                end_date = vacation_end
-                            else:
-                                end_date = datetime.strptime(vacation_end, '%Y-%m-%d').date()
+                    # Проверяем тип vacation_start
+                    if isinstance(vacation_start, date):
+                        start_date = vacation_start
+                    else:
+                        start_date = datetime.strptime(vacation_start, '%Y-%m-%d').date()
+
+                    # Проверяем тип vacation_end
+                    if vacation_end:
+                        if isinstance(vacation_end, date):
+                            end_date = vacation_end
                         else:
-                            end_date = None
-
-                        # Проверяем, находится ли текущая дата в периоде отпуска
-                        if start_date <= current_date and (end_date is None or current_date <= end_date):
-                            in_vacation = True
-                            logger.debug(
-                                f"Пользователь {telegram_id} в отпуске с {start_date} по {end_date or 'не указано'}, уведомления не отправляются.")
-                            continue
-                    except ValueError as e:
-                        logger.error(f"Ошибка парсинга дат отпуска для пользователя {telegram_id}: {e}")
+                            end_date = datetime.strptime(vacation_end, '%Y-%m-%d').date()
+                    else:
+                        end_date = None
+
+                    # Проверяем, находится ли текущая дата в периоде отпуска
+                    if start_date <= current_date and (end_date is None or current_date <= end_date):
+                        logger.debug("Пользователь %s в отпуске с %s по %s, уведомления не отправляются.",
+                                     telegram_id, start_date, end_date or 'не указано', extra=SAMPLED)
                         continue
+                except ValueError as e:
+                    logger.error("Ошибка парсинга дат отпуска для пользователя %s: %s", telegram_id, e)
+                    continue
 
-                # Получаем статус посещения один раз для использования в обоих циклах
-                try:
-                    status = get_attendance(telegram_id, current_date_str)
-                    logger.debug(f"Статус посещения для пользователя {telegram_id}: {status}")
-                except Exception as e:
-                    logger.error(f"Ошибка в get_attendance для пользователя {telegram_id}: {e}")
-                    status = "Неизвестно"
-
-                # Проверяем, есть ли данные о приходе (start_time)
-                has_arrival = False
-                if status and "Начало: " in status:
-                    start_time_str = status.split("Начало: ")[1].split(",")[0].strip()
-                    if start_time_str != "не указано":
-                        has_arrival = True
-                        logger.debug(
-                            f"Пользователь {telegram_id} уже отметился в {start_time_str}, уведомления о приходе не отправляются.")
-
-                # Инициализируем хранилище для пользователя, если его нет
-                if telegram_id not in sent_notifications["arrival"]:
-                    sent_notifications["arrival"][telegram_id] = {}
-                if telegram_id not in sent_notifications["departure"]:
-                    sent_notifications["departure"][telegram_id] = {}
-
-                # Проверяем уведомления о приходе
-                logger.debug(
-                    f"Проверка уведомлений о приходе для пользователя {telegram_id}: {arrival_notification_times}")
-                for arrival_time in arrival_notification_times:
-                    if time_within_range(current_time, arrival_time):
-                        if has_arrival:
-                            logger.info(
-                                f"Уведомление о приходе для пользователя {telegram_id} в {arrival_time} не отправлено, так как пользователь уже отметился.")
-                            continue
-                        # Проверяем, отправляли ли уже это уведомление
-                        if sent_notifications["arrival"][telegram_id].get(arrival_time, False):
-                            logger.debug(
-                                f"Уведомление о приходе для пользователя {telegram_id} в {arrival_time} уже было отправлено ранее.")
-                            continue
-                        logger.info(f"Отправка уведомления о приходе для пользователя {telegram_id} в {arrival_time}")
-                        # Обновлённый формат сообщения
-                        message = "⏰ Не забудьте отметиться перед началом рабочего дня!"
-                        try:
-                            await context.bot.send_message(chat_id=telegram_id, text=message)
-                            logger.debug(f"Уведомление о приходе успешно отправлено пользователю {telegram_id}")
-                            # Отмечаем, что уведомление отправлено
-                            sent_notifications["arrival"][telegram_id][arrival_time] = True
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки уведомления о приходе пользователю {telegram_id}: {e}")
-
-                # Проверяем уведомления об уходе
-                logger.debug(
-                    f"Проверка уведомлений об уходе для пользователя {telegram_id}: {departure_notification_times}")
-                for departure_time in departure_notification_times:
-                    if time_within_range(current_time, departure_time):
-                        # Проверяем, отправляли ли уже это уведомление
-                        if sent_notifications["departure"][telegram_id].get(departure_time, False):
-                            logger.debug(
-                                f"Уведомление об уходе для пользователя {telegram_id} в {departure_time} уже было отправлено ранее.")
-                            continue
-                        logger.info(f"Отправка уведомления об уходе для пользователя {telegram_id} в {departure_time}")
-                        message = f"🚪 Не забудьте отметиться перед уходом в {departure_time}!"
-                        try:
-                            await context.bot.send_message(chat_id=telegram_id, text=message)
-                            logger.debug(f"Уведомление об уходе успешно отправлено пользователю {telegram_id}")
-                            # Отмечаем, что уведомление отправлено
-                            sent_notifications["departure"][telegram_id][departure_time] = True
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки уведомления об уходе пользователю {telegram_id}: {e}")
+            # Проверяем, есть ли данные о приходе (start_time)
+            record = attendance.get(employee_id)
+            has_arrival = bool(record and record['start_time'])
+            if has_arrival:
+                logger.debug("Пользователь %s уже отметился в %s, уведомления о приходе не отправляются.",
+                             telegram_id, record['start_time'], extra=SAMPLED)
+
+            # Проверяем уведомления о приходе (индекс уже отобрал времена в окне ±2 минуты)
+            for arrival_time in arrival_notification_times:
+                if has_arrival:
+                    logger.info("Уведомление о приходе для пользователя %s в %s не отправлено, "
+                                "так как пользователь уже отметился.", telegram_id, arrival_time, extra=SAMPLED)
+                    continue
+                # Обновлённый формат сообщения
+                message = "⏰ Не забудьте отметиться перед началом рабочего дня!"
+                pending.append(("arrival", telegram_id, arrival_time, {"chat_id": telegram_id, "text": message}))
+
+            # Проверяем уведомления об уходе (индекс уже отобрал времена в окне ±2 минуты)
+            for departure_time in departure_notification_times:
+                message = f"🚪 Не забудьте отметиться перед уходом в {departure_time}!"
+                pending.append(("departure", telegram_id, departure_time, {"chat_id": telegram_id, "text": message}))
+
+        # Отбрасываем уведомления, уже отправленные сегодня (в том числе до перезапуска бота)
+        unsent = set(sent_store.filter_unsent(current_date_str, [(kind, telegram_id, notification_time)
+                                                                 for kind, telegram_id, notification_time, _ in pending]))
+        for kind, telegram_id, notification_time, _ in pending:
+            kind_text = "о приходе" if kind == "arrival" else "об уходе"
+            if (kind, telegram_id, notification_time) in unsent:
+                logger.info("Отправка уведомления %s для пользователя %s в %s",
+                            kind_text, telegram_id, notification_time, extra=SAMPLED)
+            else:
+                logger.debug("Уведомление %s для пользователя %s в %s уже было отправлено ранее.",
+                             kind_text, telegram_id, notification_time, extra=SAMPLED)
+        pending = [item for item in pending if item[:3] in unsent]
+
+        # Отправляем все уведомления тика пачкой с ограничением частоты (соединение с БД уже закрыто)
+        results = await message_sender.send_batch(
+            context.bot, [message for _, _, _, message in pending], batch_name="send_notification")
+        delivered = []
+        for (kind, telegram_id, notification_time, _), (ok, error) in zip(pending, results):
+            kind_text = "о приходе" if kind == "arrival" else "об уходе"
+            if ok:
+                logger.debug("Уведомление %s успешно отправлено пользователю %s", kind_text, telegram_id, extra=SAMPLED)
+                delivered.append((kind, telegram_id, notification_time))
+            else:
+                logger.error("Ошибка отправки уведомления %s пользователю %s: %s", kind_text, telegram_id, error,
+                             extra=SAMPLED)
+        # Отмечаем отправленные уведомления в журнале на диске
+        sent_store.mark_sent(current_date_str, delivered)
 
     except Exception as e:
-        logger.error(f"Ошибка в send_notification: {str(e)}")
+        logger.error("Ошибка в send_notification: %s", e)
         raise
 
 def setup_scheduler(app):
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from telegram.error import RetryAfter, TimedOut, NetworkError
+from bot.logging_setup import SAMPLED
+from common.metrics import MESSAGES_SENT
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram Bot API
+GLOBAL_RATE_LIMIT = 30  # Не более ~30 сообщений в секунду на бота
+PER_CHAT_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один чат
+MAX_CONCURRENCY = 20  # Максимум одновременных запросов send_message
+MAX_RETRIES = 3  # Повторы при RetryAfter и сетевых ошибках
+RETRY_BACKOFF = 1.0  # Базовая задержка экспоненциального повтора для сетевых ошибок, секунды
+
+
+class RateLimiter:
+    """Ограничитель частоты по алгоритму token bucket с возможностью глобальной паузы."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Приостанавливает выдачу токенов (например, после RetryAfter от Telegram)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ждёт, пока не освободится токен на отправку одного сообщения."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessageSender:
+    """Конкурентная отправка сообщений с учётом глобального и поканального лимитов Telegram."""
+
+    def __init__(self, rate=GLOBAL_RATE_LIMIT, per_chat_interval=PER_CHAT_INTERVAL,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.limiter = RateLimiter(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # chat_id -> [замок, число сообщений в очереди]; запись удаляется вместе с последним сообщением
+        self._chat_locks = {}
+        # chat_id -> время последней отправки; устаревшие записи удаляются в конце send_batch
+        self._chat_last_sent = {}
+
+    async def _wait_chat_slot(self, chat_id):
+        """Выдерживает минимальный интервал между сообщениями в один чат."""
+        last_sent = self._chat_last_sent.get(chat_id)
+        if last_sent is not None:
+            delay = last_sent + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _send_one(self, bot, message, semaphore):
+        """Отправляет одно сообщение с повторами. Возвращает (успех, ошибка, задержка в секундах)."""
+        chat_id = message['chat_id']
+        queued_at = time.monotonic()
+        chat_queue = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        chat_queue[1] += 1
+        try:
+            async with chat_queue[0], semaphore:
+                return await self._deliver(bot, message, queued_at)
+        finally:
+            chat_queue[1] -= 1
+            if not chat_queue[1]:
+                del self._chat_locks[chat_id]
+
+    async def _deliver(self, bot, message, queued_at):
+        """Попытки отправки одного сообщения; вызывается под замком чата."""
+        chat_id = message['chat_id']
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat_slot(chat_id)
+            await self.limiter.acquire()
+            try:
+                await bot.send_message(**message)
+                self._chat_last_sent[chat_id] = time.monotonic()
+                return True, None, time.monotonic() - queued_at
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning("Flood control для чата %s: повтор через %s с (попытка %s/%s)",
+                               chat_id, retry_after, attempt + 1, self.max_retries + 1, extra=SAMPLED)
+                # Telegram ограничивает бота целиком, поэтому притормаживаем все отправки
+                self.limiter.pause(retry_after)
+                error = e
+            except (TimedOut, NetworkError) as e:
+                logger.warning("Сетевая ошибка при отправке в чат %s: %s (попытка %s/%s)",
+                               chat_id, e, attempt + 1, self.max_retries + 1, extra=SAMPLED)
+                error = e
+                if attempt < self.max_retries:
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+            except Exception as e:
+                # Ошибки вроде Forbidden/BadRequest повторять бессмысленно
+                return False, e, time.monotonic() - queued_at
+        return False, error, time.monotonic() - queued_at
+
+    def _forget_idle_chats(self):
+        """Удаляет время отправки в чаты, для которых минимальный интервал уже истёк."""
+        expired_before = time.monotonic() - self.per_chat_interval
+        for chat_id in [chat_id for chat_id, sent_at in self._chat_last_sent.items() if sent_at <= expired_before]:
+            del self._chat_last_sent[chat_id]
+
+    async def send_batch(self, bot, messages, batch_name="batch"):
+        """
+        Отправляет пачку сообщений (словари с аргументами send_message, минимум chat_id и text).
+        Возвращает список (успех, ошибка) в том же порядке, что и messages.
+        """
+        if not messages:
+            return []
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started_at = time.monotonic()
+        results = await asyncio.gather(*(self._send_one(bot, message, semaphore) for message in messages))
+        elapsed = time.monotonic() - started_at
+        self._forget_idle_chats()
+
+        latencies = sorted(latency for _, _, latency in results)
+        sent = sum(1 for ok, _, _ in results if ok)
+        failed = len(results) - sent
+        MESSAGES_SENT.inc(sent, batch=batch_name, status='sent')
+        MESSAGES_SENT.inc(failed, batch=batch_name, status='failed')
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        throughput = sent / elapsed if elapsed > 0 else float(sent)
+        logger.info("Отправка %s: всего %d, успешно %d, ошибок %d, за %.2f с (%.1f сообщ./с), "
+                    "задержка p50=%.2f с, p99=%.2f с, max=%.2f с", batch_name, len(messages), sent, failed,
+                    elapsed, throughput, p50, p99, latencies[-1])
+        return [(ok, error) for ok, error, _ in results]
+
+
+# Общий отправитель для всех задач бота, чтобы лимиты Telegram соблюдались суммарно
+message_sender = MessageSender()
@@ -0,0 +1,96 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Каталог с журналами отправленных уведомлений (по одному файлу на дату)
+SENT_STORE_DIR = os.getenv('SENT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sent_notifications'))
+
+
+class SentNotificationStore:
+    """
+    Журнал отправленных уведомлений, переживающий перезапуск бота.
+    Хранится как append-only файл на каждый день: одна строка "тип<TAB>telegram_id<TAB>ЧЧ:ММ"
+    на уведомление. Журналы прошлых дней удаляются при смене даты.
+    """
+
+    def __init__(self, directory=SENT_STORE_DIR):
+        self.directory = directory
+        self.current_date = None
+        self.keys = set()
+        self._file = None
+
+    def _path(self, date_str):
+        return os.path.join(self.directory, f"{date_str}.log")
+
+    def _load(self, path):
+        """Читает журнал дня; недописанная при падении последняя строка пропускается."""
+        keys = set()
+        if not os.path.exists(path):
+            return keys
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    logger.warning(f"Пропущена недописанная строка журнала {path}: {line!r}")
+                    continue
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 3:
+                    continue
+                kind, telegram_id, notification_time = parts
+                try:
+                    keys.add((kind, int(telegram_id), notification_time))
+                except ValueError:
+                    logger.warning(f"Некорректная строка журнала {path}: {line!r}")
+        return keys
+
+    def _prune(self, keep_date_str):
+        """Удаляет журналы всех дней, кроме текущего."""
+        keep_name = os.path.basename(self._path(keep_date_str))
+        for name in os.listdir(self.directory):
+            if name.endswith('.log') and name != keep_name:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    logger.info(f"Удалён журнал отправленных уведомлений {name}")
+                except OSError as e:
+                    logger.error(f"Не удалось удалить журнал {name}: {e}")
+
+    def _switch_date(self, date_str):
+        """Переключает хранилище на журнал указанного дня."""
+        if self.current_date == date_str:
+            return
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(date_str)
+        self.keys = self._load(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        # Если процесс упал посреди записи, начинаем с новой строки, чтобы не склеить записи
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+        self.current_date = date_str
+        self._prune(date_str)
+        logger.info(f"Журнал отправленных уведомлений за {date_str}: загружено записей {len(self.keys)}")
+
+    def filter_unsent(self, date_str, keys):
+        """Возвращает ключи (тип, telegram_id, время), по которым уведомление за день ещё не отправлялось."""
+        self._switch_date(date_str)
+        return [key for key in keys if key not in self.keys]
+
+    def mark_sent(self, date_str, keys):
+        """Записывает отправленные уведомления в журнал и сбрасывает его на диск."""
+        self._switch_date(date_str)
+        keys = [key for key in set(keys) if key not in self.keys]
+        if not keys:
+            return
+        self._file.write(''.join(f"{kind}\t{telegram_id}\t{notification_time}\n"
+                                 for kind, telegram_id, notification_time in keys))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.keys.update(keys)
+
+
+# Общее хранилище для задач планировщика
+sent_store = SentNotificationStore()
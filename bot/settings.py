@@ -3,6 +3,7 @@ import logging
 import sys
 import os
 import re
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from sqlalchemy import text
@@ -11,152 +12,144 @@ from datetime import datetime
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from database.db import engine
-from bot.utils import INPUT_VACATION_START, INPUT_VACATION_END, INPUT_ARRIVAL_NOTIFICATION_TIME, INPUT_DEPARTURE_NOTIFICATION_TIME
+from database.async_db import get_async_engine
+from bot.notification_index import update_user_index, parse_notification_times
+from bot.utils import to_date, INPUT_VACATION_START, INPUT_VACATION_END, INPUT_ARRIVAL_NOTIFICATION_TIME, INPUT_DEPARTURE_NOTIFICATION_TIME
 
-# Настройка логирования в консоль PyCharm
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG,
-    handlers=[
-        logging.StreamHandler(sys.stdout)  # Логирование в консоль
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def get_user_settings(telegram_id):
-    """Получает настройки пользователя из базы данных."""
+# Время жизни записи кэша настроек в секундах. Изменения через бота попадают в кэш сразу
+# (write-through), TTL ограничивает устаревание при изменениях в обход бота (ETL, ручные правки)
+SETTINGS_CACHE_TTL = 60
+
+# Кэш настроек: {telegram_id: (момент устаревания, (subscribed, vacation_start, vacation_end, arrival, departure))}
+settings_cache = {}
+
+SETTINGS_COLUMNS = "subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times"
+
+
+def _row_to_settings(telegram_id, row):
+    """Преобразует строку user_settings в кортеж настроек с разобранными списками времён."""
+    return (
+        row['subscribed'],
+        row['vacation_start'],
+        row['vacation_end'],
+        parse_notification_times(row['arrival_notification_times'], telegram_id, 'arrival_notification_times'),
+        parse_notification_times(row['departure_notification_times'], telegram_id, 'departure_notification_times'),
+    )
+
+
+def _cache_settings(telegram_id, settings):
+    settings_cache[telegram_id] = (time.monotonic() + SETTINGS_CACHE_TTL, settings)
+
+
+def _copy_settings(settings):
+    # Обработчики меняют списки времён на месте, поэтому наружу отдаём копии
+    subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = settings
+    return subscribed, vacation_start, vacation_end, list(arrival_notification_times), list(departure_notification_times)
+
+
+def invalidate_user_settings(telegram_id=None):
+    """Сбрасывает кэш настроек пользователя (или всех пользователей, если telegram_id не указан)."""
+    if telegram_id is None:
+        settings_cache.clear()
+    else:
+        settings_cache.pop(telegram_id, None)
+
+
+async def get_user_settings(telegram_id):
+    """Получает настройки пользователя (из кэша, при промахе — из базы данных)."""
+    cached = settings_cache.get(telegram_id)
+    if cached is not None:
+        expires_at, settings = cached
+        if time.monotonic() < expires_at:
+            return _copy_settings(settings)
+        del settings_cache[telegram_id]
+
     try:
-        with engine.connect() as conn:
-            query = text("""
-                SELECT subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times
+        async with get_async_engine().connect() as conn:
+            query = text(f"""
+                SELECT {SETTINGS_COLUMNS}
                 FROM user_settings
                 WHERE telegram_id = :telegram_id
             """)
-            result = conn.execute(query, {"telegram_id": telegram_id}).mappings().fetchone()
-            logger.debug(f"Результат запроса настроек для пользователя {telegram_id}: {result}")
+            result = (await conn.execute(query, {"telegram_id": telegram_id})).mappings().fetchone()
+            logger.debug("Настройки пользователя %s прочитаны из базы (найдены: %s)", telegram_id, result is not None)
 
             if not result:
-                logger.warning(f"Пользователь {telegram_id} не найден в базе данных")
+                # Отсутствие пользователя не кэшируем: он может зарегистрироваться в любой момент
+                logger.warning("Пользователь %s не найден в базе данных", telegram_id)
                 return False, None, None, [], []
 
-            subscribed = result['subscribed']
-            vacation_start = result['vacation_start']
-            vacation_end = result['vacation_end']
-
-            try:
-                arrival_notification_times = json.loads(result['arrival_notification_times'] or '[]')
-                if not isinstance(arrival_notification_times, list):
-                    logger.warning(f"Некорректный формат arrival_notification_times для пользователя {telegram_id}: {arrival_notification_times}")
-                    arrival_notification_times = []
-            except (json.JSONDecodeError, TypeError) as e:
-                logger.error(f"Ошибка при разборе arrival_notification_times для пользователя {telegram_id}: {e}")
-                arrival_notification_times = []
-
-            try:
-                departure_notification_times = json.loads(result['departure_notification_times'] or '[]')
-                if not isinstance(departure_notification_times, list):
-                    logger.warning(f"Некорректный формат departure_notification_times для пользователя {telegram_id}: {departure_notification_times}")
-                    departure_notification_times = []
-            except (json.JSONDecodeError, TypeError) as e:
-                logger.error(f"Ошибка при разборе departure_notification_times для пользователя {telegram_id}: {e}")
-                departure_notification_times = []
-
-            return subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times
+            settings = _row_to_settings(telegram_id, result)
+            _cache_settings(telegram_id, settings)
+            return _copy_settings(settings)
 
     except Exception as e:
-        logger.error(f"Ошибка в get_user_settings для пользователя {telegram_id}: {str(e)}")
+        logger.error("Ошибка в get_user_settings для пользователя %s: %s", telegram_id, e)
         raise
 
-def update_user_settings(telegram_id, subscribed=None, vacation_start=..., vacation_end=..., arrival_notification_times=None, departure_notification_times=None):
-    """Обновляет настройки пользователя в базе данных."""
-    try:
-        with engine.connect() as conn:
-            # Проверяем, существует ли пользователь
-            query = text("SELECT 1 FROM user_settings WHERE telegram_id = :telegram_id")
-            result = conn.execute(query, {"telegram_id": telegram_id}).fetchone()
-            if not result:
-                logger.warning(f"Пользователь {telegram_id} не найден, невозможно обновить настройки")
-                return False
+async def update_user_settings(telegram_id, subscribed=None, vacation_start=..., vacation_end=..., arrival_notification_times=None, departure_notification_times=None):
+    """Обновляет настройки пользователя одним запросом UPDATE ... RETURNING и обновляет кэш."""
+    updates = {}
+    params = {"telegram_id": telegram_id}
 
-            updates = {}
-            params = {"telegram_id": telegram_id}
+    if subscribed is not None:
+        updates["subscribed"] = "subscribed = :subscribed"
+        params["subscribed"] = subscribed
 
-            # Флаг, чтобы понять, обновляем ли мы vacation_start или vacation_end
-            updating_vacation = False
+    # vacation_start и vacation_end обрабатываются даже если передан None (... используется как sentinel)
+    if vacation_start is not ...:
+        updates["vacation_start"] = "vacation_start = :vacation_start"
+        params["vacation_start"] = to_date(vacation_start)
 
-            if subscribed is not None:
-                updates["subscribed"] = "subscribed = :subscribed"
-                params["subscribed"] = subscribed
+    if vacation_end is not ...:
+        updates["vacation_end"] = "vacation_end = :vacation_end"
+        params["vacation_end"] = to_date(vacation_end)
 
-            # Изменил логику: теперь vacation_start и vacation_end обрабатываются даже если передан None
-            if vacation_start is not ...:  # Проверяем, был ли передан параметр (используем ... как sentinel)
-                updates["vacation_start"] = "vacation_start = :vacation_start"
-                params["vacation_start"] = vacation_start
-                updating_vacation = True
+    if arrival_notification_times is not None:
+        updates["arrival_notification_times"] = "arrival_notification_times = :arrival_notification_times"
+        params["arrival_notification_times"] = json.dumps(arrival_notification_times)
 
-            if vacation_end is not ...:
-                updates["vacation_end"] = "vacation_end = :vacation_end"
-                params["vacation_end"] = vacation_end
-                updating_vacation = True
+    if departure_notification_times is not None:
+        updates["departure_notification_times"] = "departure_notification_times = :departure_notification_times"
+        params["departure_notification_times"] = json.dumps(departure_notification_times)
 
-            if arrival_notification_times is not None:
-                updates["arrival_notification_times"] = "arrival_notification_times = :arrival_notification_times"
-                params["arrival_notification_times"] = json.dumps(arrival_notification_times)
+    if not updates:
+        logger.warning("Нет данных для обновления настроек пользователя %s", telegram_id)
+        return False
 
-            if departure_notification_times is not None:
-                updates["departure_notification_times"] = "departure_notification_times = :departure_notification_times"
-                params["departure_notification_times"] = json.dumps(departure_notification_times)
+    try:
+        update_clause = ", ".join(updates.values())
+        query = text(f"""
+            UPDATE user_settings
+            SET {update_clause}
+            WHERE telegram_id = :telegram_id
+            RETURNING {SETTINGS_COLUMNS}
+        """)
+        async with get_async_engine().begin() as conn:
+            result = (await conn.execute(query, params)).mappings().fetchone()
+    except Exception as e:
+        invalidate_user_settings(telegram_id)
+        logger.error("Ошибка в update_user_settings для пользователя %s: %s", telegram_id, e)
+        return False
 
-            if not updates:
-                logger.warning(f"Нет данных для обновления настроек пользователя {telegram_id}")
-                return False
+    if not result:
+        invalidate_user_settings(telegram_id)
+        logger.warning("Пользователь %s не найден, невозможно обновить настройки", telegram_id)
+        return False
 
-            update_clause = ", ".join(updates.values())
-            query = text(f"""
-                UPDATE user_settings
-                SET {update_clause}
-                WHERE telegram_id = :telegram_id
-            """)
-            logger.debug(f"Выполняется запрос обновления для пользователя {telegram_id}: {query}, параметры: {params}")
-            conn.execute(query, params)
-            conn.commit()  # Явно фиксируем транзакцию
-            logger.info(f"Настройки пользователя {telegram_id} успешно обновлены: {params}")
-
-            # Проверка после обновления
-            query = text("""
-                SELECT subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times
-                FROM user_settings
-                WHERE telegram_id = :telegram_id
-            """)
-            result = conn.execute(query, {"telegram_id": telegram_id}).mappings().fetchone()
-            logger.debug(f"Проверка после обновления для пользователя {telegram_id}: {result}")
-
-            # Проверяем сброс vacation_start и vacation_end только если мы их обновляли
-            if updating_vacation and vacation_start is None and vacation_end is None:
-                if result['vacation_start'] is not None or result['vacation_end'] is not None:
-                    logger.error(f"Ошибка: vacation_start или vacation_end не сброшены в NULL для пользователя {telegram_id}: {result}")
-                    return False
-
-            # Проверяем, что arrival_notification_times обновлены
-            if arrival_notification_times is not None:
-                updated_arrival_times = json.loads(result['arrival_notification_times'] or '[]')
-                if updated_arrival_times != arrival_notification_times:
-                    logger.error(f"Ошибка: arrival_notification_times не обновлены для пользователя {telegram_id}. Ожидалось: {arrival_notification_times}, получено: {updated_arrival_times}")
-                    return False
-
-            # Проверяем, что departure_notification_times обновлены
-            if departure_notification_times is not None:
-                updated_departure_times = json.loads(result['departure_notification_times'] or '[]')
-                if updated_departure_times != departure_notification_times:
-                    logger.error(f"Ошибка: departure_notification_times не обновлены для пользователя {telegram_id}. Ожидалось: {departure_notification_times}, получено: {updated_departure_times}")
-                    return False
-
-            return True
+    # Значения (даты отпуска, времена оповещений) в лог не пишутся — только изменённые поля
+    logger.info("Настройки пользователя %s успешно обновлены: %s", telegram_id, ", ".join(updates))
 
-    except Exception as e:
-        logger.error(f"Ошибка в update_user_settings для пользователя {telegram_id}: {str(e)}")
-        return False
+    # Записываем сохранённые значения в кэш, чтобы следующий показ меню не ходил в базу
+    settings = _row_to_settings(telegram_id, result)
+    _cache_settings(telegram_id, settings)
+
+    # Инкрементально обновляем индекс оповещений планировщика
+    update_user_index(telegram_id, arrival_notification_times=arrival_notification_times,
+                      departure_notification_times=departure_notification_times)
+    return True
 
 def create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times):
     """Создаёт главное меню с текущими настройками пользователя."""
@@ -195,17 +188,17 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug(f"Получен callback-запрос от пользователя {user_id}: callback_data={callback_data}")
 
     try:
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
 
         if callback_data == 'toggle_subscription':
             logger.info(f"Пользователь {user_id} нажал кнопку 'Подписка на рассылку'. Действие: переключение статуса подписки.")
             new_subscribed = not subscribed
-            success = update_user_settings(user_id, subscribed=new_subscribed)
+            success = await update_user_settings(user_id, subscribed=new_subscribed)
             if success:
                 status = "подписан ✅" if new_subscribed else "отписан 🚫"
                 await query.message.reply_text(f"📩 Подписка на рассылку: {status}")
                 # Обновляем меню
-                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
                 message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
                 await query.message.reply_text(message, reply_markup=reply_markup)
             else:
@@ -223,11 +216,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 logger.warning(f"У пользователя {user_id} нет установленного периода отпуска.")
                 await query.message.reply_text("🏖️ У тебя нет установленного периода отпуска! 😕")
                 return ConversationHandler.END
-            success = update_user_settings(user_id, vacation_start=None, vacation_end=None)
+            success = await update_user_settings(user_id, vacation_start=None, vacation_end=None)
             if success:
                 await query.message.reply_text("🏖️ Период отпуска удалён! ✅")
                 # Обновляем меню
-                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+                subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
                 message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
                 await query.message.reply_text(message, reply_markup=reply_markup)
             else:
@@ -259,11 +252,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_to_remove = callback_data[len('remove_arrival_time_'):]
             if time_to_remove in arrival_notification_times:
                 arrival_notification_times.remove(time_to_remove)
-                success = update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
+                success = await update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
                 if success:
                     await query.message.reply_text(f"⏰ Время оповещения о приходе {time_to_remove} удалено! ✅")
                     # Обновляем меню
-                    subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+                    subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
                     message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
                     await query.message.reply_text(message, reply_markup=reply_markup)
                 else:
@@ -297,11 +290,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_to_remove = callback_data[len('remove_departure_time_'):]
             if time_to_remove in departure_notification_times:
                 departure_notification_times.remove(time_to_remove)
-                success = update_user_settings(user_id, departure_notification_times=departure_notification_times)
+                success = await update_user_settings(user_id, departure_notification_times=departure_notification_times)
                 if success:
                     await query.message.reply_text(f"🚪 Время оповещения об уходе {time_to_remove} удалено! ✅")
                     # Обновляем меню
-                    subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+                    subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
                     message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
                     await query.message.reply_text(message, reply_markup=reply_markup)
                 else:
@@ -363,10 +356,10 @@ async def set_vacation_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Дата окончания отпуска должна быть позже даты начала. Попробуй ещё раз (ДД-ММ-ГГГГ):")
             return INPUT_VACATION_END
 
-        success = update_user_settings(user_id, vacation_start=vacation_start, vacation_end=vacation_end)
+        success = await update_user_settings(user_id, vacation_start=vacation_start, vacation_end=vacation_end)
         if success:
             await update.message.reply_text(f"🏖️ Период отпуска {vacation_start} - {vacation_end} установлен! ✅")
-            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
             message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
             await update.message.reply_text(message, reply_markup=reply_markup)
         else:
@@ -403,17 +396,17 @@ async def add_arrival_notification_time(update: Update, context: ContextTypes.DE
         time_str = f"{hours:02d}:{minutes:02d}"
         logger.info(f"Время оповещения о приходе успешно нормализовано: {time_str}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
 
         if time_str in arrival_notification_times:
             await update.message.reply_text(f"⏰ Время оповещения о приходе {time_str} уже добавлено! 😕")
             return ConversationHandler.END
 
         arrival_notification_times.append(time_str)
-        success = update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
+        success = await update_user_settings(user_id, arrival_notification_times=arrival_notification_times)
         if success:
             await update.message.reply_text(f"⏰ Время оповещения о приходе {time_str} добавлено! ✅")
-            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
             message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
             await update.message.reply_text(message, reply_markup=reply_markup)
         else:
@@ -451,17 +444,17 @@ async def add_departure_notification_time(update: Update, context: ContextTypes.
         time_str = f"{hours:02d}:{minutes:02d}"
         logger.info(f"Время оповещения об уходе успешно нормализовано: {time_str}")
 
-        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+        subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
 
         if time_str in departure_notification_times:
             await update.message.reply_text(f"🚪 Время оповещения об уходе {time_str} уже добавлено! 😕")
             return ConversationHandler.END
 
         departure_notification_times.append(time_str)
-        success = update_user_settings(user_id, departure_notification_times=departure_notification_times)
+        success = await update_user_settings(user_id, departure_notification_times=departure_notification_times)
         if success:
             await update.message.reply_text(f"🚪 Время оповещения об уходе {time_str} добавлено! ✅")
-            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = get_user_settings(user_id)
+            subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times = await get_user_settings(user_id)
             message, reply_markup = create_main_menu(subscribed, vacation_start, vacation_end, arrival_notification_times, departure_notification_times)
             await update.message.reply_text(message, reply_markup=reply_markup)
         else:
@@ -10,25 +10,25 @@ import logging
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from database.db import engine, user_settings, presence_report
-from bot.utils import VLADIVOSTOK_TZ
+from database.db import user_settings, presence_report
+from database.async_db import get_async_engine
+from bot.utils import VLADIVOSTOK_TZ, to_date
 
-# Настройка логирования
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def add_attendance(employee_id, date, start_time=None, end_time=None, is_night_shift=False):
+async def add_attendance(employee_id, date, start_time=None, end_time=None, is_night_shift=False):
     """
     Добавление записи о посещении в таблицу presence_report.
     """
+    date = to_date(date)
     try:
-        with engine.connect() as conn:
+        async with get_async_engine().begin() as conn:
             # Проверяем, существует ли запись
             query = select(presence_report).where(
                 presence_report.c.employee_id == employee_id,
                 presence_report.c.date == date
             )
-            existing = conn.execute(query).mappings().fetchone()
+            existing = (await conn.execute(query)).mappings().fetchone()
 
             if existing:
                 # Обновляем существующую запись
@@ -53,23 +53,23 @@ def add_attendance(employee_id, date, start_time=None, end_time=None, is_night_s
                     real_estimate=0,      # Можно настроить
                     is_red=False
                 )
-            conn.execute(query)
-            conn.commit()
+            await conn.execute(query)
             logger.debug(f"Запись о посещении добавлена/обновлена для employee_id {employee_id} на дату {date}")
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при добавлении записи о посещении: {e}")
         raise
 
-def get_attendance(telegram_id, date):
+async def get_attendance(telegram_id, date):
     """
     Получение данных о посещении за конкретный день.
     Возвращает строку с информацией о посещении.
     """
+    date = to_date(date)
     try:
-        with engine.connect() as conn:
+        async with get_async_engine().connect() as conn:
             # Находим employee_id по telegram_id
             query = select(user_settings.c.employee_id).where(user_settings.c.telegram_id == telegram_id)
-            result = conn.execute(query).mappings().fetchone()
+            result = (await conn.execute(query)).mappings().fetchone()
             if not result:
                 return "Пользователь не найден в настройках."
 
@@ -78,7 +78,7 @@ def get_attendance(telegram_id, date):
                 presence_report.c.employee_id == employee_id,
                 presence_report.c.date == date
             )
-            record = conn.execute(query).mappings().fetchone()
+            record = (await conn.execute(query)).mappings().fetchone()
             if record:
                 start_time = record['start_time'] or "не указано"
                 end_time = record['end_time'] or "не указано"
@@ -88,28 +88,62 @@ def get_attendance(telegram_id, date):
         logger.error(f"Ошибка при получении данных о посещении для {telegram_id} на дату {date}: {e}")
         return "Ошибка при получении данных."
 
-def get_attendance_last_10_days(telegram_id, end_date):
+async def get_attendance_bulk(employee_ids, date):
+    """
+    Получение данных о посещении за конкретный день сразу для набора сотрудников одним запросом.
+    Возвращает словарь {employee_id: {'start_time': ..., 'end_time': ..., 'is_night_shift': ...}};
+    сотрудников без записи за этот день в словаре нет.
+    """
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return {}
+    date = to_date(date)
+    try:
+        async with get_async_engine().connect() as conn:
+            query = select(
+                presence_report.c.employee_id,
+                presence_report.c.start_time,
+                presence_report.c.end_time,
+                presence_report.c.is_night_shift
+            ).where(
+                presence_report.c.employee_id.in_(employee_ids),
+                presence_report.c.date == date
+            )
+            records = (await conn.execute(query)).mappings().fetchall()
+            return {
+                record['employee_id']: {
+                    'start_time': record['start_time'],
+                    'end_time': record['end_time'],
+                    'is_night_shift': bool(record['is_night_shift'])
+                }
+                for record in records
+            }
+    except SQLAlchemyError as e:
+        logger.error(f"Ошибка при пакетном получении данных о посещении на дату {date}: {e}")
+        raise
+
+async def get_attendance_last_10_days(telegram_id, end_date):
     """
     Получение данных о посещениях за последние 10 дней.
     Возвращает список записей.
     """
     try:
-        with engine.connect() as conn:
+        async with get_async_engine().connect() as conn:
             # Находим employee_id по telegram_id
             query = select(user_settings.c.employee_id).where(user_settings.c.telegram_id == telegram_id)
-            result = conn.execute(query).mappings().fetchone()
+            result = (await conn.execute(query)).mappings().fetchone()
             if not result:
                 return []
 
             employee_id = result['employee_id']
-            end = datetime.strptime(end_date, '%Y-%m-%d')
+            end = to_date(end_date)
             start = end - timedelta(days=9)
 
             query = select(presence_report).where(
                 presence_report.c.employee_id == employee_id,
-                presence_report.c.date.between(start.strftime('%Y-%m-%d'), end_date)
-            )
-            records = conn.execute(query).mappings().fetchall()
+                presence_report.c.date.between(start, end)
+            ).order_by(presence_report.c.date)
+            records = (await conn.execute(query)).mappings().fetchall()
             return [(record['date'], f"Начало: {record['start_time'] or 'не указано'}, Конец: {record['end_time'] or 'не указано'}") for record in records]
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при получении данных о посещениях за 10 дней для {telegram_id}: {e}")
@@ -120,10 +154,10 @@ async def check_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user = update.effective_user
     telegram_id = user.id
 
-    with engine.connect() as connection:
+    async with get_async_engine().connect() as connection:
         # Получаем employee_id пользователя
         query = text("SELECT employee_id FROM user_settings WHERE telegram_id = :telegram_id")
-        result = connection.execute(query, {"telegram_id": telegram_id}).mappings().fetchone()
+        result = (await connection.execute(query, {"telegram_id": telegram_id})).mappings().fetchone()
 
         if not result:
             await update.message.reply_text("Ты не зарегистрирован. Используй /register для регистрации.")
@@ -139,7 +173,7 @@ async def check_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             ORDER BY date DESC, start_time DESC
             LIMIT 1
         """)
-        result = connection.execute(query, {"employee_id": employee_id}).mappings().fetchone()
+        result = (await connection.execute(query, {"employee_id": employee_id})).mappings().fetchone()
 
         if not result:
             await update.message.reply_text("У тебя нет записей о присутствии.")
@@ -162,10 +196,10 @@ async def attendance_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     user = update.effective_user
     telegram_id = user.id
 
-    with engine.connect() as connection:
+    async with get_async_engine().connect() as connection:
         # Получаем employee_id пользователя
         query = text("SELECT employee_id FROM user_settings WHERE telegram_id = :telegram_id")
-        result = connection.execute(query, {"telegram_id": telegram_id}).mappings().fetchone()
+        result = (await connection.execute(query, {"telegram_id": telegram_id})).mappings().fetchone()
 
         if not result:
             await update.message.reply_text("Ты не зарегистрирован. Используй /register для регистрации.")
@@ -174,8 +208,8 @@ async def attendance_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         employee_id = result['employee_id']
 
         # Определяем диапазон дат (последние 10 дней)
-        end_date = datetime.now(VLADIVOSTOK_TZ).strftime('%Y-%m-%d')
-        start_date = (datetime.now(VLADIVOSTOK_TZ) - timedelta(days=9)).strftime('%Y-%m-%d')
+        end_date = datetime.now(VLADIVOSTOK_TZ).date()
+        start_date = end_date - timedelta(days=9)
 
         # Получаем записи за последние 10 дней
         query = text("""
@@ -185,7 +219,7 @@ async def attendance_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             AND date BETWEEN :start_date AND :end_date
             ORDER BY date
         """)
-        results = connection.execute(query, {"employee_id": employee_id, "start_date": start_date, "end_date": end_date}).mappings().fetchall()
+        results = (await connection.execute(query, {"employee_id": employee_id, "start_date": start_date, "end_date": end_date})).mappings().fetchall()
 
         if not results:
             await update.message.reply_text("Нет записей о посещениях за последние 10 дней.")
@@ -0,0 +1,68 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Лимит, передаваемый базовому классу: его семафор берётся в process_update до do_process_update,
+# поэтому он не должен ограничивать ничего — лимит соблюдает собственный семафор класса
+UNLIMITED_UPDATES = 2 ** 31 - 1
+
+
+def ordering_key(update):
+    """Ключ очереди обновления: пользователь (как у ConversationHandler), иначе чат; None — без порядка."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        if update.effective_chat:
+            return ('chat', update.effective_chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает обновления разных пользователей параллельно (не больше max_concurrent_updates),
+    а обновления одного пользователя — строго по очереди в порядке поступления.
+
+    Состояния ConversationHandler и user_data не рассчитаны на параллельные обновления одного
+    пользователя, поэтому каждое обновление ждёт замок своего пользователя. asyncio.Lock будит
+    ожидающих в порядке FIFO, а Application создаёт задачи в порядке получения обновлений.
+    Замок берётся до слота семафора: очередь одного пользователя ждёт, не занимая слотов,
+    и не мешает обновлениям остальных.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        self._limit = UNLIMITED_UPDATES
+        super().__init__(UNLIMITED_UPDATES)
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # ключ -> [замок, число обновлений в очереди], запись удаляется вместе с последним
+        self._queues = {}
+
+    @property
+    def max_concurrent_updates(self):
+        """Лимит одновременно обрабатываемых обновлений (соблюдается семафором этого класса)."""
+        return self._limit
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        queue = self._queues.setdefault(key, [asyncio.Lock(), 0])
+        queue[1] += 1
+        try:
+            async with queue[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            queue[1] -= 1
+            if not queue[1]:
+                del self._queues[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, date
 import pytz
 
 # Состояния для ConversationHandler
@@ -13,3 +13,28 @@ SET_VACATION_START, SET_VACATION_END, ADD_ARRIVAL_NOTIFICATION, ADD_DEPARTURE_NO
 
 VLADIVOSTOK_TZ = pytz.timezone('Asia/Vladivostok')
 
+# Источник локального времени для задач планировщика; в бенчмарках подменяется через set_clock
+_clock = datetime.now
+
+
+def local_now():
+    """Текущее локальное время устройства (или время подменённых часов)."""
+    return _clock()
+
+
+def set_clock(clock=None):
+    """Подменяет часы функцией без аргументов, возвращающей datetime; None — вернуть системные."""
+    global _clock
+    _clock = clock or datetime.now
+
+
+def to_date(value):
+    """Приводит дату в формате ГГГГ-ММ-ДД (или datetime) к date для столбцов типа DATE."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
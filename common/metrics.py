@@ -0,0 +1,227 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Бот отдаёт их по HTTP (start_http_server, переменная METRICS_PORT), разовые загрузки данных
+записывают их в файл для textfile collector node_exporter (write_textfile, METRICS_TEXTFILE).
+"""
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = os.getenv("METRICS_PORT")  # Не задан — HTTP-сервер метрик не запускается
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")  # Например /var/lib/node_exporter/moygrafik.prom
+
+# Границы корзин гистограмм, секунды: от быстрых SQL-запросов до долгих стадий ETL
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """Монотонно растущий счётчик с метками."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Гистограмма длительностей с метками; timed() замеряет функцию или корутину."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # метки -> [счётчики корзин, сумма, количество]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def timed(self, **labels):
+        """Декоратор: длительность каждого вызова (для async-функций — до завершения корутины)."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])}"
+                             f" {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Планировщик бота
+SCHEDULER_TICK_SECONDS = Histogram(
+    'moygrafik_scheduler_tick_seconds', "Длительность тика задачи планировщика", ['job'])
+SCHEDULER_USERS_EVALUATED = Counter(
+    'moygrafik_scheduler_users_evaluated_total', "Пользователи, проверенные задачей планировщика", ['job'])
+MESSAGES_SENT = Counter(
+    'moygrafik_messages_total', "Сообщения, отправленные пачками (status: sent/failed)", ['batch', 'status'])
+# Обработчики обновлений Telegram
+HANDLER_SECONDS = Histogram(
+    'moygrafik_handler_seconds', "Длительность обработчика обновления Telegram", ['handler'])
+# База данных и API МойГрафик
+DB_QUERY_SECONDS = Histogram(
+    'moygrafik_db_query_seconds', "Время выполнения SQL-запроса", ['engine', 'operation'])
+API_REQUEST_SECONDS = Histogram(
+    'moygrafik_api_request_seconds', "Время запроса к API МойГрафик", ['endpoint', 'result'])
+# Загрузка данных
+ETL_STAGE_SECONDS = Histogram(
+    'moygrafik_etl_stage_seconds', "Длительность стадии конвейера загрузки", ['pipeline', 'stage', 'status'])
+ETL_ROWS = Counter(
+    'moygrafik_etl_rows_total', "Строки, обработанные загрузкой данных", ['source', 'table'])
+
+
+def observe_handler(func):
+    """Декоратор обработчика бота: длительность вызова с меткой handler=имя функции."""
+    return HANDLER_SECONDS.timed(handler=func.__name__)(func)
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path=METRICS_TEXTFILE):
+    """Атомарно записывает метрики в файл (textfile collector); без пути ничего не делает."""
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_LISTEN):
+    """Запускает HTTP-сервер /metrics в фоновом потоке; без порта ничего не делает."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+
+def instrument_engine(engine, name):
+    """Замеряет время каждого SQL-запроса движка (для асинхронного передавайте engine.sync_engine)."""
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_started_at')
+        if started:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started.pop(), engine=name, operation=operation)
+
+    def handle_error(exception_context):
+        # Запрос с ошибкой не доходит до after_cursor_execute: снимаем его отметку времени
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_started_at'):
+            connection.info['metrics_started_at'].pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
@@ -0,0 +1,193 @@
+"""
+Профилирование по запросу: следующие N вызовов выбранной цели записываются в файлы.
+
+Цели — имена вроде send_notification, check_absences, callback_handler.attendance_today,
+pipeline.load_from_api.load_employees; допускаются шаблоны fnmatch (callback_handler.*).
+Включается переменной PROFILE ("send_notification:5,pipeline.*:1") или командой бота /profile.
+Пока ничего не включено, обёртки только проверяют пустой словарь целей.
+
+Режимы (PROFILE_MODE):
+    sample   — статистический профиль: поток снимает стек вызовов раз в PROFILE_INTERVAL секунд
+               и пишет .folded (свёрнутые стеки для flamegraph.pl, speedscope, inferno);
+    cprofile — детерминированный профиль cProfile в .prof (snakeviz, flameprof, gprof2dot).
+
+Для корутин профилируется поток цикла событий целиком, поэтому в профиль попадают и задачи,
+выполнявшиеся одновременно с целью.
+
+Запуск с профилированием пяти тиков планировщика:
+    PROFILE=send_notification:5 python -m bot.main
+"""
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+logger = logging.getLogger(__name__)
+
+PROFILE = os.getenv("PROFILE", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "profiles")))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+
+class StackSampler:
+    """Снимает стек потока thread_id раз в interval секунд и считает одинаковые стеки."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """Свёрнутые стеки: "кадр;кадр;кадр число_сэмплов" в строке."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Цели профилирования со счётчиками оставшихся вызовов и запись профилей на диск."""
+
+    def __init__(self, directory=PROFILE_DIR, mode=PROFILE_MODE, interval=PROFILE_INTERVAL):
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.armed = {}  # шаблон цели -> сколько вызовов ещё профилировать
+        self._lock = threading.Lock()
+        self._busy_threads = set()  # В одном потоке одновременно снимается только один профиль
+
+    def arm(self, pattern, count=1):
+        with self._lock:
+            self.armed[pattern] = count
+        logger.info(f"Профилирование включено: {pattern}, вызовов {count}, режим {self.mode}, каталог {self.directory}")
+
+    def disarm(self, pattern=None):
+        with self._lock:
+            if pattern is None:
+                self.armed.clear()
+            else:
+                self.armed.pop(pattern, None)
+
+    def arm_from_string(self, value):
+        """Включает цели из строки "цель:N,цель:N" (N по умолчанию 1)."""
+        for item in value.split(','):
+            pattern, _, count = item.strip().partition(':')
+            if pattern:
+                self.arm(pattern, int(count or 1))
+
+    def _take(self, target):
+        """Забирает один вызов у подходящего шаблона; False — цель профилировать не нужно."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id in self._busy_threads:
+                return False
+            for pattern, remaining in self.armed.items():
+                if fnmatchcase(target, pattern):
+                    if remaining <= 1:
+                        del self.armed[pattern]
+                    else:
+                        self.armed[pattern] = remaining - 1
+                    self._busy_threads.add(thread_id)
+                    return True
+        return False
+
+    @contextmanager
+    def section(self, target):
+        """Профилирует блок кода, если цель target включена."""
+        if not self.armed or not self._take(target):
+            yield
+            return
+        thread_id = threading.get_ident()
+        started_at = datetime.now()
+        if self.mode == 'cprofile':
+            collector = cProfile.Profile()
+            collector.enable()
+        else:
+            collector = StackSampler(thread_id, self.interval)
+            collector.start()
+        try:
+            yield
+        finally:
+            if self.mode == 'cprofile':
+                collector.disable()
+            else:
+                collector.stop()
+            with self._lock:
+                self._busy_threads.discard(thread_id)
+            self._dump(target, started_at, collector)
+
+    def _dump(self, target, started_at, collector):
+        name = re.sub(r'[^\w.-]', '_', target)
+        path = os.path.join(self.directory, f"{name}-{started_at.strftime('%Y%m%d-%H%M%S-%f')}")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if isinstance(collector, cProfile.Profile):
+                path += '.prof'
+                collector.dump_stats(path)
+            else:
+                path += '.folded'
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(collector.folded())
+        except OSError as e:
+            logger.error(f"Не удалось записать профиль {target}: {e}")
+            return
+        logger.info(f"Профиль {target} записан в {path}")
+
+    def profiled(self, target):
+        """
+        Декоратор функции или корутины. target — имя цели или функция от аргументов вызова,
+        возвращающая имя (вызывается, только когда какая-то цель включена).
+        """
+        def decorator(func):
+            def target_of(args, kwargs):
+                return target(*args, **kwargs) if callable(target) else target
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.armed:
+                        return await func(*args, **kwargs)
+                    with self.section(target_of(args, kwargs)):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.armed:
+                    return func(*args, **kwargs)
+                with self.section(target_of(args, kwargs)):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+# Общий профилировщик процесса; цели из PROFILE включаются при импорте
+profiler = Profiler()
+profiler.arm_from_string(PROFILE)
+profiled = profiler.profiled
@@ -1,6 +1,6 @@
 import pandas as pd
 from sqlalchemy import create_engine, text
-from database.db import engine 
+from database.db import get_engine
 def load_and_update_table(csv_file, table_name, key_columns):
     """
     Загрузка данных из CSV и обновление таблицы в БД.
@@ -12,7 +12,7 @@ def load_and_update_table(csv_file, table_name, key_columns):
     df = pd.read_csv(csv_file)
 
     # Подключение к БД
-    with engine.connect() as connection:
+    with get_engine().connect() as connection:
         # Проверка наличия таблицы
         result = connection.execute(text(
             f"SELECT * FROM information_schema.tables WHERE table_schema = 'main' AND table_name = '{table_name}';"))
@@ -49,6 +49,7 @@ tables_info = [
     {'csv_file': 'subdivisions.csv', 'table_name': 'subdivisions', 'key_columns': ['id']}
 ]
 
-# Загрузка и обновление данных для каждой таблицы
-for info in tables_info:
-    load_and_update_table(info['csv_file'], info['table_name'], info['key_columns'])
\ No newline at end of file
+if __name__ == '__main__':
+    # Загрузка и обновление данных для каждой таблицы
+    for info in tables_info:
+        load_and_update_table(info['csv_file'], info['table_name'], info['key_columns'])
@@ -1,5 +1,5 @@
 from sqlalchemy import create_engine, text
-from database.db import engine 
+from database.db import get_engine
 
 def drop_all_tables(connection):
     """
@@ -19,6 +19,8 @@ def drop_all_tables(connection):
         connection.execute(text(f"DROP TABLE IF EXISTS {table_name} CASCADE;"))
         print(f"Table {table_name} deleted.")
 
-# Исполнение функции
-with engine.begin() as connection:
-    drop_all_tables(connection)
+if __name__ == '__main__':
+    # Исполнение функции
+    with get_engine().begin() as connection:
+        drop_all_tables(connection)
+
@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 from pathlib import Path
 
@@ -26,8 +27,9 @@ def list_csv_columns_and_rows(data_directory):
             except Exception as e:
                 print(f"Ошибка при чтении файла {file_name}: {e}")
 
-# Заданный путь к каталогу
-data_path = "C:\\Users\\shish.me\\PycharmProjects\\MoyGrafik_bot\\database"
+if __name__ == '__main__':
+    # Каталог с CSV-файлами: аргумент командной строки или каталог этого скрипта
+    data_path = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
 
-# Вызов функции
-list_csv_columns_and_rows(data_path)
\ No newline at end of file
+    # Вызов функции
+    list_csv_columns_and_rows(data_path)
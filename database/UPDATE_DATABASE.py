@@ -1,19 +1,16 @@
 import pandas as pd
 import ast
+import json
 import logging
+import os
 import re
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
-from database.db import engine
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('data_update.log'),
-        logging.StreamHandler()
-    ]
-)
+from database.db import get_engine
+from database.link_tables import LINKED_TABLES, refresh_link_tables
+from database.migrations import migrate
+from common.metrics import ETL_ROWS, write_textfile
+
 logger = logging.getLogger(__name__)
 
 def clean_clid(clid):
@@ -35,17 +32,21 @@ def evaluate_lists(col):
     return col
 
 def prepare_sql_array(lst):
-    """Преобразование списка в строку для хранения в TEXT поле."""
-    if isinstance(lst, list):
-        return str(lst)
-    return None if lst is None else lst
+    """Преобразование списка в JSON-текст для приведения к JSONB при переносе из временной таблицы."""
+    if lst is None or (isinstance(lst, float) and pd.isnull(lst)):
+        return None
+    return json.dumps(lst, ensure_ascii=False)
 
-def load_csv_to_temp_table(file_path: str, temp_table_name: str) -> pd.DataFrame:
-    """Загрузка данных из CSV во временную таблицу."""
+def load_csv_to_temp_table(file_path: str, temp_table_name: str, since: str = None) -> pd.DataFrame:
+    """Загрузка данных из CSV во временную таблицу (since — отбросить строки с датой раньше указанной)."""
     try:
         df = pd.read_csv(file_path)
         logger.info(f"Загружен CSV-файл: {file_path}, записей: {len(df)}")
 
+        if since and 'date' in df.columns:
+            df = df[df['date'].astype(str) >= since]
+            logger.info(f"Оставлены записи с датой от {since}: {len(df)}")
+
         # Обрабатываем clid: извлекаем только цифры
         if 'clid' in df.columns:
             df['clid'] = df['clid'].apply(clean_clid)
@@ -67,7 +68,7 @@ def load_csv_to_temp_table(file_path: str, temp_table_name: str) -> pd.DataFrame
                 df = df.drop_duplicates(subset=['employee_id', 'date'], keep='last')
                 logger.info(f"После удаления дубликатов осталось записей: {len(df)}")
 
-        # Список столбцов, которые содержат массивы (хранятся как TEXT в базе)
+        # Список столбцов, которые содержат массивы (хранятся как JSONB в базе)
         list_columns = {
             'employees': ['placements', 'sites', 'subdivisions', 'positions', 'identification_photos'],
             'placements': ['ips', 'mac_addresses', 'managers'],
@@ -86,16 +87,108 @@ def load_csv_to_temp_table(file_path: str, temp_table_name: str) -> pd.DataFrame
         df = df.where(pd.notnull(df), None)
 
         # Загружаем данные во временную таблицу
-        df.to_sql(temp_table_name, engine, if_exists='replace', index=False)
+        df.to_sql(temp_table_name, get_engine(), if_exists='replace', index=False)
         logger.info(f"Данные загружены во временную таблицу {temp_table_name}, записей: {len(df)}")
         return df
     except Exception as e:
         logger.error(f"Ошибка загрузки CSV {file_path} во временную таблицу {temp_table_name}: {str(e)}")
         raise
 
-def clear_and_replace_table(connection, table_name: str, temp_table_name: str):
-    """Очистка таблицы и вставка новых данных из временной таблицы."""
+# Столбцы таблиц и приведение типов при переносе из временной таблицы
+TABLE_COLUMNS = {
+    'employees': [
+        ('id', 'BIGINT'), ('user_id', 'BIGINT'), ('company_id', 'BIGINT'),
+        ('timezone_id', 'BIGINT'), ('telegram_id', 'BIGINT'),
+        ('presence_close_rule', 'DOUBLE PRECISION'), ('phone', 'BIGINT'),
+        ('identification_photos', 'JSONB'), ('identification_photos_count', 'DOUBLE PRECISION'),
+        ('preferred_photo', 'DOUBLE PRECISION'), ('email', 'TEXT'), ('positions', 'JSONB'),
+        ('avatar', 'TEXT'), ('avatar_big', 'TEXT'), ('placements', 'JSONB'), ('first_name', 'TEXT'),
+        ('last_name', 'TEXT'), ('snils', 'TEXT'), ('clid', 'TEXT'), ('sites', 'JSONB'), ('subdivisions', 'JSONB')
+    ],
+    'placements': [
+        ('id', 'BIGINT'), ('company_id', 'BIGINT'), ('timezone_id', 'BIGINT'), ('name', 'TEXT'),
+        ('clid', 'DOUBLE PRECISION'), ('color', 'TEXT'), ('color_id', 'BIGINT'), ('status', 'BIGINT'),
+        ('terminal_monitoring_enabled', 'BOOLEAN'), ('location_control', 'DOUBLE PRECISION'),
+        ('liveness_enabled', 'BOOLEAN'), ('ips', 'JSONB'), ('mac_addresses', 'JSONB'), ('managers', 'JSONB')
+    ],
+    'positions': [
+        ('id', 'BIGINT'), ('company_id', 'BIGINT'), ('name', 'TEXT'), ('clid', 'DOUBLE PRECISION'),
+        ('color', 'TEXT'), ('color_id', 'BIGINT'), ('status', 'BIGINT'), ('managers', 'JSONB'),
+        ('subdivisions', 'JSONB')
+    ],
+    'subdivisions': [
+        ('id', 'BIGINT'), ('company_id', 'BIGINT'), ('name', 'TEXT'), ('clid', 'DOUBLE PRECISION'),
+        ('color', 'TEXT'), ('color_id', 'BIGINT'), ('status', 'BIGINT'), ('managers', 'JSONB'),
+        ('placements', 'JSONB')
+    ],
+    'presence_report': [
+        ('employee_id', 'BIGINT'), ('date', 'DATE'), ('start_time', 'TIMESTAMP'), ('end_time', 'TIMESTAMP'),
+        ('is_night_shift', 'BOOLEAN'), ('original_estimate', 'BIGINT'), ('real_estimate', 'BIGINT'),
+        ('is_red', 'BOOLEAN'), ('first_name', 'TEXT'), ('last_name', 'TEXT'), ('email', 'TEXT')
+    ],
+}
+
+# Ключи, по которым строки сопоставляются при upsert
+KEY_COLUMNS = {
+    'employees': ['id'],
+    'placements': ['id'],
+    'positions': ['id'],
+    'subdivisions': ['id'],
+    'presence_report': ['employee_id', 'date'],
+}
+
+# Режим синхронизации: incremental — upsert изменившихся строк, full — очистка таблиц и полная перезаливка
+SYNC_MODE = os.getenv('SYNC_MODE', 'incremental')
+
+# Сколько дней до high-water mark перечитывать в presence_report: у открытых смен позже появляется end_time
+PRESENCE_RESYNC_DAYS = 3
+
+
+def build_insert_select(table_name: str, temp_table_name: str) -> str:
+    """Формирует INSERT ... SELECT из временной таблицы с приведением типов."""
+    columns = TABLE_COLUMNS[table_name]
+    column_list = ', '.join(column for column, _ in columns)
+    if table_name == 'presence_report':
+        # В presence_report попадают только записи существующих сотрудников
+        select_list = ', '.join(f"pr.{column}::{cast}" for column, cast in columns)
+        source = f"{temp_table_name} AS pr JOIN employees AS e ON pr.employee_id::BIGINT = e.id"
+    else:
+        select_list = ', '.join(f"{column}::{cast}" for column, cast in columns)
+        source = temp_table_name
+    return f"INSERT INTO {table_name} ({column_list}) SELECT {select_list} FROM {source}"
+
+
+def add_new_user_settings(connection, temp_table_name: str):
+    """Добавляет новых сотрудников в user_settings (если их telegram_id ещё нет)."""
+    connection.execute(text("""
+        INSERT INTO user_settings (
+            telegram_id, employee_id, subscribed, 
+            arrival_notification_times, departure_notification_times
+        )
+        SELECT DISTINCT
+            t.telegram_id::BIGINT,
+            t.id::BIGINT,
+            TRUE,
+            '[]'::JSONB,
+            '[]'::JSONB
+        FROM {temp_table_name} t
+        WHERE t.telegram_id IS NOT NULL
+        AND t.telegram_id::BIGINT NOT IN (SELECT telegram_id FROM user_settings)
+        ON CONFLICT (telegram_id) DO NOTHING;
+    """.format(temp_table_name=temp_table_name)))
+    logger.info("Добавлены новые сотрудники в user_settings")
+
+
+def clear_and_replace_table(connection, table_name: str, temp_table_name: str) -> int:
+    """
+    Очистка таблицы и вставка новых данных из временной таблицы.
+    Возвращает число вставленных строк (без строк, отброшенных JOIN с employees).
+    """
     try:
+        if table_name not in TABLE_COLUMNS:
+            logger.warning(f"Таблица {table_name} не поддерживается для вставки")
+            return 0
+
         # Очищаем зависимые таблицы перед удалением записей из основной таблицы
         if table_name == "employees":
             # Удаляем связанные записи из presence_report
@@ -118,171 +211,135 @@ def clear_and_replace_table(connection, table_name: str, temp_table_name: str):
         logger.info(f"Таблица {table_name} полностью очищена")
 
         # Вставляем новые данные из временной таблицы
+        rows_inserted = connection.execute(text(build_insert_select(table_name, temp_table_name) + ";")).rowcount
+        logger.info(f"Новые данные вставлены в таблицу {table_name}, записей: {rows_inserted}")
+
+        # Таблица заменена целиком: связи пересобираются полностью, включая связи удалённых строк
+        refresh_link_tables(connection, table_name)
+
         if table_name == "employees":
-            query = f"""
-                INSERT INTO employees (
-                    id, user_id, company_id, timezone_id, telegram_id,
-                    presence_close_rule, phone, identification_photos,
-                    identification_photos_count, preferred_photo, email,
-                    positions, avatar, avatar_big, placements, first_name,
-                    last_name, snils, clid, sites, subdivisions
-                )
-                SELECT
-                    id::BIGINT,
-                    user_id::DOUBLE PRECISION,
-                    company_id::BIGINT,
-                    timezone_id::BIGINT,
-                    telegram_id::DOUBLE PRECISION,
-                    presence_close_rule::DOUBLE PRECISION,
-                    phone::DOUBLE PRECISION,
-                    identification_photos::TEXT,
-                    identification_photos_count::DOUBLE PRECISION,
-                    preferred_photo::DOUBLE PRECISION,
-                    email::TEXT,
-                    positions::TEXT,
-                    avatar::TEXT,
-                    avatar_big::TEXT,
-                    placements::TEXT,
-                    first_name::TEXT,
-                    last_name::TEXT,
-                    snils::TEXT,
-                    clid::TEXT,
-                    sites::TEXT,
-                    subdivisions::TEXT
-                FROM {temp_table_name};
-            """
-            # Выполняем вставку новых данных в employees
-            connection.execute(text(query))
-            logger.info(f"Новые данные вставлены в таблицу {table_name}")
-
-            # Добавляем новых сотрудников в user_settings (если их telegram_id ещё нет)
-            connection.execute(text("""
-                INSERT INTO user_settings (
-                    telegram_id, employee_id, subscribed, 
-                    arrival_notification_times, departure_notification_times
-                )
-                SELECT DISTINCT
-                    t.telegram_id::BIGINT,
-                    t.id::BIGINT,
-                    TRUE,
-                    '[]',
-                    '[]'
-                FROM {temp_table_name} t
-                WHERE t.telegram_id IS NOT NULL
-                AND t.telegram_id::BIGINT NOT IN (SELECT telegram_id FROM user_settings)
-                ON CONFLICT (telegram_id) DO NOTHING;
-            """.format(temp_table_name=temp_table_name)))
-            logger.info("Добавлены новые сотрудники в user_settings")
-
-        elif table_name == "placements":
-            query = f"""
-                INSERT INTO placements (
-                    id, company_id, timezone_id, name, clid, color,
-                    color_id, status, terminal_monitoring_enabled,
-                    location_control, liveness_enabled, ips,
-                    mac_addresses, managers
-                )
-                SELECT
-                    id::BIGINT,
-                    company_id::BIGINT,
-                    timezone_id::BIGINT,
-                    name::TEXT,
-                    clid::DOUBLE PRECISION,
-                    color::TEXT,
-                    color_id::BIGINT,
-                    status::BIGINT,
-                    terminal_monitoring_enabled::BOOLEAN,
-                    location_control::DOUBLE PRECISION,
-                    liveness_enabled::BOOLEAN,
-                    ips::TEXT,
-                    mac_addresses::TEXT,
-                    managers::TEXT
-                FROM {temp_table_name};
-            """
-        elif table_name == "positions":
-            query = f"""
-                INSERT INTO positions (
-                    id, company_id, name, clid, color, color_id,
-                    status, managers, subdivisions
-                )
-                SELECT
-                    id::BIGINT,
-                    company_id::BIGINT,
-                    name::TEXT,
-                    clid::DOUBLE PRECISION,
-                    color::TEXT,
-                    color_id::BIGINT,
-                    status::BIGINT,
-                    managers::TEXT,
-                    subdivisions::TEXT
-                FROM {temp_table_name};
-            """
-        elif table_name == "presence_report":
-            query = f"""
-                INSERT INTO presence_report (
-                    employee_id, date, start_time, end_time, is_night_shift,
-                    original_estimate, real_estimate, is_red, first_name,
-                    last_name, email
-                )
-                SELECT
-                    pr.employee_id::BIGINT,
-                    pr.date::TEXT,
-                    pr.start_time::TEXT,
-                    pr.end_time::TEXT,
-                    pr.is_night_shift::BOOLEAN,
-                    pr.original_estimate::BIGINT,
-                    pr.real_estimate::BIGINT,
-                    pr.is_red::BOOLEAN,
-                    pr.first_name::TEXT,
-                    pr.last_name::TEXT,
-                    pr.email::TEXT
-                FROM {temp_table_name} AS pr
-                JOIN employees AS e ON pr.employee_id::BIGINT = e.id;
-            """
-        elif table_name == "subdivisions":
-            query = f"""
-                INSERT INTO subdivisions (
-                    id, company_id, name, clid, color, color_id,
-                    status, managers, placements
-                )
-                SELECT
-                    id::BIGINT,
-                    company_id::BIGINT,
-                    name::TEXT,
-                    clid::DOUBLE PRECISION,
-                    color::TEXT,
-                    color_id::BIGINT,
-                    status::BIGINT,
-                    managers::TEXT,
-                    placements::TEXT
-                FROM {temp_table_name};
-            """
-        else:
-            logger.warning(f"Таблица {table_name} не поддерживается для вставки")
-            return
+            add_new_user_settings(connection, temp_table_name)
 
-        # Выполняем вставку новых данных (для таблиц, кроме employees)
-        if table_name != "employees":
-            connection.execute(text(query))
-            logger.info(f"Новые данные вставлены в таблицу {table_name}")
+        return rows_inserted
 
     except Exception as e:
         logger.error(f"Ошибка при очистке и вставке данных в таблицу {table_name}: {str(e)}")
         raise
 
-def process_table(file_path: str, table_name: str):
-    """Обработка таблицы: загрузка, очистка и вставка новых данных."""
+
+def upsert_table(connection, table_name: str, temp_table_name: str) -> int:
+    """
+    Инкрементальная вставка: добавляет новые строки и обновляет только изменившиеся.
+    Таблица не очищается, связанные user_settings и presence_report не затрагиваются.
+    Возвращает число вставленных или обновлённых строк.
+    """
+    try:
+        if table_name not in TABLE_COLUMNS:
+            logger.warning(f"Таблица {table_name} не поддерживается для вставки")
+            return 0
+
+        keys = KEY_COLUMNS[table_name]
+        value_columns = [column for column, _ in TABLE_COLUMNS[table_name] if column not in keys]
+        update_set = ', '.join(f"{column} = EXCLUDED.{column}" for column in value_columns)
+        current_values = ', '.join(f"{table_name}.{column}" for column in value_columns)
+        new_values = ', '.join(f"EXCLUDED.{column}" for column in value_columns)
+        # Для таблиц со связями upsert возвращает ключи вставленных и изменённых строк
+        returning = " RETURNING id" if table_name in LINKED_TABLES else ""
+        query = f"""
+            {build_insert_select(table_name, temp_table_name)}
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {update_set}
+            WHERE ({current_values}) IS DISTINCT FROM ({new_values}){returning};
+        """
+        result = connection.execute(text(query))
+        if returning:
+            changed_ids = [row[0] for row in result]
+            rows_changed = len(changed_ids)
+        else:
+            rows_changed = result.rowcount
+        logger.info(f"Таблица {table_name}: вставлено или обновлено записей {rows_changed}")
+
+        # Пересобираем связи только изменившихся строк по спискам (placements, managers и т.д.)
+        if returning:
+            refresh_link_tables(connection, table_name, changed_ids)
+
+        if table_name == "employees":
+            add_new_user_settings(connection, temp_table_name)
+
+        return rows_changed
+
+    except Exception as e:
+        logger.error(f"Ошибка при инкрементальной вставке данных в таблицу {table_name}: {str(e)}")
+        raise
+
+
+def get_high_water_mark(connection, table_name: str):
+    """Возвращает high-water mark последней синхронизации таблицы (или None)."""
+    result = connection.execute(
+        text("SELECT high_water_mark FROM sync_state WHERE table_name = :table_name"),
+        {"table_name": table_name}
+    ).fetchone()
+    return result[0] if result else None
+
+
+def save_sync_state(connection, table_name: str, temp_table_name: str, rows_changed: int):
+    """Сохраняет high-water mark и статистику синхронизации таблицы."""
+    high_water_mark = None
+    if table_name == 'presence_report':
+        # Для отчёта о присутствии high-water mark — максимальная загруженная дата
+        high_water_mark = connection.execute(
+            text(f"SELECT MAX(date::TEXT) FROM {temp_table_name}")
+        ).scalar()
+        previous = get_high_water_mark(connection, table_name)
+        if previous and (high_water_mark is None or previous > high_water_mark):
+            high_water_mark = previous
+    connection.execute(text("""
+        INSERT INTO sync_state (table_name, high_water_mark, rows_changed, synced_at)
+        VALUES (:table_name, :high_water_mark, :rows_changed, :synced_at)
+        ON CONFLICT (table_name) DO UPDATE SET
+            high_water_mark = EXCLUDED.high_water_mark,
+            rows_changed = EXCLUDED.rows_changed,
+            synced_at = EXCLUDED.synced_at;
+    """), {
+        "table_name": table_name,
+        "high_water_mark": high_water_mark,
+        "rows_changed": rows_changed,
+        "synced_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+    logger.info(f"Состояние синхронизации {table_name}: high-water mark {high_water_mark}, изменено строк {rows_changed}")
+
+
+def presence_since():
+    """Дата, начиная с которой строки presence_report перечитываются в инкрементальном режиме."""
+    with get_engine().connect() as connection:
+        high_water_mark = get_high_water_mark(connection, 'presence_report')
+    if not high_water_mark:
+        return None
+    since = datetime.strptime(high_water_mark[:10], '%Y-%m-%d') - timedelta(days=PRESENCE_RESYNC_DAYS)
+    return since.strftime('%Y-%m-%d')
+
+
+def process_table(file_path: str, table_name: str, mode: str = SYNC_MODE):
+    """Обработка таблицы: загрузка во временную таблицу и перенос данных (upsert или полная замена)."""
     temp_table_name = f"{table_name}_temp"
     try:
+        # В инкрементальном режиме отчёт о присутствии читаем только от high-water mark
+        since = presence_since() if mode == 'incremental' and table_name == 'presence_report' else None
+
         # Загружаем данные во временную таблицу
-        df = load_csv_to_temp_table(file_path, temp_table_name)
+        df = load_csv_to_temp_table(file_path, temp_table_name, since=since)
         if df.empty:
             logger.warning(f"Файл {file_path} пуст, пропускаем обработку таблицы {table_name}")
             return
 
-        with engine.begin() as connection:
-            # Очищаем таблицу и вставляем новые данные
-            clear_and_replace_table(connection, table_name, temp_table_name)
+        with get_engine().begin() as connection:
+            if mode == 'incremental':
+                # Добавляем новые и обновляем изменившиеся строки без очистки таблицы
+                rows_changed = upsert_table(connection, table_name, temp_table_name)
+            else:
+                # Очищаем таблицу и вставляем новые данные
+                rows_changed = clear_and_replace_table(connection, table_name, temp_table_name)
+            save_sync_state(connection, table_name, temp_table_name, rows_changed)
+            ETL_ROWS.inc(rows_changed, source='csv', table=table_name)
 
             # Удаляем временную таблицу
             connection.execute(text(f"DROP TABLE IF EXISTS {temp_table_name};"))
@@ -318,9 +375,28 @@ tables_info = [
     },
 ]
 
-# Обработка таблиц в правильном порядке с учётом зависимостей
-for info in tables_info:
-    table_name = info['table_name']
-    logger.info(f"Начало обработки таблицы {table_name}")
-    process_table(info['file_path'], table_name)
-    logger.info(f"Обработка таблицы {table_name} завершена")
\ No newline at end of file
+
+def main():
+    # Настройка логирования (при запуске скрипта, а не при импорте)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('data_update.log'),
+            logging.StreamHandler()
+        ]
+    )
+    # Таблицы связей и индексы создаются миграциями один раз, а не в каждой транзакции загрузки
+    migrate()
+    # Обработка таблиц в правильном порядке с учётом зависимостей
+    logger.info(f"Режим синхронизации: {SYNC_MODE}")
+    for info in tables_info:
+        table_name = info['table_name']
+        logger.info(f"Начало обработки таблицы {table_name}")
+        process_table(info['file_path'], table_name)
+        logger.info(f"Обработка таблицы {table_name} завершена")
+    write_textfile()
+
+
+if __name__ == "__main__":
+    main()
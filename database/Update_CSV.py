@@ -1,67 +1,82 @@
-import requests
+import argparse
+import json
+import os
+import sys
+import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timedelta
 
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-class MoyGrafikAPI:
-    def __init__(self, data_directory):
-        # Инициализация токена и базовых URL для API
-        self.token = 'Bearer NzExZjcxMzA4MzM4MzQ2NmViMWZjZDk3OWJmMjQwNGU0ODBlN2MxM2JlNTdhNjdjZTRlMTk0YWZmOGQyYjdhMg'
-        self.base_url = 'https://api.moygrafik.ru/api/external/v1'
-        self.headers = {'Authorization': self.token}
+from api.moygrafik_api import MoyGrafikAPI as MoyGrafikClient, api_metrics
+from api.response_cache import ResponseCache
+from database.keyed_store import KeyedStore
 
+BACKFILL_WORKERS = 4  # Максимум одновременных запросов отчёта о присутствии
+BACKFILL_STATE_FILE = 'presence_backfill_state.json'  # Выгруженные окна для продолжения после сбоя
 
-        # Используем указанный путь для сохранения данных
-        self.data_dir = Path(data_directory)
-        self.data_dir.mkdir(parents=True, exist_ok=True)
 
-    def fetch_data(self, endpoint, params=None):
-        # Вызов API и получение данных
-        response = requests.get(endpoint, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+def presence_windows(start_date, end_date, step_days=10):
+    # Разбивает период на окна по step_days дней
+    while start_date < end_date:
+        window_end = min(start_date + timedelta(days=step_days - 1), end_date)
+        yield start_date, window_end
+        start_date += timedelta(days=step_days)
 
-    def update_csv(self, file_name, new_data):
-        # Определяем путь к файлу CSV
-        file_path = self.data_dir / file_name
 
-        # Загрузка существующих данных из CSV файла, если он существует
-        if file_path.exists():
-            existing_df = pd.read_csv(file_path)
-            initial_length = len(existing_df)
-        else:
-            existing_df = pd.DataFrame()
-            initial_length = 0
+class MoyGrafikAPI:
+    def __init__(self, data_directory):
+        # Используем указанный путь для сохранения данных
+        self.data_dir = Path(data_directory)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
 
-        # Создание DataFrame из новых данных
-        new_df = pd.DataFrame(new_data)
+        # Общий клиент API: пул соединений, таймауты, повторы при 429/5xx и токен из TokenManager.
+        # Кэш ответов свой (рядом с CSV): общий с load_from_api кэш скрыл бы от БД изменения, уже записанные в CSV
+        self.client = MoyGrafikClient(response_cache=ResponseCache(self.data_dir / 'response_cache'))
+        self.base_url = self.client.base_url
 
-        # Преобразование списков в строковые представления
-        for col in new_df.columns:
-            if new_df[col].apply(lambda x: isinstance(x, list)).any():
-                new_df[col] = new_df[col].apply(lambda x: str(x) if isinstance(x, list) else x)
+        # Хранилище записей по ключу вместо перечитывания и перезаписи CSV при каждом обновлении
+        self.store = KeyedStore(self.data_dir)
+        self.updated_files = set()
 
-        # Объединяем существующие и новые данные
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        before_dedup_length = len(combined_df)
+    def fetch_data(self, endpoint, params=None):
+        # Вызов API и получение данных
+        return self.client.fetch(endpoint, params=params)
 
-        # Удаление дубликатов
-        combined_df.drop_duplicates(inplace=True)
-        final_length = len(combined_df)
+    def update_dimension(self, name, company_id):
+        # Справочник меняется редко: условный запрос, неизменившийся ответ не разбирается и не записывается.
+        # Новый ответ попадает в кэш только после записи в хранилище, иначе сбой записи скрыл бы изменения
+        url = f"{self.base_url}/companies/{company_id}/{name}"
+        data, pending = self.client.fetch(url, cached=True, if_changed=True, pending=True)
+        if data is None:
+            print(f"Справочник {name} не изменился, пропускаем.")
+            return
+        self.update_csv(f'{name}.csv', list(data[name].values()))
+        if pending is not None:
+            pending.commit()
 
-        # Сохраняем обновленный DataFrame в CSV
-        combined_df.to_csv(file_path, index=False)
+    def update_csv(self, file_name, new_data):
+        # Запись новых данных в хранилище по ключу (id или employee_id + date);
+        # CSV формируется один раз в export_csv. new_data может быть генератором — записи
+        # обрабатываются по мере поступления, списки преобразуются в строковые представления
+        records = ({column: str(value) if isinstance(value, list) else value for column, value in record.items()}
+                   for record in new_data)
+        inserted, updated, unchanged = self.store.upsert(file_name, records)
+        self.updated_files.add(file_name)
 
         # Сообщение об обновлении
-        print(f"Файл {file_name} обновлен.")
-        num_duplicates = before_dedup_length - final_length
-        num_new_records = final_length - initial_length
-        if num_duplicates > 0:
-            print(f"Найдено и удалено {num_duplicates} дубликатов в {file_name}.")
-        else:
-            print(f"Дубликаты не найдены в {file_name}.")
-        print(f"Добавлено {num_new_records} новых уникальных записей в {file_name}.")
+        print(f"Данные {file_name} обновлены: новых записей {inserted}, "
+              f"обновлено {updated}, без изменений {unchanged}.")
+
+    def export_csv(self):
+        # Выгрузка изменённых за запуск таблиц хранилища в CSV
+        for file_name in sorted(self.updated_files):
+            count = self.store.export_csv(file_name)
+            print(f"Файл {file_name} обновлен ({count} записей).")
+        self.updated_files.clear()
 
     def get_employees(self, company_id):
         url = f"{self.base_url}/companies/{company_id}/employees"
@@ -71,44 +86,109 @@ class MoyGrafikAPI:
         new_data = [details for details in data.values() if details.get('timezone_id') == 516]
         self.update_csv('employees.csv', new_data)
 
+    def iter_presence_window(self, company_id, start_date, end_date):
+        # Строки отчёта о присутствии за одно окно дат; ответ разбирается потоково
+        presences = self.client.iter_presences(company_id, start_date.strftime('%d-%m-%Y'),
+                                               end_date.strftime('%d-%m-%Y'))
+        for presence in presences:
+            employee = presence['employee']
+            if employee.get('timezone_id') == 516:  # Фильтрация по timezone_id 516
+                for time_entry in presence.get('time_data', []):
+                    time_entry['employee_id'] = employee['id']
+                    time_entry['first_name'] = employee['first_name']
+                    time_entry['last_name'] = employee['last_name']
+                    time_entry['email'] = employee.get('email')
+                    yield time_entry
+
+    def fetch_presence_window(self, company_id, start_date, end_date):
+        # Получение строк отчёта о присутствии за одно окно дат (без записи в CSV)
+        return list(self.iter_presence_window(company_id, start_date, end_date))
+
     def get_presence_report(self, company_id, start_date, end_date):
-        url = f"{self.base_url}/reports/presence/{company_id}"
-        params = {
-            'start_date': start_date.strftime('%d-%m-%Y'),
-            'end_date': end_date.strftime('%d-%m-%Y')
+        # Строки сразу записываются в хранилище, не накапливаясь в памяти
+        self.update_csv('presence_report.csv', self.iter_presence_window(company_id, start_date, end_date))
+
+    def load_backfill_state(self, state_file, start_date, end_date):
+        # Загрузка списка уже выгруженных окон; при другом периоде начинаем заново
+        if not state_file.exists():
+            return set()
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+        if state.get('start_date') != start_date.strftime('%Y-%m-%d') or \
+                state.get('end_date') != end_date.strftime('%Y-%m-%d'):
+            print(f"Файл {state_file.name} относится к другому периоду, начинаем выгрузку заново.")
+            return set()
+        return set(state.get('completed', []))
+
+    def save_backfill_state(self, state_file, start_date, end_date, completed):
+        # Атомарная запись списка выгруженных окон
+        state = {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'completed': sorted(completed)
         }
+        tmp_file = state_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, state_file)
+
+    def backfill_presence_report(self, company_id, start_date, end_date, step_days=10,
+                                 max_workers=BACKFILL_WORKERS, resume=True):
+        """
+        Загружает отчёт о присутствии за период окнами по step_days дней параллельно
+        (не более max_workers запросов одновременно). Каждое окно записывается в хранилище
+        сразу после выгрузки, поэтому в памяти не больше max_workers окон; CSV формируется один раз.
+        При resume=True уже выгруженные окна пропускаются, а каждое успешно выгруженное окно
+        отмечается в presence_backfill_state.json сразу после записи его данных в хранилище:
+        окна завершаются не по порядку, поэтому сохраняется множество начал окон, а не последнее.
+        """
+        windows = list(presence_windows(start_date, end_date, step_days))
+        state_file = self.data_dir / BACKFILL_STATE_FILE
+        completed = self.load_backfill_state(state_file, start_date, end_date) if resume else set()
+        pending = [window for window in windows if window[0].strftime('%Y-%m-%d') not in completed]
+        print(f"Окон всего: {len(windows)}, уже выгружено: {len(windows) - len(pending)}, "
+              f"к выгрузке: {len(pending)} (потоков: {max_workers}).")
 
-        presences = []
-        data = self.fetch_data(url, params=params)['placements']
-        for placement_id, placement_data in data.items():
-            for presence in placement_data.get('presences', []):
-                employee = presence['employee']
-                if employee.get('timezone_id') == 516:  # Фильтрация по timezone_id 516
-                    for time_entry in presence.get('time_data', []):
-                        time_entry['employee_id'] = employee['id']
-                        time_entry['first_name'] = employee['first_name']
-                        time_entry['last_name'] = employee['last_name']
-                        time_entry['email'] = employee.get('email')
-                        presences.append(time_entry)
-        self.update_csv('presence_report.csv', presences)
+        fetched = []
+        failed = []
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.fetch_presence_window, company_id, window_start, window_end):
+                    (window_start, window_end)
+                for window_start, window_end in pending
+            }
+            for future in as_completed(futures):
+                window_start, window_end = futures[future]
+                window_name = f"{window_start:%d-%m-%Y} - {window_end:%d-%m-%Y}"
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"Ошибка выгрузки окна {window_name}: {e}")
+                    failed.append(window_start)
+                    continue
+                print(f"Окно {window_name}: {len(rows)} записей.")
+                if rows:
+                    self.update_csv('presence_report.csv', rows)
+                fetched.append(window_start.strftime('%Y-%m-%d'))
+                # Отметка сразу после фиксации строк окна: сбой или остановка не теряют завершённые окна
+                if resume:
+                    completed.add(fetched[-1])
+                    self.save_backfill_state(state_file, start_date, end_date, completed)
+        print(f"Выгружено окон: {len(fetched)}, ошибок: {len(failed)}, "
+              f"за {time.monotonic() - started_at:.2f} с.")
+        if failed:
+            raise RuntimeError(f"Не удалось выгрузить окон: {len(failed)}. "
+                               f"Повторный запуск продолжит с невыгруженных окон.")
 
     def get_placements(self, company_id):
-        url = f"{self.base_url}/companies/{company_id}/placements"
-        data = self.fetch_data(url)['placements']
-        new_data = list(data.values())
-        self.update_csv('placements.csv', new_data)
+        self.update_dimension('placements', company_id)
 
     def get_subdivisions(self, company_id):
-        url = f"{self.base_url}/companies/{company_id}/subdivisions"
-        data = self.fetch_data(url)['subdivisions']
-        new_data = list(data.values())
-        self.update_csv('subdivisions.csv', new_data)
+        self.update_dimension('subdivisions', company_id)
 
     def get_positions(self, company_id):
-        url = f"{self.base_url}/companies/{company_id}/positions"
-        data = self.fetch_data(url)['positions']
-        new_data = list(data.values())
-        self.update_csv('positions.csv', new_data)
+        self.update_dimension('positions', company_id)
 
     def record_last_run(self):
         last_run_file = self.data_dir / "last_run.txt"
@@ -118,43 +198,61 @@ class MoyGrafikAPI:
         print(f"Время последнего запуска записано: {current_time}")
 
 
-# Пример использования
-data_path = "/Users/shish.me/PycharmProjects/MoyGrafik_bot_01/database"  # Укажите ваш путь здесь
-api = MoyGrafikAPI(data_path)
-company_id = 1525
-
-# Обновляем данные сотрудников, размещений, подразделений и позиций
-api.get_employees(company_id=company_id)
-
-# Определяем начальную дату за 11 дней до текущей для 10-дневного шага
-current_date = datetime.now()
-start_date = current_date - timedelta(days=11)
-
-# Получаем данные о присутствии с шагом в 10 дней
-while start_date < current_date:
-    end_date = start_date + timedelta(days=9)
-    if end_date > current_date:
-        end_date = current_date
-    api.get_presence_report(company_id=company_id, start_date=start_date, end_date=end_date)
-    start_date += timedelta(days=10)
-
-# Записываем время последнего запуска
-api.record_last_run()
-
-# Загрузим и выведем каждый DataFrame
-employees_df = pd.read_csv(api.data_dir / 'employees.csv')
-placements_df = pd.read_csv(api.data_dir / 'placements.csv')
-subdivisions_df = pd.read_csv(api.data_dir / 'subdivisions.csv')
-positions_df = pd.read_csv(api.data_dir / 'positions.csv')
-presence_report_df = pd.read_csv(api.data_dir / 'presence_report.csv')
-
-print("Employees:")
-print(employees_df)
-print("\nPlacements:")
-print(placements_df)
-print("\nSubdivisions:")
-print(subdivisions_df)
-print("\nPositions:")
-print(positions_df)
-print("\nPresence Report:")
-print(presence_report_df)
\ No newline at end of file
+def parse_args():
+    parser = argparse.ArgumentParser(description="Выгрузка данных МойГрафик в CSV")
+    parser.add_argument('--backfill-from', help="Начало периода исторической выгрузки (ГГГГ-ММ-ДД)")
+    parser.add_argument('--backfill-to', help="Конец периода исторической выгрузки (ГГГГ-ММ-ДД), по умолчанию сегодня")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help="Число параллельных запросов")
+    parser.add_argument('--no-resume', action='store_true', help="Не продолжать прерванную выгрузку, начать заново")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    data_path = "/Users/shish.me/PycharmProjects/MoyGrafik_bot_01/database"  # Укажите ваш путь здесь
+    api = MoyGrafikAPI(data_path)
+    company_id = 1525
+
+    # Обновляем данные сотрудников, размещений, подразделений и позиций
+    api.get_employees(company_id=company_id)
+
+    current_date = datetime.now()
+    if args.backfill_from:
+        # Историческая выгрузка: параллельно по окнам, с продолжением после сбоя
+        backfill_to = datetime.strptime(args.backfill_to, '%Y-%m-%d') if args.backfill_to else current_date
+        api.backfill_presence_report(company_id=company_id,
+                                     start_date=datetime.strptime(args.backfill_from, '%Y-%m-%d'),
+                                     end_date=backfill_to, max_workers=args.workers, resume=not args.no_resume)
+    else:
+        # Обычный запуск: последние 11 дней окнами по 10 дней
+        api.backfill_presence_report(company_id=company_id, start_date=current_date - timedelta(days=11),
+                                     end_date=current_date, max_workers=args.workers, resume=False)
+
+    # Формируем CSV из хранилища один раз за запуск
+    api.export_csv()
+
+    # Записываем время последнего запуска
+    api.record_last_run()
+    api_metrics.log_summary(log=print)
+
+    # Загрузим и выведем каждый DataFrame
+    employees_df = pd.read_csv(api.data_dir / 'employees.csv')
+    placements_df = pd.read_csv(api.data_dir / 'placements.csv')
+    subdivisions_df = pd.read_csv(api.data_dir / 'subdivisions.csv')
+    positions_df = pd.read_csv(api.data_dir / 'positions.csv')
+    presence_report_df = pd.read_csv(api.data_dir / 'presence_report.csv')
+
+    print("Employees:")
+    print(employees_df)
+    print("\nPlacements:")
+    print(placements_df)
+    print("\nSubdivisions:")
+    print(subdivisions_df)
+    print("\nPositions:")
+    print(positions_df)
+    print("\nPresence Report:")
+    print(presence_report_df)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,23 @@
-import requests
 import json
 import os
+import sys
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.moygrafik_api import MoyGrafikAPI as MoyGrafikClient, api_metrics
 
 
 class MoyGrafikAPI:
     def __init__(self):
-        self.token = 'Bearer NmY3OTIxMTE3N2M2ZDE2NTVjN2I5NmQwMTBmNjlkZDcxNTE3MjQwODdlYzI5NmJjMWNkZWUzMjVhY2FmODc0Yw'
-        self.base_url = 'https://api.moygrafik.ru/api/external/v1'
-        self.base_url_v1_1 = 'https://api.moygrafik.ru/api/external/v1.1'
-        self.headers = {'Authorization': self.token}
+        # Общий клиент API: пул соединений, таймауты и повторы при 429/5xx
+        self.client = MoyGrafikClient()
+        self.base_url = self.client.base_url
+        self.base_url_v1_1 = self.client.base_url_v1_1
 
     def get_employees(self, company_id):
         url = f"{self.base_url}/companies/{company_id}/employees"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        employees_dict = response.json()
+        employees_dict = self.client.fetch(url)
 
         # Convert the dictionary to a list of employee dictionaries
         if isinstance(employees_dict, dict):
@@ -26,9 +29,7 @@ class MoyGrafikAPI:
 
     def get_placements(self, company_id):
         url = f"{self.base_url}/companies/{company_id}/placements"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        placements_dict = response.json()
+        placements_dict = self.client.fetch(url)
 
         # Convert the dictionary to a list of placement dictionaries
         if isinstance(placements_dict, dict):
@@ -40,9 +41,7 @@ class MoyGrafikAPI:
 
     def get_subdivisions(self, company_id):
         url = f"{self.base_url}/companies/{company_id}/subdivisions"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        subdivisions_dict = response.json()
+        subdivisions_dict = self.client.fetch(url)
 
         # Convert the dictionary to a list of subdivision dictionaries
         if isinstance(subdivisions_dict, dict):
@@ -54,9 +53,7 @@ class MoyGrafikAPI:
 
     def get_positions(self, company_id):
         url = f"{self.base_url}/companies/{company_id}/positions"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        positions_dict = response.json()
+        positions_dict = self.client.fetch(url)
 
         # Convert the dictionary to a list of position dictionaries
         if isinstance(positions_dict, dict):
@@ -67,10 +64,8 @@ class MoyGrafikAPI:
         return positions
 
     def test_identification(self, company_id, mac_address):
-        url = f"{self.base_url_v1_1}/identification/companies/{company_id}/test?mac={mac_address}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        identification_result = response.json()
+        url = f"{self.base_url_v1_1}/identification/companies/{company_id}/test"
+        identification_result = self.client.fetch(url, params={'mac': mac_address})
 
         # Handle identification result as needed
         if not isinstance(identification_result, dict):
@@ -85,9 +80,7 @@ class MoyGrafikAPI:
             'end_date': end_date,
             'positions': positions
         }
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        presence_report_dict = response.json()
+        presence_report_dict = self.client.fetch(url, params=params)
 
         # Convert the dictionary to a list of dictionaries if necessary
         if isinstance(presence_report_dict, dict):
@@ -153,6 +146,8 @@ def main():
 
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        api_metrics.log_summary(log=print)
 
 
 if __name__ == '__main__':
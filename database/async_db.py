@@ -0,0 +1,49 @@
+import os
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from common.metrics import instrument_engine
+from database import query_stats
+
+# Размер пула асинхронных подключений по умолчанию (на весь процесс бота),
+# переопределяется переменными DB_POOL_SIZE и DB_MAX_OVERFLOW
+POOL_SIZE = 10
+MAX_OVERFLOW = 10
+
+_async_engine = None
+
+
+def to_async_url(url):
+    """Переводит URL базы данных (postgresql://, postgresql+psycopg2://) на драйвер asyncpg."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def get_async_engine():
+    """
+    Возвращает общий асинхронный движок SQLAlchemy (создаётся при первом обращении).
+    Запросы через него не блокируют цикл событий бота, в отличие от database.db.engine.
+    """
+    global _async_engine
+    if _async_engine is None:
+        # Загрузка переменных окружения из .env
+        load_dotenv()
+        _async_engine = create_async_engine(
+            to_async_url(os.getenv("DB_URL")),
+            pool_size=int(os.getenv("DB_POOL_SIZE", POOL_SIZE)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", MAX_OVERFLOW)),
+            pool_pre_ping=True
+        )
+        instrument_engine(_async_engine.sync_engine, 'async')
+        query_stats.install(_async_engine.sync_engine)
+    return _async_engine
+
+
+async def dispose_async_engine():
+    """Закрывает соединения пула (при остановке бота)."""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
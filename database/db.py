@@ -1,13 +1,35 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, BigInteger, Integer, String, Boolean, Double, Text, ForeignKey, PrimaryKeyConstraint
+from sqlalchemy import create_engine, MetaData, Table, Column, BigInteger, Integer, String, Boolean, Double, Text, Date, DateTime, ForeignKey, PrimaryKeyConstraint, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from dotenv import load_dotenv
 import os
 
-# Загрузка переменных окружения из .env
-load_dotenv()
-DATABASE_URL = os.getenv("DB_URL")
+from common.metrics import instrument_engine
+from database import query_stats
+
+_engine = None
+
+
+def get_engine():
+    """
+    Возвращает общий синхронный движок (создаётся при первом обращении).
+    Импорт модуля не читает .env и не подключается к базе данных.
+    """
+    global _engine
+    if _engine is None:
+        # Загрузка переменных окружения из .env
+        load_dotenv()
+        _engine = create_engine(os.getenv("DB_URL"))
+        instrument_engine(_engine, 'sync')
+        query_stats.install(_engine)
+    return _engine
+
+
+def __getattr__(name):
+    # Совместимость со старым `from database.db import engine`: движок создаётся при обращении
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Создание подключения к базе данных
-engine = create_engine(DATABASE_URL)
 
 # Создание объекта MetaData
 metadata = MetaData()
@@ -16,26 +38,26 @@ metadata = MetaData()
 employees = Table(
     'employees', metadata,
     Column('id', BigInteger, primary_key=True),
-    Column('user_id', Double),
+    Column('user_id', BigInteger),
     Column('company_id', BigInteger),
     Column('timezone_id', BigInteger),
-    Column('telegram_id', Double),
+    Column('telegram_id', BigInteger),
     Column('presence_close_rule', Double),
-    Column('phone', Double),
-    Column('identification_photos', Text),  # Изменено с Double на Text
+    Column('phone', BigInteger),
+    Column('identification_photos', JSONB),
     Column('identification_photos_count', Double),
     Column('preferred_photo', Double),
     Column('email', Text),
-    Column('positions', Text),
+    Column('positions', JSONB),
     Column('avatar', Text),
     Column('avatar_big', Text),
-    Column('placements', Text),
+    Column('placements', JSONB),
     Column('first_name', Text),
     Column('last_name', Text),
     Column('snils', Text),
     Column('clid', Text),
-    Column('sites', Text),
-    Column('subdivisions', Text)
+    Column('sites', JSONB),
+    Column('subdivisions', JSONB)
 )
 
 # Определение таблицы placements
@@ -51,10 +73,10 @@ placements = Table(
     Column('liveness_enabled', Boolean),
     Column('clid', Double),
     Column('name', Text),
-    Column('ips', Text),
+    Column('ips', JSONB),
     Column('color', Text),
-    Column('mac_addresses', Text),
-    Column('managers', Text)
+    Column('mac_addresses', JSONB),
+    Column('managers', JSONB)
 )
 
 # Определение таблицы positions
@@ -67,17 +89,17 @@ positions = Table(
     Column('color', Text),
     Column('color_id', BigInteger),
     Column('status', BigInteger),
-    Column('managers', Text),
-    Column('subdivisions', Text)
+    Column('managers', JSONB),
+    Column('subdivisions', JSONB)
 )
 
 # database/db.py
 presence_report = Table(
     'presence_report', metadata,
     Column('employee_id', BigInteger, ForeignKey('employees.id')),
-    Column('date', Text),
-    Column('start_time', Text),
-    Column('end_time', Text),
+    Column('date', Date),
+    Column('start_time', DateTime),
+    Column('end_time', DateTime),
     Column('is_night_shift', Boolean),
     Column('original_estimate', BigInteger),
     Column('real_estimate', BigInteger),
@@ -85,7 +107,8 @@ presence_report = Table(
     Column('first_name', Text),
     Column('last_name', Text),
     Column('email', Text),
-    PrimaryKeyConstraint('employee_id', 'date')
+    PrimaryKeyConstraint('employee_id', 'date'),
+    Index('ix_presence_report_date', 'date')
 )
 
 # Определение таблицы subdivisions
@@ -98,8 +121,8 @@ subdivisions = Table(
     Column('color', Text),
     Column('color_id', BigInteger),
     Column('status', BigInteger),
-    Column('managers', Text),
-    Column('placements', Text)
+    Column('managers', JSONB),
+    Column('placements', JSONB)
 )
 
 # Определение таблицы user_settings
@@ -108,9 +131,11 @@ user_settings = Table(
     Column('telegram_id', BigInteger, primary_key=True),
     Column('employee_id', BigInteger, ForeignKey('employees.id')),
     Column('subscribed', Boolean, default=True),
-    Column('vacation_start', Text, nullable=True),
-    Column('vacation_end', Text, nullable=True),
-    Column('notification_times', Text, default='[]')  # Список времен оповещений в формате JSON
+    Column('vacation_start', Date, nullable=True),
+    Column('vacation_end', Date, nullable=True),
+    Column('arrival_notification_times', JSONB, server_default=text("'[]'::jsonb")),  # Список времён ЧЧ:ММ
+    Column('departure_notification_times', JSONB, server_default=text("'[]'::jsonb")),
+    Index('ix_user_settings_employee_id', 'employee_id')
 )
 
 # Определение таблицы notifications
@@ -119,8 +144,18 @@ notifications = Table(
     Column('id', BigInteger, primary_key=True, autoincrement=True),
     Column('telegram_id', BigInteger, ForeignKey('user_settings.telegram_id')),
     Column('message', Text),
-    Column('sent_at', Text),
-    Column('status', Text, default='pending')  # pending, sent, failed
+    Column('sent_at', DateTime),
+    Column('status', Text, default='pending'),  # pending, sent, failed
+    Index('ix_notifications_telegram_id_sent_at', 'telegram_id', 'sent_at')
+)
+
+# Определение таблицы sync_state (состояние инкрементальной синхронизации ETL)
+sync_state = Table(
+    'sync_state', metadata,
+    Column('table_name', Text, primary_key=True),
+    Column('high_water_mark', Text, nullable=True),  # Для presence_report — максимальная загруженная дата
+    Column('rows_changed', BigInteger),
+    Column('synced_at', Text)
 )
 
 
@@ -130,6 +165,10 @@ timezones = Table(
     Column('name', String, unique=True)  # Например, 'Asia/Vladivostok'
 )
 
-# Создание всех таблиц
-metadata.create_all(engine)
-print("Все таблицы были успешно созданы с указанными типами данных и связями.")
\ No newline at end of file
+
+
+def create_schema():
+    """Создаёт и обновляет схему базы данных цепочкой миграций (database/migrations.py)."""
+    # Импорт здесь: migrations сам импортирует этот модуль
+    from database.migrations import migrate
+    migrate()
\ No newline at end of file
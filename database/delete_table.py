@@ -1,5 +1,5 @@
 from sqlalchemy import create_engine, text
-from database.db import engine 
+from database.db import get_engine
 
 def drop_specified_tables(connection, tables):
     """
@@ -22,6 +22,7 @@ tables_to_delete = [
     'subdivisions'
 ]
 
-# Исполнение функции
-with engine.begin() as connection:
-    drop_specified_tables(connection, tables_to_delete)
\ No newline at end of file
+if __name__ == '__main__':
+    # Исполнение функции
+    with get_engine().begin() as connection:
+        drop_specified_tables(connection, tables_to_delete)
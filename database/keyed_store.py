@@ -0,0 +1,120 @@
+import json
+import math
+import sqlite3
+import pandas as pd
+from pathlib import Path
+
+# Ключи записей для каждого файла выгрузки
+KEY_FIELDS = {
+    'employees.csv': ('id',),
+    'placements.csv': ('id',),
+    'subdivisions.csv': ('id',),
+    'positions.csv': ('id',),
+    'presence_report.csv': ('employee_id', 'date'),
+}
+UPSERT_BATCH_SIZE = 5000  # Сколько записей держать в памяти перед записью в хранилище
+
+
+def normalize_value(value):
+    # Скаляры numpy -> Python, NaN из pandas -> None, целые float (123.0 после read_csv) -> int
+    if hasattr(value, 'item') and not isinstance(value, (list, dict)):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def record_key(record, key_fields):
+    # Строковый ключ записи: значения ключевых полей через '|'
+    return '|'.join(str(normalize_value(record.get(field))) for field in key_fields)
+
+
+class KeyedStore:
+    """
+    Локальное хранилище выгрузок API в SQLite: одна таблица на файл, строка = ключ + JSON записи.
+    Запись стоит O(новых строк): новые ключи добавляются, изменённые записи заменяются,
+    неизменённые не трогаются. CSV-файлы формируются из хранилища один раз в конце выгрузки.
+    """
+
+    def __init__(self, data_dir, db_name='api_store.sqlite3'):
+        self.data_dir = Path(data_dir)
+        self.connection = sqlite3.connect(self.data_dir / db_name)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+
+    @staticmethod
+    def table_name(file_name):
+        return Path(file_name).stem
+
+    def _ensure_table(self, file_name):
+        # Создаёт таблицу и при первом запуске переносит в неё существующий CSV
+        table = self.table_name(file_name)
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if exists:
+            return table
+        self.connection.execute(f"CREATE TABLE {table} (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        csv_path = self.data_dir / file_name
+        if csv_path.exists():
+            existing_df = pd.read_csv(csv_path)
+            records = existing_df.to_dict('records')
+            self.upsert(file_name, records, table=table)
+            print(f"В хранилище перенесено {len(records)} записей из {file_name}.")
+        self.connection.commit()
+        return table
+
+    def upsert(self, file_name, records, table=None):
+        """
+        Добавляет или заменяет записи по ключу. Возвращает (новых, обновлённых, без изменений).
+        records может быть генератором: записи обрабатываются пачками по UPSERT_BATCH_SIZE.
+        """
+        table = table or self._ensure_table(file_name)
+        key_fields = KEY_FIELDS[file_name]
+        totals = [0, 0, 0]
+
+        rows = {}
+        for record in records:
+            record = {column: normalize_value(value) for column, value in record.items()}
+            # Последняя запись с тем же ключом в пачке побеждает
+            rows[record_key(record, key_fields)] = json.dumps(record, ensure_ascii=False)
+            if len(rows) >= UPSERT_BATCH_SIZE:
+                totals = [total + count for total, count in zip(totals, self._upsert_rows(table, rows))]
+                rows = {}
+        if rows:
+            totals = [total + count for total, count in zip(totals, self._upsert_rows(table, rows))]
+        return tuple(totals)
+
+    def _upsert_rows(self, table, rows):
+        # rows: {ключ: JSON записи}
+        keys = list(rows)
+        existing = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            existing.update(self.connection.execute(
+                f"SELECT key, data FROM {table} WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+
+        inserted = sum(1 for key in keys if key not in existing)
+        changed = [(key, data) for key, data in rows.items() if existing.get(key) != data]
+        self.connection.executemany(
+            f"INSERT INTO {table} (key, data) VALUES (?, ?) "
+            f"ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            changed
+        )
+        self.connection.commit()
+        return inserted, len(changed) - inserted, len(rows) - len(changed)
+
+    def export_csv(self, file_name):
+        """Записывает содержимое таблицы в CSV (в порядке первого появления ключей)."""
+        table = self._ensure_table(file_name)
+        records = [json.loads(data) for (data,) in
+                   self.connection.execute(f"SELECT data FROM {table} ORDER BY rowid")]
+        pd.DataFrame(records).to_csv(self.data_dir / file_name, index=False)
+        return len(records)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,67 @@
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Таблицы связей, заполняемые из JSONB-списков:
+# (таблица связей, исходная таблица, столбец со списком, столбец владельца, столбец элемента списка)
+LINK_TABLES = [
+    ('employee_placements', 'employees', 'placements', 'employee_id', 'placement_id'),
+    ('employee_subdivisions', 'employees', 'subdivisions', 'employee_id', 'subdivision_id'),
+    ('employee_positions', 'employees', 'positions', 'employee_id', 'position_id'),
+    ('placement_managers', 'placements', 'managers', 'placement_id', 'manager_id'),
+    ('position_managers', 'positions', 'managers', 'position_id', 'manager_id'),
+    ('position_subdivisions', 'positions', 'subdivisions', 'position_id', 'subdivision_id'),
+    ('subdivision_managers', 'subdivisions', 'managers', 'subdivision_id', 'manager_id'),
+    ('subdivision_placements', 'subdivisions', 'placements', 'subdivision_id', 'placement_id'),
+]
+# Таблицы, у которых есть связи (для остальных, например presence_report, пересборка не нужна)
+LINKED_TABLES = {source_table for _, source_table, _, _, _ in LINK_TABLES}
+
+
+def create_link_tables(connection):
+    """
+    Создаёт таблицы связей (вызывается только из миграции: CREATE INDEX берёт блокировку SHARE до конца
+    транзакции, и параллельные загрузки таблиц могли бы взаимно заблокироваться).
+    Первичный ключ (владелец, элемент) обслуживает выборки по владельцу, обратный индекс
+    (элемент, владелец) — вопросы вида «все сотрудники подразделения X» или «чем руководит менеджер Y».
+    """
+    for link_table, _, _, owner_column, item_column in LINK_TABLES:
+        connection.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {link_table} (
+                {owner_column} BIGINT NOT NULL,
+                {item_column} BIGINT NOT NULL,
+                PRIMARY KEY ({owner_column}, {item_column})
+            )
+        """))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{link_table}_{item_column} ON {link_table} ({item_column}, {owner_column})"
+        ))
+
+
+def refresh_link_tables(connection, table_name, ids=None):
+    """
+    Пересобирает связи для строк таблицы table_name по её JSONB-спискам.
+    Если переданы ids, обновляются только связи этих строк (например, вставленных или изменённых upsert);
+    пустой список — ничего не изменилось. Таблицы связей создаёт миграция database/migrations.py.
+    """
+    if table_name not in LINKED_TABLES or (ids is not None and not ids):
+        return
+    params = {} if ids is None else {'ids': list(ids)}
+    for link_table, source_table, list_column, owner_column, item_column in LINK_TABLES:
+        if source_table != table_name:
+            continue
+        owner_filter = f"WHERE {owner_column} = ANY(:ids)" if ids is not None else ""
+        source_filter = "AND s.id = ANY(:ids)" if ids is not None else ""
+        connection.execute(text(f"DELETE FROM {link_table} {owner_filter}"), params)
+        result = connection.execute(text(f"""
+            INSERT INTO {link_table} ({owner_column}, {item_column})
+            SELECT DISTINCT s.id, item.value::BIGINT
+            FROM {source_table} s
+            CROSS JOIN LATERAL jsonb_array_elements_text(s.{list_column}) AS item(value)
+            WHERE jsonb_typeof(s.{list_column}) = 'array'
+            AND item.value ~ '^[0-9]+$'
+            {source_filter}
+            ON CONFLICT DO NOTHING
+        """), params)
+        logger.info(f"Таблица связей {link_table}: записано {result.rowcount} связей")
@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from api.moygrafik_api import MoyGrafikAPI, api_metrics
+from database.db import get_engine
+from database.pipeline import Pipeline, SKIP
+from common.metrics import ETL_ROWS, write_textfile
+from database.UPDATE_DATABASE import (TABLE_COLUMNS, KEY_COLUMNS, SYNC_MODE, clean_clid, upsert_table,
+                                      clear_and_replace_table, save_sync_state)
+
+logger = logging.getLogger(__name__)
+
+COMPANY_ID = 1525
+TIMEZONE_ID = 516  # Выгружаем только сотрудников с этим часовым поясом (как Update_CSV)
+COPY_BATCH_SIZE = 10000  # Сколько строк отправлять в одном COPY
+# Редко меняющиеся справочники: запрашиваются условно и пропускаются, если ответ API не изменился
+DIMENSIONS = ('placements', 'positions', 'subdivisions')
+
+
+def to_copy_value(value):
+    """Преобразует значение из JSON API в текст для COPY (списки — JSON-текст для столбцов JSONB)."""
+    if value is None:
+        return None
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def employee_rows(payload):
+    """Строки таблицы employees из ответа /companies/{id}/employees."""
+    for details in payload['employees'].values():
+        if details.get('timezone_id') != TIMEZONE_ID:
+            continue
+        row = dict(details)
+        row['clid'] = clean_clid(row.get('clid'))
+        yield row
+
+
+def dimension_rows(payload, key):
+    """Строки справочника (placements, positions, subdivisions) из ответа API."""
+    for details in payload[key].values():
+        row = dict(details)
+        if 'clid' in row:
+            row['clid'] = clean_clid(row['clid'])
+        yield row
+
+
+def presence_rows(presences):
+    """Плоские строки presence_report из записей presences (employee + time_data)."""
+    for presence in presences:
+        employee = presence['employee']
+        if employee.get('timezone_id') != TIMEZONE_ID:
+            continue
+        for time_entry in presence.get('time_data', []):
+            row = dict(time_entry)
+            row['employee_id'] = employee['id']
+            row['first_name'] = employee['first_name']
+            row['last_name'] = employee['last_name']
+            row['email'] = employee.get('email')
+            yield row
+
+
+def presence_windows(start_date, end_date, step_days=10):
+    """Разбивает период на окна по step_days дней (так же, как Update_CSV)."""
+    while start_date < end_date:
+        window_end = min(start_date + timedelta(days=step_days - 1), end_date)
+        yield start_date, window_end
+        start_date += timedelta(days=step_days)
+
+
+def copy_rows(connection, temp_table_name, columns, rows, batch_size=COPY_BATCH_SIZE):
+    """Загружает строки во временную таблицу через COPY FROM STDIN пачками. Возвращает число строк."""
+    cursor = connection.connection.cursor()
+    copy_sql = f"COPY {temp_table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    try:
+        for row in rows:
+            writer.writerow([to_copy_value(row.get(column)) for column in columns])
+            pending += 1
+            if pending >= batch_size:
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+                total += pending
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            total += pending
+    finally:
+        cursor.close()
+    return total
+
+
+def load_table(table_name, rows, mode=SYNC_MODE):
+    """Загружает строки из API в таблицу: COPY во временную таблицу и перенос (upsert или полная замена)."""
+    temp_table_name = f"{table_name}_temp"
+    columns = [column for column, _ in TABLE_COLUMNS[table_name]]
+    keys = KEY_COLUMNS[table_name]
+    started_at = time.monotonic()
+
+    with get_engine().begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {temp_table_name};"))
+        connection.execute(text(
+            f"CREATE TEMP TABLE {temp_table_name} ({', '.join(f'{column} TEXT' for column in columns)}) ON COMMIT DROP;"
+        ))
+        copied = copy_rows(connection, temp_table_name, columns, rows)
+        if not copied:
+            logger.warning(f"API не вернуло данных для таблицы {table_name}, пропускаем")
+            return 0
+
+        # Оставляем последнюю строку для каждого ключа (сотрудник может встречаться в нескольких размещениях)
+        key_match = ' AND '.join(f"a.{key} = b.{key}" for key in keys)
+        duplicates = connection.execute(text(
+            f"DELETE FROM {temp_table_name} a USING {temp_table_name} b WHERE {key_match} AND a.ctid < b.ctid;"
+        )).rowcount
+        if duplicates:
+            logger.warning(f"Удалено дубликатов в данных {table_name}: {duplicates}")
+
+        if mode == 'incremental':
+            rows_changed = upsert_table(connection, table_name, temp_table_name)
+        else:
+            rows_changed = clear_and_replace_table(connection, table_name, temp_table_name)
+        save_sync_state(connection, table_name, temp_table_name, rows_changed)
+    # Как и при загрузке из CSV: изменённые строки после фиксации транзакции
+    ETL_ROWS.inc(rows_changed, source='api', table=table_name)
+
+    elapsed = time.monotonic() - started_at
+    rate = copied / elapsed if elapsed > 0 else float(copied)
+    logger.info(f"Таблица {table_name}: получено {copied} строк, изменено {rows_changed}, "
+                f"за {elapsed:.2f} с ({rate:.0f} строк/с)")
+    return copied
+
+
+def iter_presence_report(api, company_id, start_date, end_date):
+    """
+    Строки presence_report по всем окнам периода. Ответы разбираются потоково и строки сразу
+    уходят в COPY, поэтому память не растёт с длиной периода.
+    """
+    for window_start, window_end in presence_windows(start_date, end_date):
+        yield from presence_rows(api.iter_presences(company_id, window_start.strftime('%d-%m-%Y'),
+                                                    window_end.strftime('%d-%m-%Y')))
+
+
+def fetch_dimension(fetch, company_id, if_changed=True):
+    """
+    (Ответ справочника, PendingEntry или None) или SKIP, если ответ не изменился с прошлого запуска.
+    Ответ не записывается в кэш до загрузки в БД: это делает стадия cache_<таблица>.
+    """
+    payload, pending = fetch(company_id, if_changed=if_changed, pending=True)
+    return SKIP if payload is None else (payload, pending)
+
+
+def commit_cached(fetched):
+    """Фиксирует в кэше ответ справочника, данные которого уже в БД; без нового ответа — SKIP."""
+    if fetched is None or fetched[1] is None:
+        return SKIP
+    fetched[1].commit()
+
+
+def build_pipeline(api, company_id=COMPANY_ID, days=11, mode=SYNC_MODE, before_load=(), force=False):
+    """
+    Конвейер загрузки fetch -> normalize -> load для каждой таблицы.
+    Справочники и сотрудники загружаются параллельно, presence_report — после employees.
+    Справочники запрашиваются условно: если ответ API не изменился (304 или тот же хэш тела),
+    стадии fetch, normalize и load справочника пропускаются. Стадия load пропускается и тогда,
+    когда нормализованные строки не изменились с прошлого успешного запуска. Новый ответ справочника
+    записывается в кэш стадией cache_<таблица> только после загрузки: если load не выполнена,
+    следующий запуск снова получит и загрузит этот ответ.
+    presence_report загружается одной потоковой стадией без отпечатка: строки не накапливаются в памяти.
+    before_load — стадии (имя, функция, зависимости), которые должны завершиться до любой загрузки в БД
+    (например, миграции).
+    """
+    pipeline = Pipeline('load_from_api')
+    for stage_name, func, deps in before_load:
+        pipeline.add(stage_name, func, deps)
+    load_deps = tuple(stage_name for stage_name, _, _ in before_load)
+
+    sources = {
+        'placements': (api.get_placements, lambda payload: dimension_rows(payload, 'placements')),
+        'positions': (api.get_positions, lambda payload: dimension_rows(payload, 'positions')),
+        'subdivisions': (api.get_subdivisions, lambda payload: dimension_rows(payload, 'subdivisions')),
+        'employees': (api.get_employees, employee_rows),
+    }
+    for table_name, (fetch, normalize) in sources.items():
+        if table_name in DIMENSIONS:
+            # При force справочник загружается, даже если ответ API не изменился
+            pipeline.add(f'fetch_{table_name}',
+                         lambda inputs, fetch=fetch: fetch_dimension(fetch, company_id, if_changed=not force))
+            pipeline.add(f'normalize_{table_name}',
+                         lambda inputs, t=table_name, normalize=normalize: list(normalize(inputs[f'fetch_{t}'][0])),
+                         deps=[f'fetch_{table_name}'], table=table_name)
+        else:
+            pipeline.add(f'fetch_{table_name}', lambda inputs, fetch=fetch: fetch(company_id))
+            pipeline.add(f'normalize_{table_name}',
+                         lambda inputs, t=table_name, normalize=normalize: list(normalize(inputs[f'fetch_{t}'])),
+                         deps=[f'fetch_{table_name}'], table=table_name)
+        pipeline.add(f'load_{table_name}',
+                     lambda inputs, t=table_name: load_table(t, inputs[f'normalize_{t}'], mode),
+                     deps=[f'normalize_{table_name}', *load_deps],
+                     fingerprint=lambda inputs, t=table_name: inputs[f'normalize_{t}'], table=table_name)
+        if table_name in DIMENSIONS:
+            # Выполняется и при пропуске load по отпечатку: такие же строки уже загружены в БД
+            pipeline.add(f'cache_{table_name}', lambda inputs, t=table_name: commit_cached(inputs[f'fetch_{t}']),
+                         deps=[f'fetch_{table_name}', f'load_{table_name}'], propagate_skip=False)
+
+    current_date = datetime.now()
+    # presence_report ссылается на employees, поэтому грузится после них
+    pipeline.add('load_presence_report',
+                 lambda inputs: load_table('presence_report', iter_presence_report(
+                     api, company_id, current_date - timedelta(days=days), current_date), mode),
+                 deps=['load_employees'], propagate_skip=False, table='presence_report')
+    return pipeline
+
+
+def run(company_id=COMPANY_ID, days=11, mode=SYNC_MODE, force=False, before_load=(), api=None):
+    """Загружает справочники, сотрудников и отчёт о присутствии из API напрямую в БД."""
+    api = api or MoyGrafikAPI()
+    logger.info(f"Загрузка из API в БД, режим синхронизации: {mode}")
+    pipeline = build_pipeline(api, company_id, days, mode, before_load, force)
+    try:
+        return pipeline.run(force=force)
+    finally:
+        api_metrics.log_summary()
+        # Для textfile collector node_exporter (если задан METRICS_TEXTFILE)
+        write_textfile()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    # Таблицы связей создаются миграцией до загрузки таблиц
+    from database.migrations import migrate
+    run(before_load=[('migrate', lambda inputs: migrate(), ())])
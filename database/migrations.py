@@ -0,0 +1,183 @@
+import logging
+import os
+import sys
+from datetime import datetime
+from sqlalchemy import text
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db import get_engine, metadata
+from database.link_tables import LINK_TABLES, create_link_tables, refresh_link_tables
+
+logger = logging.getLogger(__name__)
+
+# Перевод строкового представления Python-списка ("['a', 'b']", "[1, 2]") в JSONB.
+# Значения, которые не удалось разобрать, сохраняются как JSON-строка, чтобы не потерять данные.
+PY_LIST_TO_JSONB = """
+    CREATE OR REPLACE FUNCTION migration_py_list_to_jsonb(value TEXT) RETURNS JSONB AS $$
+    BEGIN
+        IF value IS NULL OR value IN ('', 'nan', 'None') THEN
+            RETURN NULL;
+        END IF;
+        BEGIN
+            RETURN value::JSONB;
+        EXCEPTION WHEN others THEN
+            NULL;
+        END;
+        BEGIN
+            RETURN replace(replace(replace(replace(value, '''', '"'), 'None', 'null'), 'True', 'true'), 'False', 'false')::JSONB;
+        EXCEPTION WHEN others THEN
+            RETURN to_jsonb(value);
+        END;
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+
+def empty_to_null(column):
+    """SQL-выражение: пустые строки и 'nan' из CSV -> NULL."""
+    return f"NULLIF(NULLIF(TRIM({column}::TEXT), ''), 'nan')"
+
+
+def column_type(connection, table_name, column_name):
+    """Текущий тип столбца из information_schema (или None, если столбца нет)."""
+    return connection.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table_name AND column_name = :column_name
+    """), {"table_name": table_name, "column_name": column_name}).scalar()
+
+
+def alter_column_type(connection, table_name, column_name, new_type, using):
+    """Меняет тип столбца с переносом данных (USING), если он ещё не приведён к нужному."""
+    current_type = column_type(connection, table_name, column_name)
+    if current_type is None:
+        logger.warning(f"Столбец {table_name}.{column_name} не найден, пропускаем")
+        return
+    if current_type == new_type.lower() or (new_type == 'TIMESTAMP' and current_type.startswith('timestamp')):
+        return
+    connection.execute(text(
+        f"ALTER TABLE {table_name} ALTER COLUMN {column_name} DROP DEFAULT"
+    ))
+    connection.execute(text(
+        f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE {new_type} USING {using}"
+    ))
+    logger.info(f"Столбец {table_name}.{column_name}: {current_type} -> {new_type}")
+
+
+def migration_000_base_tables(connection):
+    """
+    Недостающие таблицы по описанию database/db.py (для новой базы). Уже существующие таблицы
+    не меняются: их приводят к нужным типам следующие миграции, для новых таблиц они ничего не делают.
+    """
+    metadata.create_all(connection, checkfirst=True)
+
+
+def migration_001_typed_columns_and_indexes(connection):
+    """
+    Типизированные столбцы вместо TEXT/DOUBLE и индексы для частых запросов бота.
+    start_time/end_time переводятся в TIMESTAMP, а не TIME: API отдаёт полную дату и время
+    (ночные смены заканчиваются на следующий день).
+    """
+    connection.execute(text(PY_LIST_TO_JSONB))
+
+    # presence_report: даты и время
+    alter_column_type(connection, 'presence_report', 'date', 'DATE', f"{empty_to_null('date')}::DATE")
+    for column in ('start_time', 'end_time'):
+        alter_column_type(connection, 'presence_report', column, 'TIMESTAMP', f"{empty_to_null(column)}::TIMESTAMP")
+
+    # employees: идентификаторы без потери точности и списки в JSONB
+    for column in ('telegram_id', 'phone', 'user_id'):
+        alter_column_type(connection, 'employees', column, 'BIGINT', f"ROUND({column})::BIGINT")
+    list_columns = {
+        'employees': ['identification_photos', 'positions', 'placements', 'sites', 'subdivisions'],
+        'placements': ['ips', 'mac_addresses', 'managers'],
+        'positions': ['managers', 'subdivisions'],
+        'subdivisions': ['managers', 'placements'],
+    }
+    for table_name, columns in list_columns.items():
+        for column in columns:
+            alter_column_type(connection, table_name, column, 'JSONB', f"migration_py_list_to_jsonb({column})")
+
+    # user_settings: даты отпуска и списки времён оповещений
+    for column in ('vacation_start', 'vacation_end'):
+        alter_column_type(connection, 'user_settings', column, 'DATE', f"{empty_to_null(column)}::DATE")
+    for column in ('arrival_notification_times', 'departure_notification_times'):
+        alter_column_type(connection, 'user_settings', column, 'JSONB',
+                          f"COALESCE(migration_py_list_to_jsonb({column}), '[]'::JSONB)")
+        connection.execute(text(
+            f"ALTER TABLE user_settings ALTER COLUMN {column} SET DEFAULT '[]'::JSONB"
+        ))
+
+    # notifications: время отправки
+    alter_column_type(connection, 'notifications', 'sent_at', 'TIMESTAMP', f"{empty_to_null('sent_at')}::TIMESTAMP")
+
+    connection.execute(text("DROP FUNCTION IF EXISTS migration_py_list_to_jsonb(TEXT)"))
+
+    # Индексы для поиска по сотруднику, диапазонов дат и истории оповещений
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_user_settings_employee_id ON user_settings (employee_id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_presence_report_date ON presence_report (date)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_notifications_telegram_id_sent_at ON notifications (telegram_id, sent_at)"
+    ))
+
+
+def migration_002_link_tables(connection):
+    """Таблицы связей сотрудник/размещение/подразделение/должность/менеджер с заполнением из JSONB-списков."""
+    create_link_tables(connection)
+    for table_name in sorted({source_table for _, source_table, _, _, _ in LINK_TABLES}):
+        refresh_link_tables(connection, table_name)
+
+
+# Миграции по порядку: (версия, название, функция)
+MIGRATIONS = [
+    (0, 'base_tables', migration_000_base_tables),
+    (1, 'typed_columns_and_indexes', migration_001_typed_columns_and_indexes),
+    (2, 'link_tables', migration_002_link_tables),
+]
+
+
+def get_schema_version(connection):
+    """Текущая версия схемы (-1, если миграции ещё не применялись)."""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+    return connection.execute(text("SELECT COALESCE(MAX(version), -1) FROM schema_version")).scalar()
+
+
+def migrate():
+    """
+    Применяет все ещё не применённые миграции; каждая выполняется в своей транзакции.
+    Это единственный путь создания и изменения схемы (его вызывают и Create_db.py, и db.create_schema).
+    """
+    with get_engine().begin() as connection:
+        current_version = get_schema_version(connection)
+    logger.info(f"Текущая версия схемы: {current_version}")
+
+    for version, name, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        logger.info(f"Применение миграции {version}: {name}")
+        with get_engine().begin() as connection:
+            # Блокировка, чтобы две копии ETL не применили миграцию одновременно
+            connection.execute(text("LOCK TABLE schema_version IN EXCLUSIVE MODE"))
+            if get_schema_version(connection) >= version:
+                continue
+            migration(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": datetime.now()}
+            )
+        logger.info(f"Миграция {version} применена")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    migrate()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from common.metrics import ETL_STAGE_SECONDS
+from common.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+# Файл с отпечатками входных данных стадий и статистикой последнего запуска
+PIPELINE_STATE_FILE = os.getenv(
+    'PIPELINE_STATE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline_state.json')
+)
+PIPELINE_WORKERS = 4  # Сколько независимых стадий выполнять одновременно
+# Стадия может вернуть SKIP, если её входные данные не изменились (например, ответ API 304)
+SKIP = object()
+
+
+def fingerprint_of(value):
+    """SHA-256 от JSON-представления значения (порядок ключей не важен)."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def count_rows(value):
+    """Число строк результата стадии: само число (загружено строк), длина списка строк или None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), fingerprint=None, propagate_skip=True, table=None):
+        self.name = name
+        self.func = func  # func(inputs) -> результат; inputs = {имя зависимости: её результат}
+        self.deps = tuple(deps)
+        # fingerprint(inputs) -> значение, отпечаток которого сравнивается с прошлым успешным запуском;
+        # если он не изменился, стадия пропускается
+        self.fingerprint = fingerprint
+        # Пропускать стадию, если пропущена хотя бы одна из её зависимостей
+        self.propagate_skip = propagate_skip
+        # Таблица, строки которой возвращает стадия (список строк или число загруженных строк);
+        # у остальных стадий (запросы к API, миграции) строки не считаются
+        self.table = table
+
+
+class Pipeline:
+    """
+    Конвейер стадий с явными зависимостями, выполняемый в одном процессе.
+    Стадии, чьи зависимости готовы, запускаются параллельно в пуле потоков.
+    Стадия с неизменившимся отпечатком входа пропускается (её результат — None), если не задан force.
+    Стадия, вернувшая SKIP, тоже считается пропущенной; вслед за ней пропускаются зависимые стадии
+    (кроме добавленных с propagate_skip=False).
+    Для каждой стадии фиксируются статус и время, для стадий с таблицей — ещё и число строк.
+    """
+
+    def __init__(self, name, state_file=PIPELINE_STATE_FILE):
+        self.name = name
+        self.state_file = state_file
+        self.stages = {}
+        self.last_stats = {}  # Статистика последнего запуска (доступна и после ошибки)
+
+    def add(self, name, func, deps=(), fingerprint=None, propagate_skip=True, table=None):
+        if name in self.stages:
+            raise ValueError(f"Стадия {name} уже добавлена")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Стадия {name} зависит от неизвестной стадии {dep}")
+        self.stages[name] = Stage(name, func, deps, fingerprint, propagate_skip, table)
+        return self
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать состояние конвейера {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self, state):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def _run_stage(self, stage, inputs, previous_fingerprint, force, deps_skipped):
+        started_at = time.monotonic()
+        fingerprint = None
+        if deps_skipped and stage.propagate_skip:
+            return None, {'status': 'skipped', 'seconds': 0.0, 'rows': None, 'fingerprint': None}
+        if stage.fingerprint is not None:
+            fingerprint = fingerprint_of(stage.fingerprint(inputs))
+            if not force and fingerprint == previous_fingerprint:
+                return None, {'status': 'skipped', 'seconds': time.monotonic() - started_at, 'rows': None,
+                              'fingerprint': fingerprint}
+        with profiler.section(f"pipeline.{self.name}.{stage.name}"):
+            result = stage.func(inputs)
+        if result is SKIP:
+            return None, {'status': 'skipped', 'seconds': time.monotonic() - started_at, 'rows': None,
+                          'fingerprint': None}
+        rows = count_rows(result) if stage.table is not None else None
+        return result, {'status': 'done', 'seconds': time.monotonic() - started_at, 'rows': rows,
+                        'fingerprint': fingerprint}
+
+    def run(self, max_workers=PIPELINE_WORKERS, force=False):
+        """Выполняет все стадии; возвращает {стадия: статистика}. При ошибке стадии зависимые не запускаются."""
+        state = self._load_state()
+        fingerprints = state.get('fingerprints', {})
+        results = {}
+        stats = {}
+        pending = dict(self.stages)
+        running = {}
+        failed = set()
+        started_at = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                # Запускаем стадии, все зависимости которых выполнены
+                for name, stage in list(pending.items()):
+                    if any(dep in failed for dep in stage.deps):
+                        del pending[name]
+                        failed.add(name)
+                        stats[name] = {'status': 'cancelled', 'seconds': 0.0, 'rows': None}
+                        logger.warning(f"Стадия {name} не запущена: не выполнена зависимость")
+                        continue
+                    if all(dep in results for dep in stage.deps):
+                        del pending[name]
+                        inputs = {dep: results[dep] for dep in stage.deps}
+                        deps_skipped = any(stats[dep]['status'] == 'skipped' for dep in stage.deps)
+                        running[executor.submit(self._run_stage, stage, inputs, fingerprints.get(name), force,
+                                                deps_skipped)] = name
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result, stage_stats = future.result()
+                    except Exception as e:
+                        failed.add(name)
+                        stats[name] = {'status': 'failed', 'seconds': None, 'rows': None, 'error': str(e)}
+                        logger.error(f"Стадия {name} завершилась с ошибкой: {e}")
+                        continue
+                    results[name] = result
+                    stats[name] = stage_stats
+                    if stage_stats['fingerprint'] is not None:
+                        fingerprints[name] = stage_stats['fingerprint']
+                    ETL_STAGE_SECONDS.observe(stage_stats['seconds'], pipeline=self.name, stage=name,
+                                              status=stage_stats['status'])
+                    rows = '' if stage_stats['rows'] is None else f", строк {stage_stats['rows']}"
+                    logger.info(f"Стадия {name}: {stage_stats['status']} за {stage_stats['seconds']:.2f} с{rows}")
+
+        elapsed = time.monotonic() - started_at
+        state['fingerprints'] = fingerprints
+        state['last_run'] = {
+            'pipeline': self.name,
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'seconds': elapsed,
+            'stages': {name: {key: value for key, value in stage_stats.items() if key != 'fingerprint'}
+                       for name, stage_stats in stats.items()},
+        }
+        self._save_state(state)
+        self.last_stats = stats
+        logger.info(f"Конвейер {self.name} завершён за {elapsed:.2f} с: "
+                    f"выполнено {sum(1 for s in stats.values() if s['status'] == 'done')}, "
+                    f"пропущено {sum(1 for s in stats.values() if s['status'] == 'skipped')}, "
+                    f"ошибок {len(failed)}")
+        if failed:
+            raise RuntimeError(f"Конвейер {self.name}: не выполнены стадии {', '.join(sorted(failed))}")
+        return stats
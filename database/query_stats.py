@@ -0,0 +1,190 @@
+"""
+Сбор статистики SQL-запросов по отпечаткам и захват медленных запросов с EXPLAIN.
+
+Включается переменной QUERY_STATS=1: движки из database/db.py и database/async_db.py подключают
+install(). Для каждого запроса считается отпечаток (текст с литералами и параметрами, заменёнными
+на ?), по отпечатку копятся число вызовов и время. Для запросов дольше SLOW_QUERY_MS с вероятностью
+EXPLAIN_SAMPLE_RATE на том же подключении выполняется EXPLAIN (для SELECT — EXPLAIN ANALYZE, если
+EXPLAIN_ANALYZE=1; запросы, изменяющие данные, повторно не выполняются). Раз в QUERY_REPORT_INTERVAL
+секунд и при завершении процесса в QUERY_REPORT_FILE пишется отчёт: top-N отпечатков по суммарному
+времени с последним планом и таблицами, которые читаются последовательным сканированием (Seq Scan).
+"""
+import atexit
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+QUERY_STATS = os.getenv("QUERY_STATS", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("EXPLAIN_SAMPLE_RATE", "0.1"))
+EXPLAIN_ANALYZE = os.getenv("EXPLAIN_ANALYZE", "0") == "1"
+QUERY_REPORT_FILE = os.getenv("QUERY_REPORT_FILE", os.path.join(os.path.dirname(__file__), "query_report.txt"))
+QUERY_REPORT_INTERVAL = float(os.getenv("QUERY_REPORT_INTERVAL", "300"))
+QUERY_REPORT_TOP = int(os.getenv("QUERY_REPORT_TOP", "20"))
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+# Параметры драйверов (psycopg2, asyncpg, text()); приведения типов вида ::date не затрагиваются
+_PARAMS = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def fingerprint(statement):
+    """Нормализованный текст запроса: без комментариев, литералы и параметры заменены на ?, списки IN — на (...)."""
+    text = _COMMENTS.sub(" ", statement)
+    text = _STRINGS.sub("?", text)
+    text = _PARAMS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _LISTS.sub("(...)", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+class QueryStats:
+    """Потокобезопасная статистика запросов по отпечаткам с планами медленных запросов."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, sample_rate=EXPLAIN_SAMPLE_RATE, analyze=EXPLAIN_ANALYZE,
+                 report_file=QUERY_REPORT_FILE, report_interval=QUERY_REPORT_INTERVAL, top=QUERY_REPORT_TOP):
+        self.slow_seconds = slow_ms / 1000
+        self.sample_rate = sample_rate
+        self.analyze = analyze
+        self.report_file = report_file
+        self.report_interval = report_interval
+        self.top = top
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._reported_at = time.monotonic()
+
+    def record(self, statement, seconds):
+        """Учитывает выполнение запроса; возвращает True, если для него стоит снять план."""
+        key = fingerprint(statement)
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'slow': 0, 'plan': None,
+                                            'plan_seconds': None}
+            stats['calls'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if slow:
+                stats['slow'] += 1
+            report_due = time.monotonic() - self._reported_at >= self.report_interval
+            if report_due:
+                self._reported_at = time.monotonic()
+        if slow:
+            logger.warning("Медленный запрос %.1f мс: %s", seconds * 1000, key)
+        if report_due:
+            self.write_report()
+        return slow and random.random() < self.sample_rate
+
+    def explain(self, dbapi_connection, statement, parameters, seconds):
+        """
+        Снимает план запроса отдельным курсором на том же подключении (результаты запроса не затрагиваются).
+        EXPLAIN выполняется в точке сохранения, чтобы его ошибка не прервала транзакцию приложения.
+        """
+        analyze = self.analyze and statement.lstrip()[:6].upper() == 'SELECT'
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+        try:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("SAVEPOINT query_stats_explain")
+                try:
+                    cursor.execute(prefix + statement, parameters)
+                    plan = "\n".join(str(row[0]) for row in cursor.fetchall())
+                except Exception:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+                    raise
+                cursor.execute("RELEASE SAVEPOINT query_stats_explain")
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.warning("Не удалось получить план запроса: %s", e)
+            return
+        with self._lock:
+            stats = self._stats.get(fingerprint(statement))
+            if stats is not None:
+                stats['plan'] = plan
+                stats['plan_seconds'] = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._stats.items()}
+
+    def report(self):
+        """Текст отчёта: top-N отпечатков по суммарному времени."""
+        stats = sorted(self.snapshot().items(), key=lambda item: item[1]['total'], reverse=True)[:self.top]
+        lines = [f"Отчёт о запросах на {time.strftime('%Y-%m-%d %H:%M:%S')}: top-{self.top} по суммарному времени, "
+                 f"медленные — от {self.slow_seconds * 1000:.0f} мс", ""]
+        for number, (key, item) in enumerate(stats, 1):
+            lines.append(f"{number}. всего {item['total'] * 1000:.1f} мс, вызовов {item['calls']}, "
+                         f"среднее {item['total'] / item['calls'] * 1000:.2f} мс, максимум {item['max'] * 1000:.1f} мс, "
+                         f"медленных {item['slow']}")
+            lines.append(f"   {key}")
+            if item['plan']:
+                seq_scans = sorted(set(_SEQ_SCAN.findall(item['plan'])))
+                if seq_scans:
+                    lines.append(f"   Seq Scan: {', '.join(seq_scans)}")
+                lines.append(f"   План (запрос {item['plan_seconds'] * 1000:.1f} мс):")
+                lines.extend(f"     {line}" for line in item['plan'].splitlines())
+            lines.append("")
+        return "\n".join(lines)
+
+    def write_report(self):
+        if not self.report_file:
+            return
+        try:
+            tmp_path = f"{self.report_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.report())
+            os.replace(tmp_path, self.report_file)
+        except OSError as e:
+            logger.error(f"Не удалось записать отчёт о запросах {self.report_file}: {e}")
+
+
+_query_stats = None
+
+
+def get_query_stats():
+    """Общая статистика процесса (создаётся при первом обращении, отчёт пишется и при выходе)."""
+    global _query_stats
+    if _query_stats is None:
+        _query_stats = QueryStats()
+        atexit.register(_query_stats.write_report)
+    return _query_stats
+
+
+def install(engine, enabled=QUERY_STATS):
+    """Подключает сбор статистики к движку (для асинхронного — engine.sync_engine), если включён."""
+    if not enabled:
+        return
+    from sqlalchemy import event
+    query_stats = get_query_stats()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_stats_started_at', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_stats_started_at')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        if query_stats.record(statement, seconds) and not executemany:
+            query_stats.explain(conn.connection.dbapi_connection, statement, parameters, seconds)
+
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_stats_started_at'):
+            connection.info['query_stats_started_at'].pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+    logger.info(f"Сбор статистики запросов включён: медленные от {SLOW_QUERY_MS:.0f} мс, отчёт {QUERY_REPORT_FILE}")
@@ -1,22 +1,28 @@
 from database.crud import create_record, read_all, update_record, delete_record
-from database.Create_db import employees
+from database.db import employees
 
-# --- CREATE ---
-create_record(employees, {
-    "id": 999999,
-    "user_id": 100001,
-    "company_id": 1525,
-    "timezone_id": 516,
-    "first_name": "Тест",
-    "last_name": "Пользователь",
-    "email": "test@example.com"
-})
 
-# --- READ ---
-read_all(employees)
+def main():
+    # --- CREATE ---
+    create_record(employees, {
+        "id": 999999,
+        "user_id": 100001,
+        "company_id": 1525,
+        "timezone_id": 516,
+        "first_name": "Тест",
+        "last_name": "Пользователь",
+        "email": "test@example.com"
+    })
 
-# --- UPDATE ---
-update_record(employees, 999999, {"first_name": "Обновлённый"})
+    # --- READ ---
+    read_all(employees)
 
-# --- DELETE ---
-delete_record(employees, 999999)
+    # --- UPDATE ---
+    update_record(employees, 999999, {"first_name": "Обновлённый"})
+
+    # --- DELETE ---
+    delete_record(employees, 999999)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,36 @@
 import csv
-import requests
+import os
+import sys
 from datetime import datetime, timedelta
 
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.moygrafik_api import MoyGrafikAPI as MoyGrafikClient, api_metrics
+
 class MoyGrafikAPI:
     def __init__(self):
-        self.token = 'Bearer NzExZjcxMzA4MzM4MzQ2NmViMWZjZDk3OWJmMjQwNGU0ODBlN2MxM2JlNTdhNjdjZTRlMTk0YWZmOGQyYjdhMg'
-        self.base_url = 'https://api.moygrafik.ru/api/external/v1'
-        self.headers = {'Authorization': self.token}
+        # Общий клиент API: пул соединений, таймауты, повторы при 429/5xx и токен из TokenManager
+        self.client = MoyGrafikClient()
+        self.base_url = self.client.base_url
 
     def get_presence_report(self, company_id, start_date, end_date, positions=None):
-        url = f"{self.base_url}/reports/presence/{company_id}"
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
-        if positions:
-            params['positions'] = positions
-
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
-
-    def save_presence_report_to_csv(self, data, filename):
-        report_data = []
-        placements_data = data.get('placements', {})
+        # Записи placements -> presences по одной; ответ разбирается потоково, а не целиком
+        return self.client.iter_presences(company_id, start_date, end_date, positions)
 
-        for placement_id, placement in placements_data.items():
-            for presence in placement.get('presences', []):
+    def save_presence_report_to_csv(self, presences, filename):
+        # Строки пишутся в файл по мере разбора ответа, без промежуточного списка
+        keys = ['date', 'start_time', 'end_time', 'is_night_shift', 'original_estimate', 'real_estimate',
+                'is_red', 'employee_id', 'first_name', 'last_name', 'email']
+        count = 0
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w', newline='', encoding='utf-8') as file:
+            dict_writer = csv.DictWriter(file, fieldnames=keys)
+            dict_writer.writeheader()
+            for presence in presences:
                 employee = presence['employee']
                 for time_entry in presence.get('time_data', []):
-                    report_entry = {
+                    dict_writer.writerow({
                         'date': time_entry.get('date', ''),
                         'start_time': time_entry.get('start_time', ''),
                         'end_time': time_entry.get('end_time', ''),
@@ -41,33 +42,37 @@ class MoyGrafikAPI:
                         'first_name': employee.get('first_name', ''),
                         'last_name': employee.get('last_name', ''),
                         'email': employee.get('email', '')
-                    }
-                    report_data.append(report_entry)
+                    })
+                    count += 1
 
-        if report_data:
-            keys = report_data[0].keys()
-            with open(filename, 'w', newline='', encoding='utf-8') as file:
-                dict_writer = csv.DictWriter(file, fieldnames=keys)
-                dict_writer.writeheader()
-                dict_writer.writerows(report_data)
+        # Прежний файл заменяется только если в ответе есть данные
+        if count:
+            os.replace(tmp_filename, filename)
         else:
+            os.remove(tmp_filename)
             print(f"Нет данных для сохранения в {filename}")
 
-# Пример использования
-company_id = 1525
-api = MoyGrafikAPI()
 
-# Установить начальную и конечную даты
-current_date = datetime.now()
-start_date = current_date - timedelta(days=10)
-end_date = current_date
+def main():
+    company_id = 1525
+    api = MoyGrafikAPI()
+
+    # Установить начальную и конечную даты
+    current_date = datetime.now()
+    start_date = current_date - timedelta(days=10)
+    end_date = current_date
+
+    # Форматируем даты для API
+    start_date_str = start_date.strftime('%d-%m-%Y')
+    end_date_str = end_date.strftime('%d-%m-%Y')
+
+    print(f"Запрашиваем данные с {start_date_str} по {end_date_str}")
 
-# Форматируем даты для API
-start_date_str = start_date.strftime('%d-%m-%Y')
-end_date_str = end_date.strftime('%d-%m-%Y')
+    # Получение данных отчёта о присутствии и сохранение в CSV
+    presence_report = api.get_presence_report(company_id=company_id, start_date=start_date_str, end_date=end_date_str)
+    api.save_presence_report_to_csv(presence_report, 'presence_report.csv')
+    api_metrics.log_summary(log=print)
 
-print(f"Запрашиваем данные с {start_date_str} по {end_date_str}")
 
-# Получение данных отчёта о присутствии и сохранение в CSV
-presence_report = api.get_presence_report(company_id=company_id, start_date=start_date_str, end_date=end_date_str)
-api.save_presence_report_to_csv(presence_report, 'presence_report.csv')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,35 @@
-import subprocess
+import argparse
+import logging
 
-def run_command(cmd, description):
-    print(f"\n🚀 {description}...")
-    result = subprocess.run(cmd, shell=True)
-    if result.returncode != 0:
-        print(f"❌ Ошибка при выполнении: {description}")
-        exit(result.returncode)
-    print(f"✅ Завершено: {description}")
+from database.migrations import migrate
+from database.load_from_api import run as load_from_api
 
-# 1. Обновление CSV из API
-run_command("python3 database/Update_CSV.py", "Обновление CSV из API")
 
-# 2. Создание базы данных и таблиц
-run_command("python3 database/Create_db.py", "Создание структуры БД")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Создание БД, миграции и загрузка данных из API")
+    parser.add_argument('--force', action='store_true',
+                        help="загрузить все таблицы, даже если данные API не изменились с прошлого запуска")
+    return parser.parse_args()
 
-# 3. Преобразование данных (нормализация)
-run_command("python3 -m database.Normal_wid", "Нормализация данных")
 
-# 4. Запись в БД из нормализованных CSV
-run_command("python3 -m database.UPDATE_DATABASE", "Запись данных в БД")
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    # Всё выполняется в одном процессе: миграции (включая создание таблиц) — первая стадия конвейера,
+    # загрузка каждой таблицы начинается после неё, независимые таблицы грузятся параллельно
+    print("\n🚀 Создание структуры БД, миграции и загрузка данных из API...")
+    try:
+        load_from_api(force=args.force, before_load=[
+            ('migrate', lambda inputs: migrate(), ()),
+        ])
+    except RuntimeError as e:
+        print(f"❌ Ошибка при выполнении: {e}")
+        exit(1)
+    print("✅ Завершено: загрузка данных из API в БД")
+
+
+if __name__ == '__main__':
+    main()
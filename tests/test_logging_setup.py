@@ -0,0 +1,28 @@
+import logging
+
+from bot.logging_setup import RepeatSampler
+
+
+def make_record(level=logging.INFO, sampled=True, msg="Пользователь %s не подписан"):
+    record = logging.LogRecord('bot.scheduler', level, __file__, 1, msg, (1,), None)
+    if sampled:
+        record.sampled = True
+    return record
+
+
+def test_sampled_info_records_are_thinned_with_real_skip_count():
+    sampler = RepeatSampler(3)
+    records = [make_record() for _ in range(7)]
+    passed = [record for record in records if sampler.filter(record)]
+
+    assert passed == [records[0], records[3], records[6]]
+    assert passed[0].msg == "Пользователь %s не подписан"
+    assert passed[1].msg.endswith("[пропущено похожих записей: 2]")
+    assert passed[2].msg.endswith("[пропущено похожих записей: 2]")
+
+
+def test_warnings_errors_and_unsampled_records_always_pass():
+    sampler = RepeatSampler(100)
+    for level in (logging.WARNING, logging.ERROR):
+        assert all(sampler.filter(make_record(level)) for _ in range(10))
+    assert all(sampler.filter(make_record(sampled=False)) for _ in range(10))
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from bot import notification_index as index_module
+from bot.notification_index import (build_index, get_due_notifications, notification_index, time_to_minute,
+                                    update_user_index)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows, started, release):
+        self.rows = rows
+        self.started = started
+        self.release = release
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query):
+        self.started.set()
+        await self.release.wait()
+        return FakeResult(self.rows)
+
+
+class FakeEngine:
+    def __init__(self, rows):
+        self.rows = rows
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def connect(self):
+        return FakeConnection(self.rows, self.started, self.release)
+
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    notification_index.update({"built_at": None, "arrival": {}, "departure": {}, "users": {}})
+    yield
+    notification_index.update({"built_at": None, "arrival": {}, "departure": {}, "users": {}})
+
+
+def test_update_user_index_moves_user_between_buckets():
+    update_user_index(1, arrival_notification_times=['09:00', '09:30'], departure_notification_times=['18:00'])
+    update_user_index(1, arrival_notification_times=['10:00'])
+
+    assert notification_index["arrival"] == {time_to_minute('10:00'): {1}}
+    assert notification_index["departure"] == {time_to_minute('18:00'): {1}}
+    assert get_due_notifications(time_to_minute('10:01')) == {1: {"arrival": ['10:00'], "departure": []}}
+
+    update_user_index(1, arrival_notification_times=[], departure_notification_times=[])
+    assert notification_index == {"built_at": None, "arrival": {}, "departure": {}, "users": {}}
+
+
+def test_invalid_times_are_skipped():
+    update_user_index(1, arrival_notification_times=['25:00', None, '08:15'])
+    assert notification_index["users"][1]["arrival"] == {time_to_minute('08:15'): '08:15'}
+
+
+def test_rebuild_keeps_changes_made_while_reading_settings(monkeypatch):
+    async def scenario():
+        # Снимок таблицы прочитан до того, как пользователь 2 сменил время оповещения
+        engine = FakeEngine([
+            {'telegram_id': 1, 'arrival_notification_times': ['09:00'], 'departure_notification_times': '[]'},
+            {'telegram_id': 2, 'arrival_notification_times': ['08:00'], 'departure_notification_times': []},
+        ])
+        monkeypatch.setattr(index_module, 'get_async_engine', lambda: engine)
+        rebuild = asyncio.create_task(build_index())
+        await engine.started.wait()
+        update_user_index(2, arrival_notification_times=['07:45'])
+        engine.release.set()
+        await rebuild
+
+    asyncio.run(scenario())
+    assert notification_index["users"][2]["arrival"] == {time_to_minute('07:45'): '07:45'}
+    assert notification_index["arrival"] == {time_to_minute('09:00'): {1}, time_to_minute('07:45'): {2}}
+    assert notification_index["built_at"] is not None
+    assert index_module._rebuild_journals == []
@@ -0,0 +1,86 @@
+import pytest
+
+from database.pipeline import SKIP, Pipeline, count_rows
+
+
+def make_pipeline(tmp_path):
+    return Pipeline('test', state_file=str(tmp_path / 'pipeline_state.json'))
+
+
+def test_count_rows():
+    assert count_rows([{'id': 1}, {'id': 2}]) == 2
+    assert count_rows(5) == 5
+    assert count_rows({'employees': {}}) is None
+    assert count_rows(True) is None
+    assert count_rows(None) is None
+
+
+def test_stages_run_after_dependencies_and_report_rows_by_table(tmp_path):
+    order = []
+    pipeline = make_pipeline(tmp_path)
+    pipeline.add('fetch', lambda inputs: order.append('fetch') or {'items': [1, 2, 3]})
+    pipeline.add('normalize', lambda inputs: order.append('normalize') or list(inputs['fetch']['items']),
+                 deps=['fetch'], table='items')
+    pipeline.add('load', lambda inputs: order.append('load') or len(inputs['normalize']),
+                 deps=['normalize'], table='items')
+
+    stats = pipeline.run()
+
+    assert order == ['fetch', 'normalize', 'load']
+    assert {name: stage['status'] for name, stage in stats.items()} == {
+        'fetch': 'done', 'normalize': 'done', 'load': 'done'}
+    # Строки считаются только у стадий с таблицей: ответ API (словарь) не считается одной строкой
+    assert stats['fetch']['rows'] is None
+    assert stats['normalize']['rows'] == 3
+    assert stats['load']['rows'] == 3
+
+
+def test_unchanged_fingerprint_skips_stage_until_forced(tmp_path):
+    loads = []
+
+    def build():
+        pipeline = make_pipeline(tmp_path)
+        pipeline.add('normalize', lambda inputs: [1, 2])
+        pipeline.add('load', lambda inputs: loads.append(inputs['normalize']) or 2, deps=['normalize'],
+                     fingerprint=lambda inputs: inputs['normalize'])
+        return pipeline
+
+    assert build().run()['load']['status'] == 'done'
+    assert build().run()['load']['status'] == 'skipped'
+    assert build().run(force=True)['load']['status'] == 'done'
+    assert len(loads) == 2
+
+
+def test_skip_propagates_except_to_stages_that_opt_out(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    pipeline.add('fetch', lambda inputs: SKIP)
+    pipeline.add('load', lambda inputs: 1, deps=['fetch'])
+    pipeline.add('after_load', lambda inputs: inputs['load'], deps=['load'], propagate_skip=False)
+
+    stats = pipeline.run()
+
+    assert stats['fetch']['status'] == 'skipped'
+    assert stats['load']['status'] == 'skipped'
+    assert stats['after_load']['status'] == 'done'
+
+
+def test_failed_stage_cancels_dependents(tmp_path):
+    def fail(inputs):
+        raise ValueError('boom')
+
+    pipeline = make_pipeline(tmp_path)
+    pipeline.add('fetch', fail)
+    pipeline.add('load', lambda inputs: 1, deps=['fetch'])
+    pipeline.add('independent', lambda inputs: 1)
+
+    with pytest.raises(RuntimeError, match='fetch, load'):
+        pipeline.run()
+
+    assert pipeline.last_stats['fetch']['status'] == 'failed'
+    assert pipeline.last_stats['load']['status'] == 'cancelled'
+    assert pipeline.last_stats['independent']['status'] == 'done'
+
+
+def test_unknown_dependency_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_pipeline(tmp_path).add('load', lambda inputs: 1, deps=['missing'])
@@ -0,0 +1,59 @@
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter
+
+from bot.sender import MessageSender
+
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = failures or {}  # chat_id -> список исключений для первых попыток
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def make_sender(**kwargs):
+    return MessageSender(rate=1000, per_chat_interval=0.01, max_concurrency=4, **kwargs)
+
+
+def test_batch_keeps_order_per_chat_and_frees_chat_state():
+    sender = make_sender()
+    bot = FakeBot()
+    messages = [{'chat_id': chat_id, 'text': f'{chat_id}-{n}'} for n in range(3) for chat_id in (1, 2, 3)]
+
+    results = asyncio.run(sender.send_batch(bot, messages, batch_name='test'))
+
+    assert results == [(True, None)] * len(messages)
+    for chat_id in (1, 2, 3):
+        assert [text for sent_chat, text in bot.sent if sent_chat == chat_id] == [f'{chat_id}-{n}' for n in range(3)]
+    assert sender._chat_locks == {}
+
+
+def test_idle_chats_are_forgotten_after_interval():
+    sender = make_sender()
+
+    async def scenario():
+        await sender.send_batch(FakeBot(), [{'chat_id': 1, 'text': 'a'}])
+        await asyncio.sleep(0.02)
+        await sender.send_batch(FakeBot(), [{'chat_id': 2, 'text': 'b'}])
+
+    asyncio.run(scenario())
+    assert list(sender._chat_last_sent) == [2]
+    assert sender._chat_locks == {}
+
+
+def test_retry_after_is_retried_and_forbidden_is_not():
+    sender = make_sender()
+    bot = FakeBot(failures={1: [RetryAfter(0)], 2: [Forbidden('blocked'), Forbidden('blocked')]})
+
+    results = asyncio.run(sender.send_batch(bot, [{'chat_id': 1, 'text': 'a'}, {'chat_id': 2, 'text': 'b'}]))
+
+    assert results[0] == (True, None)
+    assert results[1][0] is False and isinstance(results[1][1], Forbidden)
+    assert bot.sent == [(1, 'a')]
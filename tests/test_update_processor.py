@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from bot.update_processor import PerUserUpdateProcessor, ordering_key
+
+
+def make_update(update_id, user_id):
+    user = User(id=user_id, first_name='Test', is_bot=False)
+    chat = Chat(id=user_id, type=Chat.PRIVATE)
+    message = Message(message_id=update_id, date=datetime.now(timezone.utc), chat=chat, from_user=user, text='/status')
+    return Update(update_id=update_id, message=message)
+
+
+def test_ordering_key():
+    assert ordering_key(make_update(1, 42)) == ('user', 42)
+    assert ordering_key(object()) is None
+
+
+def test_updates_of_one_user_run_in_order():
+    async def scenario():
+        processor = PerUserUpdateProcessor(8)
+        handled = []
+
+        async def handle(update_id, delay):
+            await asyncio.sleep(delay)
+            handled.append(update_id)
+
+        # Первое обновление обрабатывается дольше остальных, но порядок сохраняется
+        tasks = [asyncio.create_task(processor.process_update(make_update(i, 1), handle(i, 0.05 if i == 0 else 0)))
+                 for i in range(5)]
+        await asyncio.gather(*tasks)
+        assert handled == [0, 1, 2, 3, 4]
+        assert processor._queues == {}
+
+    asyncio.run(scenario())
+
+
+def test_backlog_of_one_user_does_not_block_another():
+    async def scenario():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        handled = []
+
+        async def slow(update_id):
+            await release.wait()
+            handled.append(update_id)
+
+        async def fast(update_id):
+            handled.append(update_id)
+
+        # Очередь пользователя 1 больше лимита одновременных обновлений
+        busy = [asyncio.create_task(processor.process_update(make_update(i, 1), slow(i))) for i in range(5)]
+        await asyncio.sleep(0)
+        other = asyncio.create_task(processor.process_update(make_update(100, 2), fast(100)))
+        await asyncio.wait_for(other, timeout=1)
+        assert handled == [100]
+
+        release.set()
+        await asyncio.gather(*busy)
+        assert handled == [100, 0, 1, 2, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_limit_is_kept():
+    async def scenario():
+        processor = PerUserUpdateProcessor(2)
+        running = 0
+        peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(make_update(i, i), handle()) for i in range(6)))
+        assert peak == 2
+        assert processor.max_concurrent_updates == 2
+
+    asyncio.run(scenario())